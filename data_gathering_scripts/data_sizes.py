@@ -1,12 +1,15 @@
 """
 Look at the size of
 
+Run with installation_and_upgrade on PYTHONPATH, as the directory sizes are remembered
+between runs using ibex_install_utils.
 """
 
 import getpass
 import os
 import subprocess
 
+from ibex_install_utils.dir_size_index import DIR_SIZE_INDEX_PATH, DirSizeIndex
 from six.moves import input
 
 areas = {
@@ -96,13 +99,19 @@ def size_of_files_in_dir(path):
     return size
 
 
-def size_of_dir_tree(start_path="."):
-    total_size = 0
-    for dirpath, dirnames, filenames in os.walk(start_path):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            total_size += os.path.getsize(fp)
-    return total_size
+def size_index_for_instrument(instrument_host):
+    """
+    Returns: An index of the sizes of the instrument's directories, remembered between runs so
+    that only the directories which have changed are listed over the share again.
+    """
+    # Every instrument is on the same drive letter, so each needs its own index
+    return DirSizeIndex(
+        os.path.join(os.path.dirname(DIR_SIZE_INDEX_PATH), f"data_sizes_{instrument_host}.json.gz")
+    )
+
+
+def size_of_dir_tree(size_index, start_path="."):
+    return size_index.tree_stats(start_path).size
 
 
 def get_for_instrument(instrument_host, username, password):
@@ -110,6 +119,7 @@ def get_for_instrument(instrument_host, username, password):
         templates = {"HOST_NAME": instrument_host, "INST_PATH": f"{repo.DRIVE_LETTER}:\\"}
 
         sizes = {}
+        size_index = size_index_for_instrument(instrument_host)
 
         for name, templated_path in files_in_dir.items():
             path = templated_path.format(**templates)
@@ -117,7 +127,7 @@ def get_for_instrument(instrument_host, username, password):
 
         for name, templated_path in areas.items():
             path = templated_path.format(**templates)
-            sizes[name] = size_of_dir_tree(path)
+            sizes[name] = size_of_dir_tree(size_index, path)
 
         try:
             sizes["logs-other"] -= sizes["logs-conserver"] + sizes["logs-ioc"]
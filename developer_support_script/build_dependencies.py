@@ -5,6 +5,10 @@ Utility to help create build dependencies
 import argparse
 import os
 import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Number of directories to list at once
+LISTING_WORKERS = 8
 
 # lines which indicate what should be replaced in the release file
 FIRST_OLD_RELEASE_LINE = "include $(TOP)/../../../configure/MASTER_RELEASE"
@@ -310,11 +314,32 @@ def find(pattern, path):
 
     """
     result = []
-    for root, dirs, files in os.walk(path):
-        for name in files:
-            if re.match(pattern, name) is not None:
-                result.append(os.path.join(root, name))
-    return result
+    with ThreadPoolExecutor(max_workers=LISTING_WORKERS) as pool:
+        pending = {pool.submit(_files_and_subdirectories, path)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirectories = future.result()
+                result.extend(f for f in files if re.match(pattern, os.path.basename(f)))
+                pending.update(
+                    pool.submit(_files_and_subdirectories, subdirectory)
+                    for subdirectory in subdirectories
+                )
+    # Directories are listed several at once, so finish in no particular order; sort for a
+    # repeatable order
+    return sorted(result)
+
+
+def _files_and_subdirectories(path):
+    # Like os.walk, include links to files but don't follow links to directories
+    files, subdirectories = [], []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file():
+                files.append(entry.path)
+    return files, subdirectories
 
 
 def macro_dependencies(ioc_dir):
@@ -6,9 +6,13 @@ Look at the size of
 import getpass
 import os
 import subprocess
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from six.moves import input
 
+# Over a share listing directories is mostly waiting, so list several at once
+LISTING_WORKERS = 8
+
 areas = {
     "config": r"{INST_PATH}\Settings\config\{HOST_NAME}\configurations",
     "Autosave": r"{INST_PATH}\var\autosave",
@@ -96,12 +100,32 @@ def size_of_files_in_dir(path):
     return size
 
 
+def _size_of_files_and_subdirectories(path):
+    # Like os.walk, count links to files at the size of their targets but don't follow links
+    # to directories
+    size, subdirectories = 0, []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file():
+                size += entry.stat().st_size
+    return size, subdirectories
+
+
 def size_of_dir_tree(start_path="."):
     total_size = 0
-    for dirpath, dirnames, filenames in os.walk(start_path):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            total_size += os.path.getsize(fp)
+    with ThreadPoolExecutor(max_workers=LISTING_WORKERS) as pool:
+        pending = {pool.submit(_size_of_files_and_subdirectories, start_path)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                size, subdirectories = future.result()
+                total_size += size
+                pending.update(
+                    pool.submit(_size_of_files_and_subdirectories, subdirectory)
+                    for subdirectory in subdirectories
+                )
     return total_size
 
 
@@ -9,10 +9,12 @@ import sys
 
 import ibex_install_utils.current_args
 import semantic_version  # pyright: ignore
+from ibex_install_utils import process_trace, task_profile, task_state
 from ibex_install_utils.exceptions import ErrorInTask, UserStop
 from ibex_install_utils.file_utils import FileUtils
 from ibex_install_utils.install_tasks import UPGRADE_TYPES, UpgradeInstrument
 from ibex_install_utils.logger import Logger
+from ibex_install_utils.tasks.backup_tasks import add_backup_throttle_arguments
 from ibex_install_utils.user_prompt import UserPrompt
 
 
@@ -127,6 +129,53 @@ if __name__ == "__main__":
         choices=["win"],
         help="Server winbuild.",
     )
+    parser.add_argument(
+        "--deploy_task_workers",
+        type=int,
+        default=ibex_install_utils.current_args.DEPLOY_TASK_WORKERS,
+        help="Number of independent deploy steps to run at once; 1, the default, runs them in"
+        " turn. The output of steps run at the same time is interleaved, but their prompts are"
+        " shown one at a time.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Carry on a deploy which stopped part way through, skipping the tasks it finished,"
+        " if it was of the same thing and their inputs have not changed.",
+    )
+    parser.add_argument(
+        "--backup_workers",
+        type=int,
+        default=ibex_install_utils.current_args.BACKUP_WORKERS,
+        help="Number of threads used to compress backups (default: number of CPUs).",
+    )
+    parser.add_argument(
+        "--backup_format",
+        default=ibex_install_utils.current_args.BACKUP_FORMAT,
+        choices=["zip", "tar.zst", "store", "snapshot"],
+        help="Format of backups: a zip file per directory, a zstandard compressed tar file\n"
+        "per directory, a manifest per directory referring to files in an incremental\n"
+        "store shared between backups, or a snapshot per directory of reflinks to its\n"
+        "files (copies where reflinks aren't supported).",
+    )
+    parser.add_argument(
+        "--backup_verify",
+        default=ibex_install_utils.current_args.BACKUP_VERIFY,
+        choices=["quick", "sample", "full"],
+        help="How thoroughly to verify zip backups:\n"
+        "quick: check the zip directories against the files backed up\n"
+        "sample: also decompress a fraction of the files (see --backup_verify_fraction)\n"
+        "full: also decompress every file\n"
+        "tar.zst backups are decompressed in full in both sample and full modes,\n"
+        "snapshots have the sizes of their files checked.",
+    )
+    parser.add_argument(
+        "--backup_verify_fraction",
+        type=float,
+        default=ibex_install_utils.current_args.BACKUP_VERIFY_FRACTION,
+        help="Fraction of the files in each zip backup to decompress in sample mode.",
+    )
+    add_backup_throttle_arguments(parser)
 
     deployment_types = [
         f"{choice}: {deployment_types}" for choice, (_, deployment_types) in UPGRADE_TYPES.items()
@@ -140,9 +189,18 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     ibex_install_utils.current_args.SERVER_ARCH = args.server_arch
+    ibex_install_utils.current_args.DEPLOY_TASK_WORKERS = args.deploy_task_workers
+    ibex_install_utils.current_args.BACKUP_WORKERS = args.backup_workers
+    ibex_install_utils.current_args.BACKUP_FORMAT = args.backup_format
+    ibex_install_utils.current_args.BACKUP_VERIFY = args.backup_verify
+    ibex_install_utils.current_args.BACKUP_VERIFY_FRACTION = args.backup_verify_fraction
+    ibex_install_utils.current_args.BACKUP_MAX_MB_PER_SECOND = args.backup_max_mb_per_second
+    ibex_install_utils.current_args.BACKUP_ADAPTIVE_THROTTLE = args.backup_adaptive_throttle
 
     if not args.no_log_to_var:
         Logger.set_up()
+        process_trace.set_up()
+        task_profile.set_up()
 
     current_client_version = None
     server_suffix = "32" if args.server_arch == "x86" else ""
@@ -242,6 +300,16 @@ if __name__ == "__main__":
         )
         sys.exit(2)
 
+    task_state.set_up(
+        {
+            "deployment_type": args.deployment_type,
+            "server_arch": args.server_arch,
+            "directories": DIRECTORIES,
+            "version": current_client_version,
+        },
+        args.resume,
+    )
+
     try:
         prompt = UserPrompt(args.quiet, args.confirm_step)
         upgrade_instrument = UpgradeInstrument(
@@ -253,6 +321,7 @@ if __name__ == "__main__":
         )
         upgrade_function = UPGRADE_TYPES[args.deployment_type][0]
         upgrade_function(upgrade_instrument)
+        task_state.clear()
 
     except UserStop:
         print("User stopped upgrade")
@@ -260,6 +329,12 @@ if __name__ == "__main__":
     except ErrorInTask as error_in_run_ex:
         print(f"Error in upgrade: {error_in_run_ex}")
         sys.exit(1)
+    finally:
+        process_trace.print_summary()
+        task_profile.print_summary()
+        task_trace_path = task_profile.write_trace()
+        if task_trace_path is not None:
+            print(f"Task trace is {task_trace_path}")
 
     print("Finished upgrade")
     sys.exit(0)
@@ -0,0 +1,382 @@
+"""
+Benchmark of the backup pipeline against a synthetic tree shaped like an instrument PC.
+
+The tree has lots of small autosave files, a few large files, very deep paths, and the
+directories and files which the backup ignores (.git, jettywork, crash dumps). Each backup
+format is run through `BackupTasks._backup_dir` and checked, and the sizing pass is timed on
+its own. MB/s, files/s and the peak resident memory of each stage are written to JSON.
+
+Given a baseline, a results file from an earlier run with the same settings, the run fails if
+any stage is slower than in the baseline by more than the tolerance. To update the baseline,
+replace it with the results of a run on the machine the comparison is made on, e.g. the
+`backup-benchmark` artifact from CI.
+
+Runs on Linux as well as Windows: the win32 only modules are stubbed out if they can't be
+imported, so that regressions can be caught in CI.
+
+Example, a quick run:
+
+    python benchmarks/backup_benchmark.py --scale 0.01 --large_file_mb 64 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+from contextlib import redirect_stdout
+from functools import partial
+from typing import Callable
+from unittest.mock import Mock, patch
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _stub_windows_modules() -> None:
+    """Stub the win32 only modules the backup tasks import, where they aren't available"""
+    try:
+        import win32com.client
+    except ImportError:
+        win32com = types.ModuleType("win32com")
+        win32com.client = types.ModuleType("win32com.client")
+        win32com.client.Dispatch = None
+        sys.modules["win32com"] = win32com
+        sys.modules["win32com.client"] = win32com.client
+
+
+_stub_windows_modules()
+
+import ibex_install_utils.current_args  # noqa: E402
+from ibex_install_utils import file_utils  # noqa: E402
+from ibex_install_utils.dir_size_index import DirSizeIndex  # noqa: E402
+from ibex_install_utils.file_utils import FileUtils  # noqa: E402
+from ibex_install_utils.snapshot import SNAPSHOT_MANIFEST_EXTENSION  # noqa: E402
+from ibex_install_utils.tasks import backup_tasks  # noqa: E402
+from ibex_install_utils.user_prompt import UserPrompt  # noqa: E402
+
+FORMATS = ("zip", "tar.zst", "store", "snapshot")
+
+_TREE_VERSION = 1
+
+BASELINE_TOLERANCE = 1.0
+"""
+Default fraction a stage may be slower than in the baseline before the run fails. Writing
+lots of small files can take twice as long from one run to the next on a shared machine.
+"""
+
+_BASELINE_SLACK_SECONDS = 0.5
+"""Seconds any stage may be slower by, so that the quickest stages don't fail on noise"""
+
+_COMPARED_SETTINGS = ("scale", "large_file_mb", "formats", "workers")
+
+
+def _text(rng: random.Random, size: int) -> bytes:
+    words = [b"record", b"PV", b"IOC", b"alarm", b"MINOR", b"0.0", b"1.5e-3", b"\n", b"DISABLE"]
+    return b" ".join(rng.choice(words) for _ in range(size // 5))[:size]
+
+
+def generate_tree(root: str, scale: float, large_file_mb: int) -> None:
+    """
+    Generate the synthetic tree, unless it has already been generated with the same settings.
+
+    Args:
+        root: directory to generate the tree in
+        scale: 1 for a full sized tree of 200,000 autosave files, smaller for quicker runs
+        large_file_mb: size of each of the large files in MB
+    """
+    settings = {"version": _TREE_VERSION, "scale": scale, "large_file_mb": large_file_mb}
+    marker = os.path.join(root, "tree.json")
+    if os.path.exists(marker):
+        with open(marker) as f:
+            if json.load(f) == settings:
+                return
+    shutil.rmtree(root, ignore_errors=True)
+    rng = random.Random(1234)
+
+    # Autosave: lots of small files, a few hundred per IOC
+    autosave = os.path.join(root, "Autosave")
+    number_of_files = max(10, int(200_000 * scale))
+    for i in range(number_of_files):
+        directory = os.path.join(autosave, f"IOC_{i // 400:03d}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"settings_{i % 400:03d}.sav"), "wb") as f:
+            f.write(_text(rng, rng.randint(100, 2000)))
+
+    # EPICS: source and built files down very deep paths, some already compressed files,
+    # a few large files and what the backup ignores
+    epics = os.path.join(root, "EPICS")
+    for i in range(max(5, int(5_000 * scale))):
+        depth = rng.randint(5, 30)
+        directory = os.path.join(
+            epics, "support", *(f"module_{i % 50}_level_{level}" for level in range(depth))
+        )
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file_{i}.db"), "wb") as f:
+            f.write(_text(rng, rng.randint(1000, 50_000)))
+        if i % 10 == 0:
+            with open(os.path.join(directory, f"lib_{i}.jar"), "wb") as f:
+                f.write(rng.randbytes(rng.randint(10_000, 500_000)))
+    for ignored in (".git", "jettywork"):
+        directory = os.path.join(epics, ignored)
+        os.makedirs(directory, exist_ok=True)
+        for i in range(max(5, int(2_000 * scale))):
+            with open(os.path.join(directory, f"ignored_{i}"), "wb") as f:
+                f.write(b"ignored" * 100)
+    with open(os.path.join(epics, "VERSION.txt"), "w") as f:
+        f.write("0.0.0")
+    with open(os.path.join(epics, "crash.dmp"), "wb") as f:
+        f.write(bytes(1024**2))
+    large = os.path.join(epics, "large")
+    os.makedirs(large, exist_ok=True)
+    for i, content in enumerate(("text", "random", "text")):
+        with open(os.path.join(large, f"large_{i}.bin"), "wb") as f:
+            for _ in range(large_file_mb):
+                f.write(_text(rng, 1024**2) if content == "text" else rng.randbytes(1024**2))
+
+    with open(marker, "w") as f:
+        json.dump(settings, f)
+
+
+class _PeakMemory:
+    """Samples the resident memory of this process in the background, keeping the peak"""
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self._process = psutil.Process()
+        self._interval = interval
+        self._stop = threading.Event()
+        self.peak = 0
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._process.memory_info().rss)
+            self._stop.wait(self._interval)
+
+    def __enter__(self) -> "_PeakMemory":
+        self.peak = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def _measure(name: str, bytes_: int, files: int, func: Callable[[], object]) -> dict:
+    with _PeakMemory() as memory:
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+    result = {
+        "stage": name,
+        "seconds": round(seconds, 3),
+        "mb_per_second": round(bytes_ / 1024**2 / seconds, 1),
+        "files_per_second": round(files / seconds, 1),
+        "peak_rss_mb": round(memory.peak / 1024**2, 1),
+    }
+    print(json.dumps(result), file=sys.__stdout__)
+    return result
+
+
+def _size_of_tree(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(directory, filename))
+        for directory, _, filenames in os.walk(path)
+        for filename in filenames
+    )
+
+
+def run(tree: str, backup_dir: str, formats: list[str], workers: int | None) -> list[dict]:
+    """
+    Run the benchmarks.
+
+    Args:
+        tree: directory holding the synthetic tree
+        backup_dir: directory to write backups to, emptied before each format
+        formats: backup formats to benchmark
+        workers: number of backup threads, None for the default
+    Returns:
+        The results of each stage
+    """
+    results = []
+    ignores = {
+        "EPICS": backup_tasks.IGNORE_PATTERNS[backup_tasks.EPICS_PATH],
+        "Autosave": backup_tasks.IGNORE_PATTERNS.get(backup_tasks.AUTOSAVE),
+    }
+
+    sizes = {}
+    for name, ignore in ignores.items():
+        src = os.path.join(tree, name)
+        sizes[name] = FileUtils.get_size_and_number_of_files(src, ignore)
+        results.append(
+            _measure(
+                f"sizing {name}",
+                *sizes[name],
+                partial(FileUtils.get_size_and_number_of_files, src, ignore),
+            )
+        )
+
+    with (
+        patch("ibex_install_utils.tasks.CaWrapper", Mock()),
+        patch.object(backup_tasks, "BACKUP_DIR", backup_dir),
+        patch.object(backup_tasks, "BACKUP_STORE_DIR", os.path.join(backup_dir, "backup_store")),
+        patch.object(backup_tasks.BaseTasks, "_get_backup_dir", staticmethod(lambda: backup_dir)),
+        # Keep the synthetic tree out of the machine's directory size index
+        patch.object(
+            file_utils,
+            "_dir_size_index",
+            DirSizeIndex(os.path.join(tree, "dir_size_index.json.gz")),
+        ),
+        patch.object(ibex_install_utils.current_args, "BACKUP_WORKERS", workers),
+    ):
+        tasks = backup_tasks.BackupTasks(UserPrompt(True, False), "", "", "", "")
+        for backup_format in formats:
+            shutil.rmtree(backup_dir, ignore_errors=True)
+            os.makedirs(backup_dir)
+            extension = backup_tasks.BACKUP_FORMAT_EXTENSIONS[backup_format]
+            for name, ignore in ignores.items():
+                src = os.path.join(tree, name)
+                dst = os.path.join(backup_dir, name + extension)
+                if backup_format == "zip":
+                    check = partial(tasks._verify_zip_backup, dst, fraction=1.0)
+                elif backup_format == "tar.zst":
+                    check = partial(tasks._verify_tar_backup, dst)
+                elif backup_format == "snapshot":
+                    check = partial(
+                        tasks._verify_snapshot_backup, dst + SNAPSHOT_MANIFEST_EXTENSION
+                    )
+                else:
+                    check = partial(tasks._store_backup_ok, dst)
+
+                size_before = _size_of_tree(backup_dir)
+                with (
+                    patch.object(ibex_install_utils.current_args, "BACKUP_FORMAT", backup_format),
+                    open(os.devnull, "w") as devnull,
+                    redirect_stdout(devnull),
+                ):
+                    backup = _measure(
+                        f"backup {name} {backup_format}",
+                        *sizes[name],
+                        partial(tasks._backup_dir, src, ignore=ignore),
+                    )
+                    backup["backup_mb"] = round(
+                        (_size_of_tree(backup_dir) - size_before) / 1024**2, 1
+                    )
+                    results.append(backup)
+                    results.append(_measure(f"check {name} {backup_format}", *sizes[name], check))
+    return results
+
+
+def compare_with_baseline(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compare the results of a run with a baseline.
+
+    Args:
+        results: the results of each stage
+        baseline: the contents of the results file of an earlier run with the same settings
+        tolerance: fraction a stage may be slower than in the baseline, e.g. 1.0 for twice as long
+    Returns:
+        The stages which are slower than the baseline allows, empty if there are none
+    """
+    baseline_seconds = {result["stage"]: result["seconds"] for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        expected = baseline_seconds.get(result["stage"])
+        if expected is None:
+            print(f"{result['stage']} is not in the baseline, not comparing it")
+        elif result["seconds"] > max(
+            expected * (1 + tolerance), expected + _BASELINE_SLACK_SECONDS
+        ):
+            regressions.append(
+                f"{result['stage']} took {result['seconds']}s, the baseline is {expected}s"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the backup pipeline")
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="Size of the synthetic tree, 1 for 200,000 autosave files (default: 1)",
+    )
+    parser.add_argument(
+        "--large_file_mb",
+        type=int,
+        default=2048,
+        help="Size of each of the three large files in MB (default: 2048)",
+    )
+    parser.add_argument(
+        "--tree",
+        default=os.path.join(tempfile.gettempdir(), "ibex_backup_benchmark_tree"),
+        help="Where to generate the synthetic tree, it is reused by later runs",
+    )
+    parser.add_argument(
+        "--formats", nargs="+", choices=FORMATS, default=list(FORMATS), help="Formats to run"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Number of backup threads")
+    parser.add_argument("--output", default="backup_benchmark.json", help="JSON results file")
+    parser.add_argument(
+        "--baseline",
+        default=None,
+        help="Results file of an earlier run to compare with, failing if any stage is slower",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=BASELINE_TOLERANCE,
+        help=f"Fraction a stage may be slower than in the baseline (default: {BASELINE_TOLERANCE})",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for setting in _COMPARED_SETTINGS:
+            if baseline["settings"][setting] != getattr(args, setting):
+                sys.exit(
+                    f"The baseline was run with {setting} {baseline['settings'][setting]}, "
+                    f"not {getattr(args, setting)}, so can't be compared with"
+                )
+
+    print(f"Generating tree in {args.tree} ...")
+    generate_tree(args.tree, args.scale, args.large_file_mb)
+    backup_dir = tempfile.mkdtemp(prefix="ibex_backup_benchmark_")
+    try:
+        results = run(args.tree, backup_dir, args.formats, args.workers)
+    finally:
+        shutil.rmtree(backup_dir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "settings": vars(args),
+                "platform": sys.platform,
+                "cpus": os.cpu_count(),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            sys.exit(f"{len(regressions)} stages are slower than the baseline {args.baseline}")
+        print(f"No stage is more than {args.tolerance:.0%} slower than the baseline")
+
+
+if __name__ == "__main__":
+    main()
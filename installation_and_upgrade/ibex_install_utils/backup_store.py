@@ -0,0 +1,304 @@
+"""
+Content-addressed store for incremental backups.
+
+Each file is stored once, compressed, under the sha256 of its contents. A backup is then
+just a small manifest listing the files in the backed up directory and the digest of each,
+so files which have not changed since the previous backup cost no extra disk space and,
+because the previous manifest remembers their digests, are not even read again.
+"""
+
+import fnmatch
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, NamedTuple
+
+from ibex_install_utils.io_throttle import IOThrottle
+
+STORE_MANIFEST_EXTENSION = ".store.json.gz"
+"""Extension of a backup manifest, e.g. `EPICS.store.json.gz` for a backup of EPICS"""
+
+STORE_DIR_NAME = "backup_store"
+"""Name of the store directory, which sits next to the `ibex_backup_*` directories"""
+
+_BLOCK_SIZE = 1024**2
+_MANIFEST_FORMAT_VERSION = 1
+
+
+class StoredFile(NamedTuple):
+    """A file recorded in a backup manifest"""
+
+    path: str
+    """Path of the file relative to the backed up directory, with / separators"""
+    size: int
+    """Size of the file in bytes"""
+    mtime: float
+    """Modification time of the file in seconds since the epoch"""
+    digest: str
+    """sha256 of the file contents, which is also its key in the store"""
+
+
+def read_manifest(manifest_path: str) -> list[StoredFile]:
+    """
+    Read a backup manifest.
+
+    Args:
+        manifest_path: path to the manifest
+    Returns:
+        The files listed in the manifest
+    """
+    with gzip.open(manifest_path, "rt", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return [StoredFile(*entry) for entry in manifest["files"]]
+
+
+def write_manifest(manifest_path: str, files: Iterable[StoredFile]) -> None:
+    """
+    Write a backup manifest, replacing the manifest atomically if it already exists.
+
+    Args:
+        manifest_path: path to the manifest
+        files: the files to list in the manifest
+    """
+    temp_path = manifest_path + ".tmp"
+    with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+        json.dump({"version": _MANIFEST_FORMAT_VERSION, "files": [list(file) for file in files]}, f)
+    os.replace(temp_path, manifest_path)
+
+
+def store_for_manifest(manifest_path: str) -> "BackupStore":
+    """
+    The store holding the files of a backup, i.e. the store next to the backup's directory.
+
+    Args:
+        manifest_path: path to the manifest of the backup, e.g.
+         `C:\\data\\old\\ibex_backup_2024_01_01\\EPICS.store.json.gz`
+    """
+    backups_dir = os.path.dirname(os.path.dirname(os.path.abspath(manifest_path)))
+    return BackupStore(os.path.join(backups_dir, STORE_DIR_NAME))
+
+
+class BackupStore:
+    """
+    A directory of zlib compressed files named by the sha256 of their uncompressed contents.
+    """
+
+    def __init__(self, root: str, throttle: IOThrottle | None = None) -> None:
+        """
+        Args:
+            root: directory holding the store, created if needed when files are added
+            throttle: optional limit on the rate files being added are read at
+        """
+        self.root = root
+        self._throttle = throttle
+        self._objects_dir = os.path.join(root, "objects")
+        self._latest_dir = os.path.join(root, "latest")
+
+    def object_path(self, digest: str) -> str:
+        """Path of the stored copy of the file with the given digest"""
+        return os.path.join(self._objects_dir, digest[:2], digest)
+
+    def has(self, digest: str) -> bool:
+        """Whether a file with the given digest is in the store"""
+        return os.path.exists(self.object_path(digest))
+
+    def add_file(self, path: str) -> str:
+        """
+        Add a file to the store if its contents are not already there.
+
+        Args:
+            path: path of the file to add
+        Returns:
+            The digest of the file
+        """
+        os.makedirs(self._objects_dir, exist_ok=True)
+        sha = hashlib.sha256()
+        compressor = zlib.compressobj(1)
+        with tempfile.NamedTemporaryFile(dir=self._objects_dir, delete=False) as temp:
+            try:
+                with open(path, "rb") as f:
+                    while block := self._read_block(f):
+                        sha.update(block)
+                        temp.write(compressor.compress(block))
+                temp.write(compressor.flush())
+            except BaseException:
+                temp.close()
+                os.remove(temp.name)
+                raise
+
+        digest = sha.hexdigest()
+        object_path = self.object_path(digest)
+        if os.path.exists(object_path):
+            os.remove(temp.name)
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            os.replace(temp.name, object_path)
+        return digest
+
+    def _read_block(self, f) -> bytes:
+        if self._throttle is None:
+            return f.read(_BLOCK_SIZE)
+        return self._throttle.read(f, _BLOCK_SIZE)
+
+    def restore_file(self, stored_file: StoredFile, dst: str) -> None:
+        """
+        Write a stored file back out, preserving its modification time.
+
+        Args:
+            stored_file: the manifest entry of the file
+            dst: path to write the file to
+        """
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        decompressor = zlib.decompressobj()
+        with open(self.object_path(stored_file.digest), "rb") as src, open(dst, "wb") as f:
+            while block := src.read(_BLOCK_SIZE):
+                f.write(decompressor.decompress(block))
+            f.write(decompressor.flush())
+        os.utime(dst, (stored_file.mtime, stored_file.mtime))
+
+    def copy_to(self, other: "BackupStore", digests: Iterable[str]) -> int:
+        """
+        Copy files to another store, e.g. on a share, skipping any it already has.
+
+        Args:
+            other: store to copy to
+            digests: digests of the files to copy
+        Returns:
+            The number of files copied
+        """
+        copied = 0
+        for digest in set(digests):
+            if not other.has(digest):
+                dst = other.object_path(digest)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                with open(self.object_path(digest), "rb") as src, open(dst + ".tmp", "wb") as f:
+                    while block := src.read(_BLOCK_SIZE):
+                        f.write(block)
+                os.replace(dst + ".tmp", dst)
+                copied += 1
+        return copied
+
+    def latest_manifest_path(self, name: str) -> str:
+        """Path of the copy of the most recent manifest for the backed up directory `name`"""
+        return os.path.join(self._latest_dir, name + STORE_MANIFEST_EXTENSION)
+
+    def prune(self) -> int:
+        """
+        Remove files from the store which are not in the latest manifest of any directory.
+
+        Run once older backups have been copied elsewhere (see `copy_to`).
+
+        Returns:
+            The number of files removed
+        """
+        keep = set()
+        if os.path.isdir(self._latest_dir):
+            for name in os.listdir(self._latest_dir):
+                keep.update(f.digest for f in read_manifest(os.path.join(self._latest_dir, name)))
+
+        removed = 0
+        if os.path.isdir(self._objects_dir):
+            for prefix in os.scandir(self._objects_dir):
+                if prefix.is_dir():
+                    for entry in os.scandir(prefix.path):
+                        if entry.name not in keep:
+                            os.remove(entry.path)
+                            removed += 1
+        return removed
+
+    def backup(
+        self,
+        name: str,
+        files: Iterable[tuple[str, str, int, float]],
+        manifest_path: str,
+        workers: int | None = None,
+        on_stored: Callable[[StoredFile], None] | None = None,
+    ) -> list[StoredFile]:
+        """
+        Back up files into the store and write a manifest describing them.
+
+        Files whose path, size and mtime match the latest manifest for `name` are assumed
+        unchanged and are not read.
+
+        Args:
+            name: name of the backed up directory, e.g. EPICS
+            files: iterable of (path to file, relative path, size, mtime),
+             for example `file_utils.ManifestEntry`
+            manifest_path: where to write the manifest for this backup
+            workers: number of threads used to hash and compress files, None for the default
+            on_stored: optional callback called, from the calling thread, for each file
+             once it is in the store
+        Returns:
+            The files in the backup
+        """
+        previous = {}
+        latest_manifest_path = self.latest_manifest_path(name)
+        if os.path.exists(latest_manifest_path):
+            previous = {(f.path, f.size, f.mtime): f for f in read_manifest(latest_manifest_path)}
+
+        def _store(file: tuple[str, str, int, float]) -> StoredFile:
+            path, relpath, size, mtime = file
+            relpath = relpath.replace(os.sep, "/")
+            stored_file = previous.get((relpath, size, mtime))
+            if stored_file is None or not self.has(stored_file.digest):
+                stored_file = StoredFile(relpath, size, mtime, self.add_file(path))
+            return stored_file
+
+        stored_files = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backup_store") as pool:
+            for stored_file in pool.map(_store, files):
+                stored_files.append(stored_file)
+                if on_stored is not None:
+                    on_stored(stored_file)
+
+        write_manifest(manifest_path, stored_files)
+        os.makedirs(self._latest_dir, exist_ok=True)
+        write_manifest(latest_manifest_path, stored_files)
+        return stored_files
+
+    def missing(self, manifest_path: str) -> list[StoredFile]:
+        """
+        Check that every file in a manifest is in the store.
+
+        Args:
+            manifest_path: path to the manifest
+        Returns:
+            The files listed in the manifest which are missing from the store
+        """
+        return [f for f in read_manifest(manifest_path) if not self.has(f.digest)]
+
+    def restore(
+        self,
+        manifest_path: str,
+        dst: str,
+        patterns: list[str] | None = None,
+        workers: int | None = None,
+    ) -> int:
+        """
+        Restore a backup from the store.
+
+        Args:
+            manifest_path: path to the manifest of the backup
+            dst: directory to restore the backup into
+            patterns: optional glob patterns of relative paths (e.g. `config/*`),
+             only matching files are restored
+            workers: number of threads used to restore files, None for the default
+        Returns:
+            The number of files restored
+        """
+        files = [
+            f
+            for f in read_manifest(manifest_path)
+            if not patterns or any(fnmatch.fnmatchcase(f.path, p) for p in patterns)
+        ]
+
+        def _restore(stored_file: StoredFile) -> None:
+            self.restore_file(stored_file, os.path.join(dst, *stored_file.path.split("/")))
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backup_restore") as pool:
+            list(pool.map(_restore, files))
+        return len(files)
@@ -1 +1,8 @@
 SERVER_ARCH = "x64"
+BACKUP_WORKERS: int | None = None
+BACKUP_FORMAT = "zip"
+BACKUP_VERIFY = "quick"
+BACKUP_VERIFY_FRACTION = 0.05
+BACKUP_MAX_MB_PER_SECOND: float | None = None
+BACKUP_ADAPTIVE_THROTTLE = False
+DEPLOY_TASK_WORKERS = 1
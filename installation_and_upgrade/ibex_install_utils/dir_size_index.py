@@ -0,0 +1,146 @@
+"""
+An on-disk index of directory sizes, so the sizes of big, mostly unchanging trees such as
+EPICS don't have to be recomputed from scratch every time they're needed.
+
+The index records, for each directory, its modification time, the total size and number of
+the files directly in it, and its subdirectories. A directory's modification time changes
+whenever anything is added to, removed from or renamed in it, so while it is unchanged its
+entry in the index can be used instead of listing it and stat'ing its files; a walk of an
+unchanged tree is then one stat per directory. Files changed in place don't change their
+directory's modification time, so sizes from the index are estimates, good for reporting
+and space checks but not for deciding what to back up.
+"""
+
+import gzip
+import json
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import NamedTuple
+
+from ibex_install_utils.tasks.common_paths import VAR_DIR
+from ibex_install_utils.tree_walk import WALK_WORKERS, TreeStats
+
+DIR_SIZE_INDEX_PATH = os.path.join(VAR_DIR, "tmp", "dir_size_index.json.gz")
+"""Default location of the index"""
+
+_INDEX_FORMAT_VERSION = 1
+
+
+class _IndexedDir(NamedTuple):
+    mtime_ns: int
+    size: int
+    files: int
+    subdirectories: list[str]
+
+
+def _visit(directory: str, indexed: _IndexedDir | None) -> tuple[str, _IndexedDir, bool]:
+    """List a directory, unless it is unchanged since it was indexed"""
+    mtime_ns = os.stat(directory).st_mtime_ns
+    if indexed is not None and indexed.mtime_ns == mtime_ns:
+        return directory, indexed, False
+    size, files, subdirectories = 0, 0, []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirectories.append(entry.name)
+            elif entry.is_file():
+                size += entry.stat().st_size
+                files += 1
+    return directory, _IndexedDir(mtime_ns, size, files, subdirectories), True
+
+
+class DirSizeIndex:
+    """
+    Sizes of directory trees, remembered between runs in an index file.
+
+    Can be used from several threads at once.
+    """
+
+    def __init__(self, index_path: str = DIR_SIZE_INDEX_PATH) -> None:
+        """
+        Args:
+            index_path: path of the index file, created when first saved
+        """
+        self.index_path = index_path
+        self._directories: dict[str, _IndexedDir] | None = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, _IndexedDir]:
+        if self._directories is None:
+            try:
+                with gzip.open(self.index_path, "rt", encoding="utf-8") as f:
+                    index = json.load(f)
+                if index["version"] != _INDEX_FORMAT_VERSION:
+                    raise ValueError(f"index format version {index['version']}")
+                self._directories = {
+                    path: _IndexedDir(*entry) for path, entry in index["directories"].items()
+                }
+            except (OSError, ValueError, KeyError, TypeError):
+                # No index yet, it is unreadable or it was written by another version: start again
+                self._directories = {}
+        return self._directories
+
+    def tree_stats(self, path: str, workers: int = WALK_WORKERS, save: bool = True) -> TreeStats:
+        """
+        Total size and number of files in a directory tree, listing only the directories
+        which have changed since they were last indexed.
+
+        Args:
+            path: directory at the top of the tree
+            workers: number of directories to stat or list at once
+            save: whether to save the index afterwards, if it changed
+        Returns:
+            The total size and number of the files
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            directories = self._load()
+            size, number_of_files = 0, 0
+            visited, changed = set(), False
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dir_size") as pool:
+                pending: set[Future] = {pool.submit(_visit, path, directories.get(path))}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        directory, indexed, listed = future.result()
+                        visited.add(directory)
+                        if listed:
+                            directories[directory] = indexed
+                            changed = True
+                        size += indexed.size
+                        number_of_files += indexed.files
+                        for name in indexed.subdirectories:
+                            subdirectory = os.path.join(directory, name)
+                            pending.add(
+                                pool.submit(_visit, subdirectory, directories.get(subdirectory))
+                            )
+
+            # Forget directories which have been removed from the tree
+            prefix = os.path.join(path, "")
+            removed = [d for d in directories if d.startswith(prefix) and d not in visited]
+            for directory in removed:
+                del directories[directory]
+            if save and (changed or removed):
+                self._save()
+        return TreeStats(size, number_of_files)
+
+    def _save(self) -> None:
+        temp_path = self.index_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "version": _INDEX_FORMAT_VERSION,
+                        "directories": {
+                            path: list(entry) for path, entry in self._directories.items()
+                        },
+                    },
+                    f,
+                )
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            # The index only saves time, so carry on without it
+            print(f"Unable to save directory size index {self.index_path}: {e}")
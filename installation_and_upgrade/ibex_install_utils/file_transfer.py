@@ -0,0 +1,283 @@
+"""
+Verified moving of directory trees, e.g. old backups to a share.
+
+Files are copied by a pool of threads and each copy is verified before the source file is
+deleted, either by reading it back from the destination and comparing its checksum with the
+source's or, more quickly, by checking its size. Either way the source must not have changed
+since it was listed. Files are first copied to a `.partial` file which is renamed once
+complete, so if a move is interrupted the next move of the same tree carries on from where it
+got to.
+
+Within a volume nothing is copied: a tree is renamed as a whole if its destination doesn't
+exist yet, otherwise each file is renamed into place.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from ibex_install_utils.exceptions import ErrorWithFile
+from ibex_install_utils.file_utils import FileUtils
+from ibex_install_utils.tree_walk import is_link
+
+PARTIAL_EXTENSION = ".partial"
+"""Extension of a file which is still being copied"""
+
+VERIFY_CHECKSUM = "checksum"
+"""Verify copies by comparing their sha256 with the source's"""
+VERIFY_SIZE = "size"
+"""Verify copies by checking their size, and that the source has not changed since listed"""
+
+_MTIME_TOLERANCE = 2.0
+"""Seconds modification times may differ by, as FAT and some shares only keep even seconds"""
+
+_BLOCK_SIZE = 1024**2
+
+
+def _sha256(path: str, length: int | None = None) -> str:
+    """The sha256 of a file, or of its first length bytes"""
+    sha = hashlib.sha256()
+    remaining = length
+    with open(path, "rb") as f:
+        while block := f.read(_BLOCK_SIZE if remaining is None else min(_BLOCK_SIZE, remaining)):
+            sha.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return sha.hexdigest()
+
+
+def _copy(src: str, dst: str, size: int) -> str:
+    """
+    Copy a file via a partial file, resuming the partial file if there is one and it matches
+    the start of the source.
+
+    Returns:
+        The sha256 of the source file
+    """
+    partial = dst + PARTIAL_EXTENSION
+    try:
+        offset = os.path.getsize(partial)
+    except FileNotFoundError:
+        offset = 0
+    if offset > size or (offset and _sha256(partial) != _sha256(src, offset)):
+        # The partial file is of another version of the source, so start again
+        offset = 0
+
+    # The whole source is read, to checksum it, but only what is missing is written
+    sha = hashlib.sha256()
+    position = 0
+    with open(src, "rb") as s, open(partial, "ab" if offset else "wb") as d:
+        while block := s.read(_BLOCK_SIZE):
+            sha.update(block)
+            if position + len(block) > offset:
+                d.write(block[max(offset - position, 0) :])
+            position += len(block)
+    os.replace(partial, dst)
+    return sha.hexdigest()
+
+
+def move_file(src: str, dst: str, size: int, mtime: float, verify: str = VERIFY_CHECKSUM) -> None:
+    """
+    Move a file, only deleting the source once the copy is verified.
+
+    Args:
+        src: path of the file to move
+        dst: path to move it to
+        size: size of the file
+        mtime: modification time of the file when it was listed, given to the copy
+        verify: how to verify the copy, `VERIFY_CHECKSUM` or `VERIFY_SIZE`
+    Raises:
+        ErrorWithFile: if the copy does not match the source
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    src_sha = None
+    if os.path.exists(dst) and os.path.getsize(dst) == size:
+        # Possibly copied by an earlier move which was interrupted before deleting the source,
+        # but possibly an unrelated file of the same size, so only skip the copy if it matches
+        src_sha = _sha256(src)
+        if _sha256(dst) != src_sha:
+            src_sha = None
+    if src_sha is None:
+        src_sha = _copy(src, dst, size)
+
+    # Check the source was not changed while it was being copied
+    source = os.stat(src)
+    if (
+        source.st_size != size
+        or abs(source.st_mtime - mtime) > _MTIME_TOLERANCE
+        or os.path.getsize(dst) != size
+        or (verify == VERIFY_CHECKSUM and _sha256(dst) != src_sha)
+    ):
+        os.remove(dst)
+        raise ErrorWithFile(f"Copy of {src} to {dst} does not match the original")
+    os.utime(dst, (mtime, mtime))
+    os.remove(src)
+
+
+def _rename_file(src: str, dst: str, *_) -> None:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    os.replace(src, dst)
+    if os.path.exists(dst + PARTIAL_EXTENSION):
+        os.remove(dst + PARTIAL_EXTENSION)
+
+
+def _same_volume(src: str, dst: str) -> bool:
+    """Whether a source and a destination, which may not exist yet, are on the same volume"""
+    existing = dst
+    while not os.path.exists(existing):
+        parent = os.path.dirname(existing)
+        if parent == existing:
+            return False
+        existing = parent
+    return os.stat(src).st_dev == os.stat(existing).st_dev
+
+
+def _remove_empty_dirs(path: str) -> None:
+    for directory, _, _ in sorted(os.walk(path), key=lambda walked: -len(walked[0])):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            pass  # not empty, the files which failed to move are still there
+
+
+class TreeTransfer:
+    """
+    Moves directory trees in the background, several files at a time.
+
+    Every file of every tree shares the one pool of threads, so several trees are moved at
+    once while the number of concurrent copies stays bounded. Links to directories and
+    junctions are not followed, and are left behind in the source.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        retries: int = 3,
+        retry_delay: float = 5.0,
+        verify: str = VERIFY_CHECKSUM,
+    ) -> None:
+        """
+        Args:
+            workers: number of files to copy at once
+            retries: attempts to move each file
+            retry_delay: seconds to wait before retrying a file, e.g. in case antivirus
+             has a lock on it or the share has dropped out
+            verify: how to verify copies, `VERIFY_CHECKSUM` or `VERIFY_SIZE`
+        """
+        self._workers = workers
+        self._retries = retries
+        self._retry_delay = retry_delay
+        self._verify = verify
+        self._thread: threading.Thread | None = None
+        self._errors: dict[str, list[str]] = {}
+        self._exception: BaseException | None = None
+
+    def start(self, moves: list[tuple[str, str]]) -> None:
+        """
+        Start moving trees in the background.
+
+        If a background move is already running, e.g. because the task which started it is
+        being retried, waits for it to finish first so that only one move runs at a time.
+        Its problems are kept for `wait`, except those of trees which are being moved again.
+
+        Args:
+            moves: (source directory, destination directory) of each tree to move
+        """
+        if self._thread is not None:
+            self._thread.join()
+        for src, _ in moves:
+            self._errors.pop(src, None)
+        self._thread = threading.Thread(
+            target=self._move_in_background, args=(moves,), name="tree_transfer"
+        )
+        self._thread.start()
+
+    def _move_in_background(self, moves: list[tuple[str, str]]) -> None:
+        try:
+            self._errors.update(self.move_trees(moves))
+        except BaseException as e:
+            # Raised from wait, rather than lost with the thread
+            self._exception = e
+
+    def running(self) -> bool:
+        """Whether a background move is in progress"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self) -> dict[str, list[str]]:
+        """
+        Wait for the background move to finish.
+
+        Returns:
+            The problems moving each tree which did not move completely, by source directory,
+            each only returned once
+        Raises:
+            Any other exception raised while moving in the background
+        """
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        errors, self._errors = self._errors, {}
+        exception, self._exception = self._exception, None
+        if exception is not None:
+            raise exception
+        return errors
+
+    def move_trees(self, moves: list[tuple[str, str]]) -> dict[str, list[str]]:
+        """
+        Move trees, returning once they have moved.
+
+        Args:
+            moves: (source directory, destination directory) of each tree to move
+        Returns:
+            The problems moving each tree which did not move completely, by source directory
+        """
+        errors: dict[str, list[str]] = {}
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="move") as pool:
+            futures = []
+            for src, dst in moves:
+                try:
+                    same_volume = _same_volume(FileUtils.winapi_path(src), dst)
+                    if same_volume and not os.path.lexists(dst):
+                        os.makedirs(os.path.dirname(dst), exist_ok=True)
+                        os.rename(FileUtils.winapi_path(src), FileUtils.winapi_path(dst))
+                        continue
+                    manifest = FileUtils.build_manifest(src, prune=is_link)
+                except OSError as e:
+                    errors[src] = [str(e)]
+                    continue
+                move = _rename_file if same_volume else move_file
+                for entry in manifest:
+                    future = pool.submit(
+                        self._move_with_retries,
+                        move,
+                        entry.path,
+                        FileUtils.winapi_path(os.path.join(dst, entry.relpath)),
+                        entry.size,
+                        entry.mtime,
+                    )
+                    futures.append((src, future))
+
+            for src, future in futures:
+                error = future.result()
+                if error is not None:
+                    errors.setdefault(src, []).append(error)
+
+        for src, _ in moves:
+            if os.path.isdir(src):
+                _remove_empty_dirs(FileUtils.winapi_path(src))
+        return errors
+
+    def _move_with_retries(
+        self, move: Callable[..., None], src: str, dst: str, size: int, mtime: float
+    ) -> str | None:
+        for attempt in range(self._retries):
+            try:
+                move(src, dst, size, mtime, self._verify)
+                return None
+            except (OSError, ErrorWithFile) as e:
+                if attempt == self._retries - 1:
+                    return str(e)
+                time.sleep(self._retry_delay)
@@ -4,23 +4,44 @@ Filesystem utility classes
 
 import binascii
 import logging
+import mmap
 import os
 import shutil
 import tempfile
+import threading
 import time
 import zipfile
 import zlib
 from contextlib import contextmanager
+from typing import NamedTuple
 
-import win32api
 from ibex_install_utils.exceptions import UserStop
+from ibex_install_utils.pe_version import read_file_version
 from ibex_install_utils.run_process import RunProcess
+from ibex_install_utils.tree_delete import delete_tree
+from ibex_install_utils.tree_walk import TreeStats, tree_stats, walk_parallel
 
 LABVIEW_DAE_DIR = os.path.join("C:\\", "LabVIEW modules", "DAE")
 
 
+class ManifestEntry(NamedTuple):
+    """A file found when building a directory manifest"""
+
+    path: str
+    """Full path to the file"""
+    relpath: str
+    """Path to the file relative to the directory the manifest was built from"""
+    size: int
+    """Size of the file in bytes"""
+    mtime: float
+    """Modification time of the file in seconds since the epoch"""
+
+
 def _winapi_path(dos_path):
     path = os.path.abspath(dos_path)
+    if os.name != "nt":
+        # Only Windows has a maximum path length to get around
+        return path
     long_path_identifier = "\\\\?\\"
     if path.startswith(long_path_identifier):
         win_path = path
@@ -43,15 +64,25 @@ def get_latest_directory_path(build_dir, build_prefix, directory_above_build_num
     return os.path.join(build_dir, f"{build_prefix}{build_num}", directory_above_build_num)
 
 
+_dir_size_index = None
+"""Sizes of directories, remembered between runs"""
+_dir_size_index_lock = threading.Lock()
+
+
+def _get_dir_size_index():
+    global _dir_size_index
+    with _dir_size_index_lock:
+        if _dir_size_index is None:
+            # dir_size_index uses tasks.common_paths, and tasks uses FileUtils, so it can't be
+            # imported at the top
+            from ibex_install_utils.dir_size_index import DirSizeIndex
+
+            _dir_size_index = DirSizeIndex()
+    return _dir_size_index
+
+
 def _get_dir_size(path="."):
-    total = 0
-    with os.scandir(_winapi_path(path)) as it:
-        for entry in it:
-            if entry.is_file():
-                total += entry.stat().st_size
-            elif entry.is_dir():
-                total += _get_dir_size(entry.path)
-    return total
+    return _get_dir_size_index().tree_stats(_winapi_path(path)).size
 
 
 def get_size(path="."):
@@ -80,60 +111,80 @@ class FileUtils:
             return False
 
     @staticmethod
-    def remove_tree(path, prompt, use_robocopy=True, retries=10, leave_top_if_link=False) -> None:
+    def remove_tree(path, prompt, use_robocopy=False, retries=8, leave_top_if_link=False) -> None:
         """
         Delete a file path if it exists
         Args:
             path: path to delete
             prompt (ibex_install_utils.user_prompt.UserPrompt): prompt object to communicate with user
-            use_robocopy: use robocopy to delete the directory this allows us to remove particularly long paths
-            retries: maximum number of attempts to delete file path
+            use_robocopy: use robocopy to delete the directory instead of deleting files from a
+             pool of threads (see `tree_delete`)
+            retries: maximum number of attempts to delete each file, or with robocopy the
+             whole file path
             leave_top_if_link: if top level directory is a link, remove directory contents but do not remove link
         """
+        if use_robocopy:
+            FileUtils._remove_tree_with_robocopy(path, prompt, retries, leave_top_if_link)
+            return
+        if not os.path.lexists(path):
+            return
+        leave_top = leave_top_if_link and FileUtils.is_junction(path)
+        try:
+            problems = delete_tree(
+                FileUtils.winapi_path(path), leave_top=leave_top, retries=retries
+            )
+        except OSError as e:
+            problems = [str(e)]
+        if problems:
+            for problem in problems[:10]:
+                print(problem)
+            prompt.prompt_and_raise_if_not_yes(
+                f'Error when deleting "{path}". Please do this manually'
+            )
+
+    @staticmethod
+    def _remove_tree_with_robocopy(path, prompt, retries, leave_top_if_link) -> None:
         for _ in range(retries):
             try:
-                if use_robocopy:
-                    empty_dir = os.path.join(os.path.dirname(path), "empty_dir_for_robocopy")
-                    if os.path.exists(empty_dir):
-                        os.rmdir(empty_dir)  # in case left over from previous aborted run
-                    os.mkdir(empty_dir)
-                    if not os.path.exists(empty_dir):
-                        prompt.prompt_and_raise_if_not_yes(
-                            f'Error creating empty dir for robocopy "{empty_dir}". '
-                            f"Please do this manually"
-                        )
-                    if os.path.isdir(path):
-                        args = [
-                            f"{empty_dir}",
-                            f"{path}",
-                            "/PURGE",
-                            "/NJH",
-                            "/NJS",
-                            "/NP",
-                            "/NFL",
-                            "/NDL",
-                            "/NS",
-                            "/NC",
-                            "/R:1",
-                            "/LOG:NUL",
-                        ]
-                        try:
-                            RunProcess(
-                                working_dir=os.curdir,
-                                executable_file="robocopy",
-                                executable_directory="",
-                                prog_args=args,
-                                expected_return_codes=[0, 1, 2],
-                            ).run()
-                        except:
-                            pass
-                    os.rmdir(empty_dir)
-                    if leave_top_if_link and FileUtils.is_junction(path):
+                empty_dir = os.path.join(os.path.dirname(path), "empty_dir_for_robocopy")
+                if os.path.exists(empty_dir):
+                    os.rmdir(empty_dir)  # in case left over from previous aborted run
+                os.mkdir(empty_dir)
+                if not os.path.exists(empty_dir):
+                    prompt.prompt_and_raise_if_not_yes(
+                        f'Error creating empty dir for robocopy "{empty_dir}". '
+                        f"Please do this manually"
+                    )
+                if os.path.isdir(path):
+                    args = [
+                        f"{empty_dir}",
+                        f"{path}",
+                        "/PURGE",
+                        "/NJH",
+                        "/NJS",
+                        "/NP",
+                        "/NFL",
+                        "/NDL",
+                        "/NS",
+                        "/NC",
+                        "/R:1",
+                        "/LOG:NUL",
+                    ]
+                    try:
+                        RunProcess(
+                            working_dir=os.curdir,
+                            executable_file="robocopy",
+                            executable_directory="",
+                            prog_args=args,
+                            expected_return_codes=[0, 1, 2],
+                        ).run()
+                    except:
                         pass
-                    else:
-                        os.rmdir(path)
+                os.rmdir(empty_dir)
+                if leave_top_if_link and FileUtils.is_junction(path):
+                    pass
                 else:
-                    shutil.rmtree(FileUtils.winapi_path(path))
+                    os.rmdir(path)
             except (IOError, OSError, WindowsError):
                 pass
 
@@ -207,16 +258,34 @@ class FileUtils:
             os.mkdir(path)
 
     @staticmethod
-    def move_dir(src, dst, prompt) -> None:
+    def move_dir(src, dst, prompt, use_robocopy=False) -> None:
         """
         Moves a dir. Better to copy remove so we can handle permissions issues
 
+        Files are copied by a pool of threads, or renamed if on the same volume, and each copy's
+        size and modification time checked before its source is deleted (see `file_transfer`).
+        Links to directories and junctions are not followed, they are deleted with the source.
+
         Args:
             src: Source directory
             dst: Destination directory
             prompt (ibex_install_utils.user_prompt.UserPrompt): prompt object to communicate with user
+            use_robocopy: use robocopy to copy the directory instead
         """
-        FileUtils.robocopy_move(src, dst, prompt)
+        if use_robocopy:
+            FileUtils.robocopy_move(src, dst, prompt)
+        else:
+            # file_transfer uses FileUtils, so can't be imported at the top
+            from ibex_install_utils.file_transfer import VERIFY_SIZE, TreeTransfer
+
+            errors = TreeTransfer(workers=8, verify=VERIFY_SIZE).move_trees([(src, dst)])
+            for problem in errors.get(src, [])[:10]:
+                print(problem)
+            if errors:
+                prompt.prompt_and_raise_if_not_yes(
+                    f"Error moving {src} to {dst}, {len(errors[src])} files were not moved. "
+                    "Please move them manually."
+                )
         FileUtils.remove_tree(src, prompt)
 
     @staticmethod
@@ -257,37 +326,80 @@ class FileUtils:
 
     @staticmethod
     def _get_dir_size(path="."):
-        total = 0
-        with os.scandir(FileUtils.winapi_path(path)) as it:
-            for entry in it:
-                if entry.is_file():
-                    total += entry.stat().st_size
-                elif entry.is_dir():
-                    total += FileUtils._get_dir_size(entry.path)
-        return total
+        return FileUtils.cached_tree_stats(path).size
+
+    @staticmethod
+    def cached_tree_stats(path=".") -> TreeStats:
+        """
+        Total size and number of files in a directory tree, only listing the directories which
+        have changed since the last time (see `dir_size_index`). The sizes of files changed in
+        place since then may be out of date, so use `tree_stats` where they must be exact.
+        """
+        return _get_dir_size_index().tree_stats(FileUtils.winapi_path(path))
+
+    @staticmethod
+    def walk_parallel(path=".", ignore=None, prune=None, onerror=None):
+        """
+        Walk a directory tree, listing several directories at once (see `tree_walk`).
+
+        Args:
+            path: directory at the top of the tree
+            ignore: optional callable like `shutil.ignore_patterns`; called once per directory
+             with the directory path and the names in it, returns the names to skip
+            prune: optional callable called with the `os.DirEntry` of each subdirectory,
+             returns whether to skip it
+            onerror: optional callable called with the `OSError` for each directory which
+             can't be listed, which is skipped like `os.walk` does
+        Returns:
+            An iterator of the path of each directory, in no particular order, and the
+            `os.DirEntry`s of the files in it
+        """
+        return walk_parallel(FileUtils.winapi_path(path), ignore, prune, onerror=onerror)
+
+    @staticmethod
+    def tree_stats(path=".", ignore=None, prune=None, onerror=None) -> TreeStats:
+        """
+        Total size and number of files in a directory tree, see `walk_parallel`.
+        """
+        return tree_stats(FileUtils.winapi_path(path), ignore, prune, onerror=onerror)
+
+    @staticmethod
+    def build_manifest(path=".", ignore=None, prune=None, onerror=None) -> list["ManifestEntry"]:
+        """
+        List every file below a directory, recording its size and mtime.
+
+        Uses `walk_parallel` so that several directories are listed at once, and on Windows
+        sizes and mtimes come from the directory listing rather than a separate stat of each
+        file. Symbolic links to directories and junctions are not followed.
+
+        Args:
+            path: directory to list
+            ignore: optional callable like `shutil.ignore_patterns`; called once per directory
+             with the directory path and the names in it, returns the names to skip
+            prune: optional callable called with the `os.DirEntry` of each subdirectory,
+             returns whether to skip it
+            onerror: optional callable called with the `OSError` for each directory which
+             can't be listed, which is left out of the manifest like `os.walk` does
+        Returns:
+            A manifest entry for each file found, sorted by path
+        """
+        root = FileUtils.winapi_path(path)
+        manifest = []
+        for _, files in walk_parallel(root, ignore, prune, onerror=onerror):
+            for entry in files:
+                stat = entry.stat()
+                manifest.append(
+                    ManifestEntry(
+                        entry.path, os.path.relpath(entry.path, root), stat.st_size, stat.st_mtime
+                    )
+                )
+        manifest.sort(key=lambda entry: entry.relpath)
+        return manifest
 
     @staticmethod
     def get_size_and_number_of_files(path=".", ignore=None):
-        # use copytree to get size of directory
-        size_of_dir = 0
-        number_of_files = 0
-
-        def total_up_size(src, dst) -> None:
-            nonlocal size_of_dir
-            nonlocal number_of_files
-            number_of_files += 1
-            size_of_dir += os.path.getsize(FileUtils.winapi_path(src))
-
-        temp_dir = tempfile.gettempdir()
-        backup_temp_dir = os.path.join(temp_dir, "copy_tree_temp_dir")
-        shutil.copytree(
-            FileUtils.winapi_path(path),
-            FileUtils.winapi_path(backup_temp_dir),
-            ignore=ignore,
-            copy_function=total_up_size,
-            dirs_exist_ok=True,
-        )
-        return size_of_dir, number_of_files
+        manifest = FileUtils.build_manifest(path, ignore=ignore)
+        return sum(entry.size for entry in manifest), len(manifest)
 
     @staticmethod
     def dehex_and_decompress(value):
@@ -316,16 +428,33 @@ def get_version(path: str):
     """
     version = None
     try:
-        info = win32api.GetFileVersionInfo(path, "\\")
-        ms = info["FileVersionMS"]
-        ls = info["FileVersionLS"]
-        version = f"{win32api.HIWORD(ms)}.{win32api.LOWORD(ms)}.{win32api.HIWORD(ls)}.{win32api.LOWORD(ls)}"
-    except:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            version = read_file_version(m)
+    except (OSError, ValueError):
         logging.exception(f"Can't get file version info of '{path}'")
     logging.info(f"Read version '{version}' from file info of '{path}'")
     return version
 
 
+def get_version_in_zip(zipname: str, filename: str):
+    """Reads the version of a file in a zip from its file version info, without extracting it.
+
+    Args:
+        zipname: The path to the zip.
+        filename: The path of the file within the zip.
+    Returns:
+        The string version (x.x.x.x) on successful read, None otherwise.
+    """
+    version = None
+    try:
+        with zipfile.ZipFile(zipname) as z, z.open(filename) as f:
+            version = read_file_version(f)
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        logging.exception(f"Can't get file version info of '{filename}' in '{zipname}'")
+    logging.info(f"Read version '{version}' from file info of '{filename}' in '{zipname}'")
+    return version
+
+
 @contextmanager
 def file_in_zip(zipname, peek_at_filename: str):
     """
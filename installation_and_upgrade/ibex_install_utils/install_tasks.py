@@ -2,7 +2,9 @@
 
 import os
 
+import ibex_install_utils.current_args
 from ibex_install_utils.file_utils import LABVIEW_DAE_DIR, FileUtils
+from ibex_install_utils.task_graph import TaskGraph
 from ibex_install_utils.tasks.backup_tasks import BackupTasks
 from ibex_install_utils.tasks.client_tasks import ClientTasks
 from ibex_install_utils.tasks.git_tasks import GitTasks
@@ -217,29 +219,75 @@ class UpgradeInstrument:
         """Upgrade an instrument. Steps to do after ibex has been stopped
         but before it is restarted.
 
+        Steps which don't depend on each other can run at the same time to cut the downtime,
+        but their output is then interleaved, so by default (one worker) the steps run in
+        turn, in the order they are added.
+
         Current the server can not be started or stopped in this python script.
         """
-        self._system_tasks.install_or_upgrade_git()
-        self._git_tasks.show_git_status()
-        self._backup_tasks.backup_old_directories()
-        self._backup_tasks.backup_checker()
-        self._server_tasks.install_ibex_server()
-        self._system_tasks.create_virtual_envs()
-        self._server_tasks.update_icp(self.icp_in_labview_modules())
-        self._python_tasks.install_genie_python3()
-        self._mysql_tasks.install_mysql()
-        self._system_tasks.install_or_upgrade_vc_redist()
-        self._client_tasks.install_ibex_client()
-        self._git_tasks.checkout_to_release_branch()
-        self._server_tasks.upgrade_instrument_configuration()
-        self._server_tasks.update_shared_scripts_repository()
-        self._server_tasks.update_calibrations_repository()
-        self._system_tasks.clear_or_reapply_hotfixes()
-        self._python_tasks.update_script_definitions()
-        self._python_tasks.remove_instrument_script_githooks()
-        self._server_tasks.setup_log_rotation()
-        self._server_tasks.update_journal_parser()
-        self._system_tasks.update_kafka_topics()
+        steps = TaskGraph(ibex_install_utils.current_args.DEPLOY_TASK_WORKERS)
+        steps.add("git", self._system_tasks.install_or_upgrade_git)
+        steps.add("git_status", self._git_tasks.show_git_status, after=["git"])
+        steps.add("backup", self._backup_tasks.backup_old_directories, after=["git_status"])
+        steps.add("backup_checker", self._backup_tasks.backup_checker, after=["backup"])
+
+        # The server, genie_python and the client install into separate directories
+        steps.add("server", self._server_tasks.install_ibex_server, after=["backup_checker"])
+        steps.add("virtual_envs", self._system_tasks.create_virtual_envs, after=["server"])
+        steps.add(
+            "icp",
+            lambda: self._server_tasks.update_icp(self.icp_in_labview_modules()),
+            after=["server"],
+        )
+        # uv could find genie_python's Python part way through being installed
+        steps.add("genie_python3", self._python_tasks.install_genie_python3, after=["virtual_envs"])
+        # MySQL is configured from files in the server
+        steps.add("mysql", self._mysql_tasks.install_mysql, after=["server"])
+        steps.add("vc_redist", self._system_tasks.install_or_upgrade_vc_redist, after=["mysql"])
+        steps.add("client", self._client_tasks.install_ibex_client, after=["backup_checker"])
+        # Checking out the release branch changes files the steps above use in the server
+        steps.add(
+            "release_branch",
+            self._git_tasks.checkout_to_release_branch,
+            after=["virtual_envs", "icp", "mysql"],
+        )
+        steps.add(
+            "configuration",
+            self._server_tasks.upgrade_instrument_configuration,
+            after=["release_branch", "genie_python3"],
+        )
+        # Upgrading the configuration clones the shared scripts if they are missing
+        steps.add(
+            "shared_scripts",
+            self._server_tasks.update_shared_scripts_repository,
+            after=["configuration"],
+        )
+        steps.add(
+            "calibrations",
+            self._server_tasks.update_calibrations_repository,
+            after=["backup_checker"],
+        )
+
+        # Hotfixes are applied over everything installed, and the rest run in turn after them
+        steps.add(
+            "hotfixes",
+            self._system_tasks.clear_or_reapply_hotfixes,
+            after=["client", "vc_redist", "calibrations", "shared_scripts"],
+        )
+        steps.add(
+            "script_definitions", self._python_tasks.update_script_definitions, after=["hotfixes"]
+        )
+        steps.add(
+            "script_githooks",
+            self._python_tasks.remove_instrument_script_githooks,
+            after=["script_definitions"],
+        )
+        steps.add("log_rotation", self._server_tasks.setup_log_rotation, after=["script_githooks"])
+        steps.add(
+            "journal_parser", self._server_tasks.update_journal_parser, after=["log_rotation"]
+        )
+        steps.add("kafka_topics", self._system_tasks.update_kafka_topics, after=["journal_parser"])
+        steps.run()
 
     def run_instrument_deploy_pre_stop(self) -> None:
         """Upgrade an instrument. Steps to do before ibex is stopped.
@@ -0,0 +1,117 @@
+"""
+Rate limiting of disk reads, so a backup can run on a live instrument without starving the
+IOCs and the MySQL archiver of disk bandwidth.
+"""
+
+import threading
+import time
+
+THROTTLED_READ_SIZE = 1024**2
+"""Size of the reads made when throttled, small enough that reads are not bursty"""
+
+READ_OVERHEAD_BYTES = 256 * 1024
+"""
+Fixed cost of a read, whatever its size, as the number of bytes which could be read in the
+same time. Latencies are compared per byte with this added, so small reads, e.g. of the
+files in autosave or a configuration, aren't taken as a sign the disk is busy.
+"""
+
+
+class IOThrottle:
+    """
+    Limits the rate at which bytes are read, shared between any number of threads.
+
+    Works as a token bucket holding at most one second's worth of reads. If adaptive, the
+    rate also backs off (halving, down to `min_bytes_per_second`) whenever the average read
+    latency, scaled to a read of `THROTTLED_READ_SIZE` bytes, goes above `target_latency`,
+    which is a sign the disk is busy with other work, and creeps back up towards the ceiling
+    while reads are quick.
+    """
+
+    def __init__(
+        self,
+        max_bytes_per_second: float,
+        adaptive: bool = False,
+        target_latency: float = 0.05,
+        min_bytes_per_second: float = 1024**2,
+    ) -> None:
+        """
+        Args:
+            max_bytes_per_second: ceiling on the read rate
+            adaptive: whether to back off when reads are slow
+            target_latency: average time in seconds a read of `THROTTLED_READ_SIZE` bytes
+             may take before backing off
+            min_bytes_per_second: floor on the read rate when backing off
+        """
+        self.max_bytes_per_second = max_bytes_per_second
+        self.bytes_per_second = max_bytes_per_second
+        """Current rate limit, below the ceiling if backed off"""
+        self._adaptive = adaptive
+        self._target_latency = target_latency
+        self._min_bytes_per_second = min(min_bytes_per_second, max_bytes_per_second)
+        self._latency = 0.0
+        self._allowance = float(max_bytes_per_second)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def read(self, f, size: int = -1) -> bytes:
+        """
+        Read from a file, in throttled blocks.
+
+        Args:
+            f: file opened for reading in binary mode
+            size: number of bytes to read, -1 to read to the end of the file
+        Returns:
+            The bytes read
+        """
+        blocks = []
+        while size != 0:
+            block_size = THROTTLED_READ_SIZE if size < 0 else min(size, THROTTLED_READ_SIZE)
+            start = time.monotonic()
+            block = f.read(block_size)
+            self.throttle(len(block), time.monotonic() - start)
+            if not block:
+                break
+            blocks.append(block)
+            if size > 0:
+                size -= len(block)
+        return b"".join(blocks)
+
+    def throttle(self, nbytes: int, latency: float | None = None) -> None:
+        """
+        Account for bytes which have been read, sleeping if they take the rate over the limit.
+
+        Args:
+            nbytes: the number of bytes read
+            latency: how long the read took in seconds, used when adaptive
+        """
+        with self._lock:
+            if self._adaptive and latency is not None and nbytes:
+                # Normalise to the time a throttled read would take, allowing for the fixed
+                # cost of each read so that small ones aren't stretched out, then smooth
+                latency *= (THROTTLED_READ_SIZE + READ_OVERHEAD_BYTES) / (
+                    nbytes + READ_OVERHEAD_BYTES
+                )
+                self._latency = 0.8 * self._latency + 0.2 * latency
+                if self._latency > self._target_latency:
+                    self.bytes_per_second = max(
+                        self.bytes_per_second / 2, self._min_bytes_per_second
+                    )
+                    self._latency = 0.0
+                else:
+                    self.bytes_per_second = min(
+                        self.bytes_per_second + THROTTLED_READ_SIZE, self.max_bytes_per_second
+                    )
+
+            now = time.monotonic()
+            self._allowance = min(
+                self._allowance + (now - self._last) * self.bytes_per_second,
+                self.bytes_per_second,
+            )
+            self._last = now
+            self._allowance -= nbytes
+            # Sleep while holding the lock so the threads queue up behind each other
+            if self._allowance < 0:
+                time.sleep(-self._allowance / self.bytes_per_second)
+                self._allowance = 0.0
+                self._last = time.monotonic()
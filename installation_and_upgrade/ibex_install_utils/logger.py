@@ -42,6 +42,10 @@ class Logger:
             self.log.write("[concealed]\n")
         return self.console.write(message)
 
+    def write_to_console(self, message: str) -> int:
+        """Write a message which is not worth logging, e.g. a progress bar being redrawn"""
+        return self.console.write(message)
+
     def flush(self) -> None:
         self.console.flush()
         self.log.flush()
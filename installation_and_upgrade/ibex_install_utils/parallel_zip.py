@@ -0,0 +1,760 @@
+"""
+Parallel writing and verification of zip archives.
+
+Members are read and compressed by a pool of worker threads (zlib releases the GIL while
+deflating) and appended to the archive in submission order by the calling thread, so the
+result is a standard zip file readable by `zipfile` or any other unzip tool. Files which are
+already compressed (see `CompressionPolicy`) are stored rather than deflated.
+
+A sidecar manifest of the size and crc of every member can be written alongside an archive,
+and later used to verify the archive, either fully or by sampling its members. Archives are
+also extracted in parallel, see `extract_zip`.
+
+While an archive is being written a journal of the members committed so far can be kept
+(see `ZipJournal`), so that if writing fails it can be resumed rather than started again.
+"""
+
+import fnmatch
+import gzip
+import json
+import os
+import random
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterable, NamedTuple
+
+from ibex_install_utils.io_throttle import IOThrottle
+
+CHUNK_SIZE = 8 * 1024**2
+"""Files larger than this are split into chunks which are deflated independently."""
+
+ZIP_MANIFEST_EXTENSION = ".members.json.gz"
+"""Extension of the sidecar manifest of a zip file, e.g. `EPICS.zip.members.json.gz`"""
+
+STORE_ONLY_EXTENSIONS = frozenset(
+    {
+        ".7z",
+        ".bz2",
+        ".gif",
+        ".gz",
+        ".jar",
+        ".jpeg",
+        ".jpg",
+        ".msi",
+        ".png",
+        ".tgz",
+        ".war",
+        ".whl",
+        ".xz",
+        ".zip",
+        ".zst",
+    }
+)
+"""Extensions of files which are already compressed, so are stored without deflating them."""
+
+ZIP_JOURNAL_EXTENSION = ".journal"
+"""Extension of the journal of a zip file being written, e.g. `EPICS.zip.journal`"""
+
+_READ_SIZE = 1024**2
+
+_CRC32_POLYNOMIAL = 0xEDB88320
+
+
+class _CompressedChunk(NamedTuple):
+    data: bytes
+    crc: int
+    length: int
+    stored: bool
+    seconds: float
+
+
+class CompressionPolicy:
+    """
+    Decides which files are worth deflating.
+
+    Files with an extension in `store_extensions` are always stored. Other files are probed
+    by deflating their first block at the fastest level: if that saves less than
+    `min_saving` of the block the contents look random, as compressed data does, and the
+    file is stored.
+    """
+
+    def __init__(
+        self,
+        store_extensions: Iterable[str] = STORE_ONLY_EXTENSIONS,
+        probe_size: int = 64 * 1024,
+        min_saving: float = 0.05,
+    ) -> None:
+        """
+        Args:
+            store_extensions: extensions, including the dot, of files to always store
+            probe_size: size in bytes of the block deflated to probe whether a file compresses
+            min_saving: fraction of the probe block deflate must save for a file to be deflated
+        """
+        self.store_extensions = frozenset(extension.lower() for extension in store_extensions)
+        self.probe_size = probe_size
+        self.min_saving = min_saving
+
+    def store_by_name(self, path: str) -> bool:
+        """Whether the file should be stored because of its extension"""
+        return os.path.splitext(path)[1].lower() in self.store_extensions
+
+    def probe(self, data: bytes) -> bytes | None:
+        """
+        Deflate the start of some data to see whether it compresses.
+
+        Args:
+            data: the data, only the first `probe_size` bytes are deflated
+        Returns:
+            The deflated probe block if the data compresses, else None
+        """
+        block = data[: self.probe_size]
+        compressor = zlib.compressobj(1, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = compressor.compress(block) + compressor.flush()
+        if len(compressed) > len(block) * (1 - self.min_saving):
+            return None
+        return compressed
+
+    def probe_file(self, path: str) -> bool:
+        """Whether the first block of a file compresses, see `probe`"""
+        with open(path, "rb") as f:
+            return self.probe(f.read(self.probe_size)) is not None
+
+
+class CompressionStats:
+    """Counts of the files a `ParallelZipWriter` stored rather than deflated"""
+
+    def __init__(self) -> None:
+        self.stored_files = 0
+        self.stored_bytes = 0
+        self.deflated_bytes = 0
+        self.deflate_seconds = 0.0
+
+    @property
+    def seconds_saved(self) -> float:
+        """Estimate of the compression time saved by storing files, from the deflate rate"""
+        if not self.deflated_bytes:
+            return 0.0
+        return self.stored_bytes * self.deflate_seconds / self.deflated_bytes
+
+
+def _gf2_matrix_times(matrix: list[int], vector: int) -> int:
+    total = 0
+    row = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[row]
+        vector >>= 1
+        row += 1
+    return total
+
+
+def _gf2_matrix_square(matrix: list[int]) -> list[int]:
+    return [_gf2_matrix_times(matrix, row) for row in matrix]
+
+
+@lru_cache(maxsize=64)
+def _crc32_zeros_operator(length: int) -> tuple[int, ...]:
+    """Matrix which advances a crc32 over `length` zero bytes (see zlib's crc32_combine)."""
+    odd = [_CRC32_POLYNOMIAL] + [1 << n for n in range(31)]  # one zero bit
+    even = _gf2_matrix_square(odd)  # two zero bits
+    odd = _gf2_matrix_square(even)  # four zero bits
+    operator = None
+    while length:
+        even = _gf2_matrix_square(odd)
+        if length & 1:
+            operator = even if operator is None else [_gf2_matrix_times(even, r) for r in operator]
+        length >>= 1
+        if not length:
+            break
+        odd = _gf2_matrix_square(even)
+        if length & 1:
+            operator = odd if operator is None else [_gf2_matrix_times(odd, r) for r in operator]
+        length >>= 1
+    return tuple(operator if operator is not None else [1 << n for n in range(32)])
+
+
+def crc32_combine(crc1: int, crc2: int, length2: int) -> int:
+    """
+    Combine two crc32 values as if the data had been checksummed in one pass.
+
+    Args:
+        crc1: crc32 of the first block of data
+        crc2: crc32 of the second block of data
+        length2: length in bytes of the second block of data
+    Returns:
+        The crc32 of the two blocks of data concatenated
+    """
+    if length2 == 0:
+        return crc1
+    return _gf2_matrix_times(list(_crc32_zeros_operator(length2)), crc1) ^ crc2
+
+
+def _read_and_compress(
+    path: str,
+    offset: int,
+    length: int,
+    level: int,
+    last: bool,
+    store: bool | None,
+    policy: CompressionPolicy,
+    throttle: IOThrottle | None,
+) -> _CompressedChunk:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length) if throttle is None else throttle.read(f, length)
+    crc = zlib.crc32(data)
+    start = time.perf_counter()
+    if store is None:
+        # Only single chunk files are probed here, multi chunk files are probed up front
+        # so that all of their chunks are treated the same
+        probed = policy.probe(data)
+        store = probed is None
+        if probed is not None and level == 1 and len(data) <= policy.probe_size:
+            return _CompressedChunk(probed, crc, len(data), False, time.perf_counter() - start)
+    if store:
+        return _CompressedChunk(data, crc, len(data), True, 0.0)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = compressor.compress(data)
+    # A sync flush ends the chunk on a byte boundary without marking the final block,
+    # so independently deflated chunks can be concatenated into a single deflate stream.
+    compressed += compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return _CompressedChunk(compressed, crc, len(data), False, time.perf_counter() - start)
+
+
+class ParallelZipWriter:
+    """
+    Write files to an open `zipfile.ZipFile` using a pool of compression threads.
+
+    Memory use is bounded: at most a few chunks per worker are held in memory at any one time.
+
+    `zipfile` has no public way to append data which is already compressed, so members are
+    written to the zip file's handle directly, after which `start_dir`, where `zipfile`
+    writes the central directory on closing, is moved past them. Nothing else may use the
+    zip file while `write_all` is running.
+    """
+
+    def __init__(
+        self,
+        zip_file: zipfile.ZipFile,
+        workers: int | None = None,
+        compresslevel: int = 1,
+        chunk_size: int = CHUNK_SIZE,
+        policy: CompressionPolicy | None = None,
+        throttle: IOThrottle | None = None,
+    ) -> None:
+        """
+        Args:
+            zip_file: zip file opened with mode "w" or "x", members will be appended to it
+            workers: number of compression threads, None to use the number of CPUs
+            compresslevel: deflate compression level
+            chunk_size: size in bytes of the independently compressed chunks of large files
+            policy: which files to store rather than deflate, None for the default policy
+            throttle: optional limit on the rate files are read at
+        """
+        if zip_file.mode not in ("w", "x"):
+            # Only then does zipfile write the central directory whatever has been added
+            raise ValueError(f"Zip file must be opened with mode 'w' or 'x', not '{zip_file.mode}'")
+        self._zip_file = zip_file
+        self._workers = max(1, workers or os.cpu_count() or 1)
+        self._compresslevel = compresslevel
+        self._chunk_size = chunk_size
+        self._policy = policy if policy is not None else CompressionPolicy()
+        self._throttle = throttle
+        self.stats = CompressionStats()
+        """Counts of the files stored rather than deflated so far"""
+
+    def write_all(
+        self,
+        members: Iterable[tuple[str, str, int, float]],
+        on_written: Callable[[str, zipfile.ZipInfo], None] | None = None,
+    ) -> None:
+        """
+        Compress and append files to the archive in the order given.
+
+        Args:
+            members: iterable of (path to file, name of member within the archive, size, mtime),
+             for example `file_utils.ManifestEntry`. The size and mtime are taken from the
+             caller so files are not stat'ed a second time.
+            on_written: optional callback called with the path and zip info of each member
+             once it has been written to the archive
+        """
+        max_in_flight = self._workers * 4
+        pending: deque[tuple[str, zipfile.ZipInfo, list[Future]]] = deque()
+        chunks_in_flight = 0
+
+        with ThreadPoolExecutor(
+            max_workers=self._workers, thread_name_prefix="zip_deflate"
+        ) as executor:
+            try:
+                for path, arcname, size, mtime in members:
+                    zinfo = self._zip_info(arcname, size, mtime)
+                    chunks = self._submit_chunks(executor, path, zinfo.file_size)
+                    pending.append((path, zinfo, chunks))
+                    chunks_in_flight += len(chunks)
+                    while chunks_in_flight > max_in_flight:
+                        chunks_in_flight -= self._write_next(pending, on_written)
+                while pending:
+                    self._write_next(pending, on_written)
+            except BaseException:
+                for _, _, chunks in pending:
+                    for chunk in chunks:
+                        chunk.cancel()
+                raise
+
+    @staticmethod
+    def _zip_info(arcname: str, size: int, mtime: float) -> zipfile.ZipInfo:
+        date_time = time.localtime(mtime)[:6]
+        # Clamp to the range of dates a zip file can store, like strict_timestamps=False
+        if date_time[0] < 1980:
+            date_time = (1980, 1, 1, 0, 0, 0)
+        elif date_time[0] > 2107:
+            date_time = (2107, 12, 31, 23, 59, 59)
+        zinfo = zipfile.ZipInfo(arcname, date_time)
+        zinfo.file_size = size
+        zinfo.external_attr = 0o100644 << 16
+        return zinfo
+
+    def _submit_chunks(self, executor: ThreadPoolExecutor, path: str, size: int) -> list[Future]:
+        number_of_chunks = max(1, -(-size // self._chunk_size))
+        store = None
+        if self._policy.store_by_name(path):
+            store = True
+        elif number_of_chunks > 1:
+            store = not self._policy.probe_file(path)
+        return [
+            executor.submit(
+                _read_and_compress,
+                path,
+                i * self._chunk_size,
+                self._chunk_size if i < number_of_chunks - 1 else -1,
+                self._compresslevel,
+                i == number_of_chunks - 1,
+                store,
+                self._policy,
+                self._throttle,
+            )
+            for i in range(number_of_chunks)
+        ]
+
+    def _write_next(
+        self,
+        pending: "deque[tuple[str, zipfile.ZipInfo, list[Future]]]",
+        on_written: Callable[[str, zipfile.ZipInfo], None] | None,
+    ) -> int:
+        path, zinfo, chunks = pending[0]
+        self._write_member(zinfo, chunks)
+        pending.popleft()
+        if on_written is not None:
+            on_written(path, zinfo)
+        return len(chunks)
+
+    def _write_member(self, zinfo: zipfile.ZipInfo, chunks: list[Future]) -> None:
+        zf = self._zip_file
+        zinfo.flag_bits = 0x00
+        first_chunk = chunks[0].result()
+        zinfo.compress_type = zipfile.ZIP_STORED if first_chunk.stored else zipfile.ZIP_DEFLATED
+
+        if zf.fp is None:
+            raise ValueError("Attempt to write to a zip file which has been closed")
+
+        if len(chunks) == 1:
+            # Everything is known up front so the header can be written in one go
+            chunk = first_chunk
+            self._count(chunk)
+            self._fill_in_sizes(zinfo, chunk.crc, chunk.length, len(chunk.data))
+            zip64 = self._needs_zip64(zinfo)
+            self._start_member(zinfo)
+            zf.fp.write(zinfo.FileHeader(zip64))
+            zf.fp.write(chunk.data)
+        else:
+            # Write a placeholder header and rewrite it once the sizes and crc are known,
+            # the same way zipfile does for streamed members
+            zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+            self._fill_in_sizes(zinfo, 0, 0, 0)
+            self._start_member(zinfo)
+            zf.fp.write(zinfo.FileHeader(zip64))
+            crc, file_size, compress_size = 0, 0, 0
+            for future in chunks:
+                chunk = future.result()
+                self._count(chunk)
+                zf.fp.write(chunk.data)
+                crc = crc32_combine(crc, chunk.crc, chunk.length)
+                file_size += chunk.length
+                compress_size += len(chunk.data)
+            self._fill_in_sizes(zinfo, crc, file_size, compress_size)
+            if not zip64 and self._needs_zip64(zinfo):
+                raise RuntimeError(f"File {zinfo.filename} grew too large while compressing")
+            end_of_member = zf.fp.tell()
+            zf.fp.seek(zinfo.header_offset)
+            zf.fp.write(zinfo.FileHeader(zip64))
+            zf.fp.seek(end_of_member)
+
+        zf.start_dir = zf.fp.tell()
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+
+        if first_chunk.stored:
+            self.stats.stored_files += 1
+
+    def _count(self, chunk: _CompressedChunk) -> None:
+        if chunk.stored:
+            self.stats.stored_bytes += chunk.length
+        else:
+            self.stats.deflated_bytes += chunk.length
+            self.stats.deflate_seconds += chunk.seconds
+
+    def _start_member(self, zinfo: zipfile.ZipInfo) -> None:
+        zf = self._zip_file
+        zf.fp.seek(zf.start_dir)
+        zinfo.header_offset = zf.fp.tell()
+
+    @staticmethod
+    def _fill_in_sizes(zinfo: zipfile.ZipInfo, crc: int, file_size: int, compress_size: int):
+        zinfo.CRC = crc
+        zinfo.file_size = file_size
+        zinfo.compress_size = compress_size
+
+    @staticmethod
+    def _needs_zip64(zinfo: zipfile.ZipInfo) -> bool:
+        return zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+
+
+class ZipMemberRecord(NamedTuple):
+    """The size and crc of a member of an archive, as recorded in a sidecar manifest"""
+
+    name: str
+    size: int
+    crc: int
+
+
+def write_zip_manifest(manifest_path: str, members: Iterable[zipfile.ZipInfo]) -> None:
+    """
+    Write the sidecar manifest of a zip file.
+
+    Args:
+        manifest_path: path to write the manifest to
+        members: zip info of each member of the zip file
+    """
+    write_member_manifest(
+        manifest_path, (ZipMemberRecord(m.filename, m.file_size, m.CRC) for m in members)
+    )
+
+
+def write_member_manifest(manifest_path: str, records: Iterable[ZipMemberRecord]) -> None:
+    """
+    Write the sidecar manifest of an archive, zip or otherwise.
+
+    Args:
+        manifest_path: path to write the manifest to
+        records: the name, size and crc of each member of the archive
+    """
+    with gzip.open(manifest_path, "wt", encoding="utf-8") as f:
+        json.dump({"members": [list(record) for record in records]}, f)
+
+
+def read_zip_manifest(manifest_path: str) -> list[ZipMemberRecord]:
+    """
+    Read the sidecar manifest of a zip file, or of another archive.
+
+    Args:
+        manifest_path: path to the manifest
+    Returns:
+        The records of each member of the zip file
+    """
+    with gzip.open(manifest_path, "rt", encoding="utf-8") as f:
+        return [ZipMemberRecord(*member) for member in json.load(f)["members"]]
+
+
+def _read_members(zip_path: str, names: list[str]) -> list[str]:
+    problems = []
+    with zipfile.ZipFile(zip_path) as zf:
+        for name in names:
+            try:
+                # zipfile checks the crc once the whole member has been read
+                with zf.open(name) as member:
+                    while member.read(_READ_SIZE):
+                        pass
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                problems.append(f"{name} is corrupt: {e}")
+    return problems
+
+
+def verify_zip(
+    zip_path: str,
+    manifest_path: str | None = None,
+    fraction: float = 1.0,
+    workers: int | None = None,
+) -> list[str]:
+    """
+    Verify a zip file.
+
+    The central directory is checked against the sidecar manifest, if there is one, which
+    only costs a read of the directory: every member recorded must be there and match, and
+    there must be no others. Then a random sample of `fraction` of the members
+    are decompressed and their crcs checked, spread across a pool of threads which each
+    read the archive through their own handle.
+
+    Args:
+        zip_path: path to the zip file
+        manifest_path: path to the sidecar manifest, or None to not check against one
+        fraction: fraction of the members to decompress and check, 1 to check them all
+            and 0 to only check the central directory
+        workers: number of threads used to read members, None to use the number of CPUs
+    Returns:
+        Descriptions of the problems found, empty if the zip file is OK
+    """
+    problems = []
+    with zipfile.ZipFile(zip_path) as zf:
+        members = {zinfo.filename: zinfo for zinfo in zf.infolist()}
+
+    if manifest_path is not None:
+        recorded = set()
+        for record in read_zip_manifest(manifest_path):
+            recorded.add(record.name)
+            zinfo = members.get(record.name)
+            if zinfo is None:
+                problems.append(f"{record.name} is missing")
+            elif zinfo.file_size != record.size or zinfo.CRC != record.crc:
+                problems.append(f"{record.name} does not match the manifest")
+        problems.extend(
+            f"{name} is not in the manifest" for name in members if name not in recorded
+        )
+
+    names = list(members)
+    if fraction < 1:
+        names = random.sample(names, round(len(names) * max(fraction, 0)))
+    if names:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(names)))
+        slices = [names[i::workers] for i in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zip_verify") as pool:
+            for slice_problems in pool.map(_read_members, [zip_path] * workers, slices):
+                problems.extend(slice_problems)
+    return problems
+
+
+def _extract_members(zip_path: str, dst: str, zinfos: list[zipfile.ZipInfo]) -> None:
+    with zipfile.ZipFile(zip_path) as zf:
+        for zinfo in zinfos:
+            path = zf.extract(zinfo, dst)
+            mtime = time.mktime(zinfo.date_time + (0, 0, -1))
+            os.utime(path, (mtime, mtime))
+
+
+def extract_zip(
+    zip_path: str, dst: str, patterns: list[str] | None = None, workers: int | None = None
+) -> int:
+    """
+    Extract a zip file in parallel, preserving modification times.
+
+    Members are spread across a pool of threads which each read the archive through their
+    own handle, largest members first so that one big file does not finish last on its own.
+
+    Args:
+        zip_path: path to the zip file
+        dst: directory to extract the zip file into
+        patterns: optional glob patterns of member names (e.g. `config/*`),
+            only matching members are extracted
+        workers: number of threads extracting members, None to use the number of CPUs
+    Returns:
+        The number of files extracted
+    """
+    with zipfile.ZipFile(zip_path) as zf:
+        zinfos = [
+            zinfo
+            for zinfo in zf.infolist()
+            if not patterns or any(fnmatch.fnmatchcase(zinfo.filename, p) for p in patterns)
+        ]
+    if not zinfos:
+        return 0
+
+    # Create the directories up front, zipfile creating them itself from several threads
+    # at once would race
+    directories = {
+        tuple(part for part in zinfo.filename.split("/")[:-1] if part not in ("", ".", ".."))
+        for zinfo in zinfos
+    }
+    for directory in directories:
+        os.makedirs(os.path.join(dst, *directory), exist_ok=True)
+
+    # Deal the members out by size, so each thread gets a similar amount of work
+    zinfos.sort(key=lambda zinfo: zinfo.file_size, reverse=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(zinfos)))
+    slices = [zinfos[i::workers] for i in range(workers)]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zip_extract") as pool:
+        list(pool.map(_extract_members, [zip_path] * workers, [dst] * workers, slices))
+    return len(zinfos)
+
+
+class _OwningZipFile(zipfile.ZipFile):
+    """A zip file which closes the handle it was given, as if it had opened the file itself"""
+
+    def close(self) -> None:
+        fp = self.fp
+        try:
+            super().close()
+        finally:
+            if fp is not None:
+                fp.close()
+
+
+class ZipJournal:
+    """
+    Journal of the members written to a zip file, so that writing it can be resumed.
+
+    Each line of the journal records a member which is completely written to the zip file,
+    along with the size and modification time of the file it came from. On resuming, the
+    zip file is truncated after the last journalled member whose file is unchanged, and the
+    central directory is rebuilt from the journal, so only the remaining files are written.
+
+    Entries are committed, zip file first, at most every `commit_interval` seconds so the
+    journal costs a couple of flushes a second however small the files are.
+    """
+
+    def __init__(self, zip_path: str, commit_interval: float = 1.0) -> None:
+        """
+        Args:
+            zip_path: path of the zip file, the journal is kept next to it
+            commit_interval: the longest time in seconds members can go unjournalled
+        """
+        self.zip_path = zip_path
+        self.path = zip_path + ZIP_JOURNAL_EXTENSION
+        self._commit_interval = commit_interval
+        self._zip_file: zipfile.ZipFile | None = None
+        self._journal = None
+        self._sources: dict[str, tuple[int, float]] = {}
+        self._uncommitted: list[str] = []
+        self._last_commit = 0.0
+
+    def open(
+        self, members: Iterable[tuple[str, str, int, float]], **kwargs
+    ) -> tuple[zipfile.ZipFile, list[zipfile.ZipInfo], list[tuple[str, str, int, float]]]:
+        """
+        Open the zip file for writing, keeping any members already written by an earlier
+        attempt whose files have not changed since.
+
+        Args:
+            members: iterable of (path to file, name of member within the archive, size,
+             mtime) of every file to be in the zip file, as for `ParallelZipWriter.write_all`
+            kwargs: other arguments for `zipfile.ZipFile`, e.g. compression
+        Returns:
+            The open zip file, the zip info of the members kept from the earlier attempt
+            and the members which still need writing, in their original order
+        """
+        members = list(members)
+        self._sources = {path: (size, mtime) for path, _, size, mtime in members}
+        kept = self._read_unchanged_entries()
+
+        if kept:
+            fp = open(self.zip_path, "r+b")
+            fp.truncate(kept[-1]["end"])
+        else:
+            fp = open(self.zip_path, "wb")
+        fp.seek(0, os.SEEK_END)
+        zf = _OwningZipFile(fp, "w", **kwargs)
+
+        zinfos = []
+        for entry in kept:
+            zinfo = zipfile.ZipInfo(entry["name"], tuple(entry["date_time"]))
+            zinfo.compress_type = entry["compress_type"]
+            zinfo.CRC = entry["crc"]
+            zinfo.file_size = entry["file_size"]
+            zinfo.compress_size = entry["compress_size"]
+            zinfo.header_offset = entry["header_offset"]
+            zinfo.external_attr = entry["external_attr"]
+            zf.filelist.append(zinfo)
+            zf.NameToInfo[zinfo.filename] = zinfo
+            zinfos.append(zinfo)
+
+        # Rewrite the journal so it only lists what is now in the zip file
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in kept)
+        os.replace(self.path + ".tmp", self.path)
+        self._journal = open(self.path, "a", encoding="utf-8")
+        self._zip_file = zf
+        self._last_commit = time.monotonic()
+
+        written = {entry["path"] for entry in kept}
+        return zf, zinfos, [member for member in members if member[0] not in written]
+
+    def _read_unchanged_entries(self) -> list[dict]:
+        try:
+            zip_size = os.path.getsize(self.zip_path)
+            journal = open(self.path, encoding="utf-8")
+        except FileNotFoundError:
+            return []
+        kept = []
+        with journal as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # torn write of the last line
+                if (
+                    self._sources.get(entry["path"]) != (entry["size"], entry["mtime"])
+                    or entry["end"] > zip_size
+                ):
+                    break
+                kept.append(entry)
+        return kept
+
+    def record(self, path: str, zinfo: zipfile.ZipInfo) -> None:
+        """
+        Record that a member has been written, for use as `ParallelZipWriter`'s on_written.
+
+        Args:
+            path: path of the file the member was written from
+            zinfo: zip info of the member
+        """
+        size, mtime = self._sources[path]
+        entry = {
+            "path": path,
+            "size": size,
+            "mtime": mtime,
+            "name": zinfo.filename,
+            "date_time": zinfo.date_time,
+            "compress_type": zinfo.compress_type,
+            "crc": zinfo.CRC,
+            "file_size": zinfo.file_size,
+            "compress_size": zinfo.compress_size,
+            "header_offset": zinfo.header_offset,
+            "external_attr": zinfo.external_attr,
+            "end": self._zip_file.start_dir,
+        }
+        self._uncommitted.append(json.dumps(entry) + "\n")
+        if time.monotonic() - self._last_commit >= self._commit_interval:
+            self.commit()
+
+    def commit(self) -> None:
+        """Flush the zip file, then journal the members written since the last commit"""
+        if self._uncommitted:
+            self._zip_file.fp.flush()
+            self._journal.writelines(self._uncommitted)
+            self._journal.flush()
+            self._uncommitted = []
+        self._last_commit = time.monotonic()
+
+    def close(self) -> None:
+        """Commit any outstanding entries and close the journal, keeping it for a resume"""
+        if self._journal is not None:
+            try:
+                self.commit()
+            except OSError:
+                # The zip file itself is failing, the members since the last commit
+                # will be written again on resuming
+                pass
+            finally:
+                self._journal.close()
+                self._journal = None
+
+    def remove(self) -> None:
+        """Close and delete the journal once the zip file is complete"""
+        self._uncommitted = []
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
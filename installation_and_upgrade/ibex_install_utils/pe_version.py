@@ -0,0 +1,140 @@
+"""
+Reads the file version of a Windows executable (PE file) from its `VS_VERSIONINFO` resource.
+
+Only the headers and the resource section are read, in file order, so the executable can be
+read straight out of a zip without extracting it: a zip member can only seek forward cheaply,
+as seeking back means decompressing again from the start. Works on any platform.
+"""
+
+import struct
+from typing import BinaryIO, NamedTuple
+
+_RT_VERSION = 16
+_RESOURCE_DIRECTORY_INDEX = 2
+_PE32_MAGIC = 0x10B
+_PE32_PLUS_MAGIC = 0x20B
+_FIXED_FILE_INFO_SIGNATURE = 0xFEEF04BD
+_SUBDIRECTORY_FLAG = 0x80000000
+_VERSION_INFO_KEY = "VS_VERSION_INFO".encode("utf-16-le") + b"\0\0"
+
+
+class PEFormatError(ValueError):
+    """
+    Exception if a file is not a PE file or has no readable version resource
+    """
+
+    pass
+
+
+class _Section(NamedTuple):
+    virtual_size: int
+    virtual_address: int
+    raw_size: int
+    raw_offset: int
+
+
+def _read(f: BinaryIO, offset: int, size: int) -> bytes:
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) != size:
+        raise PEFormatError(f"File ends at {offset + len(data)}, expected {size} bytes at {offset}")
+    return data
+
+
+def _resource_section(f: BinaryIO) -> tuple[bytes, int, int]:
+    """
+    Find and read the section holding the resources.
+
+    Returns:
+        The section's data, its virtual address and the virtual address of the resource root
+    """
+    if _read(f, 0, 2) != b"MZ":
+        raise PEFormatError("Not an executable, no MZ header")
+    (pe_offset,) = struct.unpack("<I", _read(f, 0x3C, 4))
+    header = _read(f, pe_offset, 24)
+    if header[:4] != b"PE\0\0":
+        raise PEFormatError("Not a PE file, no PE header")
+    number_of_sections, optional_header_size = struct.unpack_from("<H12xH", header, 6)
+
+    optional_header = _read(f, pe_offset + 24, optional_header_size)
+    (magic,) = struct.unpack_from("<H", optional_header)
+    if magic == _PE32_MAGIC:
+        directories_offset = 96
+    elif magic == _PE32_PLUS_MAGIC:
+        directories_offset = 112
+    else:
+        raise PEFormatError(f"Unknown optional header magic {magic:#x}")
+    (number_of_directories,) = struct.unpack_from("<I", optional_header, directories_offset - 4)
+    if number_of_directories <= _RESOURCE_DIRECTORY_INDEX:
+        raise PEFormatError("No resources")
+    resources_rva, resources_size = struct.unpack_from(
+        "<II", optional_header, directories_offset + 8 * _RESOURCE_DIRECTORY_INDEX
+    )
+    if resources_rva == 0 or resources_size == 0:
+        raise PEFormatError("No resources")
+
+    section_table = _read(f, pe_offset + 24 + optional_header_size, 40 * number_of_sections)
+    for i in range(number_of_sections):
+        section = _Section(*struct.unpack_from("<8xIIII", section_table, 40 * i))
+        size = max(section.virtual_size, section.raw_size)
+        if section.virtual_address <= resources_rva < section.virtual_address + size:
+            data = _read(f, section.raw_offset, section.raw_size)
+            return data, section.virtual_address, resources_rva
+    raise PEFormatError("No section holds the resources")
+
+
+def _find_version_resource(section: bytes, section_rva: int, root_rva: int) -> bytes:
+    """Walk the resource tree, type then name then language, to the first version resource"""
+    root = root_rva - section_rva
+
+    def entries(directory: int) -> list[tuple[int, int]]:
+        named, ids = struct.unpack_from("<HH", section, root + directory + 12)
+        start = root + directory + 16
+        return [struct.unpack_from("<II", section, start + 8 * i) for i in range(named + ids)]
+
+    directory = 0
+    for level in range(3):
+        if level == 0:
+            matching = [offset for name, offset in entries(directory) if name == _RT_VERSION]
+        else:
+            matching = [offset for _, offset in entries(directory)]
+        if not matching:
+            raise PEFormatError("No version resource")
+        offset = matching[0]
+        if level < 2:
+            if not offset & _SUBDIRECTORY_FLAG:
+                raise PEFormatError("Resource tree is malformed")
+            directory = offset & ~_SUBDIRECTORY_FLAG
+
+    data_rva, size = struct.unpack_from("<II", section, root + offset)
+    start = data_rva - section_rva
+    if start < 0 or start + size > len(section):
+        raise PEFormatError("Version resource is outside the resource section")
+    return section[start : start + size]
+
+
+def read_file_version(f: BinaryIO) -> str:
+    """
+    Read the file version of a PE file.
+
+    Args:
+        f: the file, opened in binary mode; anything seekable will do, e.g. a zip member
+         opened with `ZipFile.open` or an mmap
+    Returns:
+        The version as "major.minor.patch.build", from the fixed file info
+    Raises:
+        PEFormatError: if the file is not a PE file or has no version resource
+    """
+    try:
+        version_info = _find_version_resource(*_resource_section(f))
+        # VS_VERSIONINFO is three words, the key, padding to a 32-bit boundary then the
+        # VS_FIXEDFILEINFO
+        if version_info[6 : 6 + len(_VERSION_INFO_KEY)] != _VERSION_INFO_KEY:
+            raise PEFormatError("Version resource has no VS_VERSION_INFO")
+        fixed_info = (6 + len(_VERSION_INFO_KEY) + 3) & ~3
+        signature, _, ms, ls = struct.unpack_from("<IIII", version_info, fixed_info)
+    except struct.error as e:
+        raise PEFormatError(f"Headers or resources are truncated: {e}") from e
+    if signature != _FIXED_FILE_INFO_SIGNATURE:
+        raise PEFormatError("Version resource has no fixed file info")
+    return f"{ms >> 16}.{ms & 0xFFFF}.{ls >> 16}.{ls & 0xFFFF}"
@@ -0,0 +1,132 @@
+"""
+Reading the output of a process, e.g. a build which prints tens of thousands of lines.
+
+Output is read in chunks rather than line by line, and written to the console in batches at
+most every `CONSOLE_INTERVAL` seconds, so a chatty process costs a few writes a second rather
+than a write and a flush of the log per line. Only the last lines are kept in memory, to show
+what led up to a failure; the whole output can be kept in a file instead.
+"""
+
+import codecs
+import io
+import locale
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from typing import BinaryIO, Callable, Optional
+
+DEFAULT_TAIL_LINES = 100
+"""Number of lines of output kept to show if a process fails"""
+
+CONSOLE_INTERVAL = 0.1
+"""Seconds between writes of output to the console"""
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def _read_chunks(stream: BinaryIO, chunks: queue.Queue) -> None:
+    try:
+        while chunk := stream.read1(_CHUNK_SIZE):
+            chunks.put(chunk)
+    finally:
+        chunks.put(None)
+
+
+class ProcessOutput:
+    """
+    Reads the output of a process, echoing it to the console in batches and keeping its tail.
+    """
+
+    def __init__(
+        self,
+        tail_lines: int = DEFAULT_TAIL_LINES,
+        output_path: Optional[str] = None,
+        echo: bool = True,
+        prefix: str = "    > ",
+        interval: float = CONSOLE_INTERVAL,
+    ) -> None:
+        """
+        Args:
+            tail_lines: number of lines to keep from the end of the output
+            output_path: file to write all the output to, if any
+            echo: whether to write the output to the console
+            prefix: written before each line on the console
+            interval: seconds between writes to the console
+        """
+        self.tail: deque[str] = deque(maxlen=tail_lines)
+        self._output_path = output_path
+        self._echo = echo
+        self._prefix = prefix
+        self._interval = interval
+        self.output_bytes = 0
+        self._pending: list[str] = []
+        self._last_write = 0.0
+
+    def read(self, stream: BinaryIO, on_line: Optional[Callable[[str], None]] = None) -> None:
+        """
+        Read output until the process closes it.
+
+        Args:
+            stream: the process's output, opened in binary mode
+            on_line: called with each line of the output, without its line ending
+        """
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace"),
+            translate=True,
+        )
+        chunks: queue.Queue = queue.Queue()
+        threading.Thread(
+            target=_read_chunks, args=(stream, chunks), name="process_output", daemon=True
+        ).start()
+
+        output_file = open(self._output_path, "w") if self._output_path is not None else None
+        try:
+            partial = ""
+            while True:
+                try:
+                    chunk = chunks.get(timeout=self._interval)
+                except queue.Empty:
+                    # Quiet for a while, so show what there is
+                    self._write_pending()
+                    continue
+                if chunk is not None:
+                    self.output_bytes += len(chunk)
+                text = decoder.decode(chunk if chunk is not None else b"", final=chunk is None)
+                if output_file is not None:
+                    output_file.write(text)
+                lines = (partial + text).split("\n")
+                partial = lines.pop()
+                if chunk is None and partial:
+                    lines.append(partial)
+                for line in lines:
+                    self._line(line, on_line)
+                if chunk is None:
+                    break
+                if time.monotonic() - self._last_write >= self._interval:
+                    self._write_pending()
+        finally:
+            if output_file is not None:
+                output_file.close()
+            self._write_pending()
+
+    def _line(self, line: str, on_line: Optional[Callable[[str], None]]) -> None:
+        self.tail.append(line)
+        if self._echo:
+            self._pending.append(f"{self._prefix}{line}\n")
+        if on_line is not None:
+            self._write_pending()
+            on_line(line)
+
+    def _write_pending(self) -> None:
+        if self._pending:
+            sys.stdout.write("".join(self._pending))
+            sys.stdout.flush()
+            self._pending = []
+        self._last_write = time.monotonic()
+
+    @property
+    def last_line(self) -> str:
+        """The last line of the output, or an empty string if there was none"""
+        return self.tail[-1] if self.tail else ""
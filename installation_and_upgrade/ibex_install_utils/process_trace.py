@@ -0,0 +1,183 @@
+"""
+A trace of the external commands run during a deploy, to show which of them take the time.
+
+For each command run, its wall time, CPU time, peak memory, exit code and volume of output
+are appended to a JSON-lines file beside the deploy log. CPU time and memory are sampled, so
+they include the command's child processes (e.g. cmd running a batch file, or msiexec) but
+not anything done in the last sample interval before the command exits.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import psutil
+from ibex_install_utils.tasks.common_paths import VAR_DIR
+
+TRACE_DIRECTORY = os.path.join(VAR_DIR, "logs", "deploy")
+"""Directory the traces are written to, beside the deploy logs"""
+
+SAMPLE_INTERVAL = 0.5
+"""Seconds between samples of a command's CPU time and memory"""
+
+SUMMARY_ROWS = 15
+"""Number of programs shown in the summary"""
+
+
+class ProcessRecord(NamedTuple):
+    program: str
+    command: str
+    start: str
+    wall_time: float
+    cpu_time: float
+    peak_rss: int
+    exit_code: int
+    output_bytes: int
+
+
+class _Trace:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.records: list[ProcessRecord] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: ProcessRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+            try:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record._asdict()) + "\n")
+            except OSError:
+                pass  # the trace is only for information
+
+
+_trace: Optional[_Trace] = None
+
+
+def set_up(directory: str = TRACE_DIRECTORY) -> str:
+    """
+    Start tracing the commands run.
+
+    Args:
+        directory: directory to write the trace to
+    Returns:
+        The path of the trace
+    """
+    global _trace
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"PROCESSES-{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+    _trace = _Trace(path)
+    print(f"Process trace is {path}")
+    return path
+
+
+class ProcessMonitor:
+    """
+    Samples the resources used by a running command, and records them in the trace once it
+    has finished. Does nothing unless tracing has been set up.
+    """
+
+    def __init__(self, program: str, command: str, pid: int) -> None:
+        """
+        Args:
+            program: the program run, e.g. git.exe, to total runs of it by
+            command: the command, as shown in the trace
+            pid: id of the command's process
+        """
+        self._program = program
+        self._command = command
+        self._start = time.time()
+        self._started = time.monotonic()
+        self._cpu_times: dict[int, float] = {}
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+        if _trace is not None:
+            try:
+                self._process = psutil.Process(pid)
+            except psutil.Error:
+                return  # already finished
+            self._thread = threading.Thread(target=self._sample_until_stopped, daemon=True)
+            self._thread.start()
+
+    def _sample_until_stopped(self) -> None:
+        while True:
+            self._sample()
+            if self._stop.wait(SAMPLE_INTERVAL):
+                return
+
+    def _sample(self) -> None:
+        try:
+            processes = [self._process] + self._process.children(recursive=True)
+        except psutil.Error:
+            return
+        rss = 0
+        for process in processes:
+            try:
+                with process.oneshot():
+                    cpu = process.cpu_times()
+                    rss += process.memory_info().rss
+            except psutil.Error:
+                continue
+            # Keep the last CPU time seen of every process, as children come and go
+            self._cpu_times[process.pid] = cpu.user + cpu.system
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def stop(self) -> None:
+        """
+        Stop sampling without recording the command, e.g. if waiting for it failed. Does
+        nothing if it has already been stopped.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+
+    def finish(self, exit_code: int, output_bytes: int = 0) -> None:
+        """
+        Record the command, once it has finished.
+
+        Args:
+            exit_code: the command's exit code
+            output_bytes: size of the output read from the command
+        """
+        self.stop()
+        if _trace is None:
+            return
+        _trace.add(
+            ProcessRecord(
+                program=self._program,
+                command=self._command,
+                start=time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._start)),
+                wall_time=round(time.monotonic() - self._started, 3),
+                cpu_time=round(sum(self._cpu_times.values()), 3),
+                peak_rss=self.peak_rss,
+                exit_code=exit_code,
+                output_bytes=output_bytes,
+            )
+        )
+
+
+def print_summary() -> None:
+    """
+    Print the totals for each program run, those which took the longest first.
+    """
+    if _trace is None or not _trace.records:
+        return
+    records = _trace.records
+    print(f"Commands run: {len(records)}, see {_trace.path}")
+
+    totals: dict[str, list[float]] = {}
+    for record in records:
+        total = totals.setdefault(record.program, [0, 0.0, 0.0, 0])
+        total[0] += 1
+        total[1] += record.wall_time
+        total[2] += record.cpu_time
+        total[3] = max(total[3], record.peak_rss)
+
+    print(f"    {'Program':<30} {'Runs':>5} {'Wall (s)':>10} {'CPU (s)':>10} {'Peak (MB)':>10}")
+    for program, (runs, wall, cpu, peak) in sorted(
+        totals.items(), key=lambda item: item[1][1], reverse=True
+    )[:SUMMARY_ROWS]:
+        print(f"    {program:<30} {runs:>5} {wall:>10.1f} {cpu:>10.1f} {peak / 1024**2:>10.0f}")
@@ -1,4 +1,6 @@
 import sys
+import threading
+import time
 
 
 class ProgressBar:
@@ -9,27 +11,94 @@ class ProgressBar:
     and to change progress modify the value of progress accordingly.
     Progress value should be <= total value.
 
+    Alternatively reset() with the total number of files and bytes, then call update() as
+    each file is done. update() only redraws the bar every `min_interval` seconds, and shows
+    the throughput and time remaining. Redraws go only to the console, not the deploy log,
+    which gets just the final state of the bar, once. update() may be called from several
+    threads at once.
+
     """
 
-    def __init__(self):
+    def __init__(self, min_interval: float = 0.1):
+        """
+        Args:
+            min_interval: minimum time in seconds between redraws by update()
+        """
         self.total = 0
         self.width = 20
         self.progress = 0
+        self.total_bytes = 0
+        self.bytes_done = 0
+        self.min_interval = min_interval
+        self._start = time.monotonic()
+        self._last_print = 0.0
+        self._last_length = 0
+        self._finished = False
+        self._lock = threading.RLock()
 
-    def reset(self, total=None):
-        if total is not None:
-            self.total = total
-        self.progress = 0
+    def reset(self, total=None, total_bytes=None):
+        with self._lock:
+            if total is not None:
+                self.total = total
+            if total_bytes is not None:
+                self.total_bytes = total_bytes
+            self.progress = 0
+            self.bytes_done = 0
+            self._start = time.monotonic()
+            self._last_print = 0.0
+            self._last_length = 0
+            self._finished = False
+
+    def update(self, files: int = 1, nbytes: int = 0) -> None:
+        """
+        Record progress, redrawing the bar if it hasn't been redrawn recently.
+
+        Args:
+            files: number of files done
+            nbytes: number of bytes done
+        """
+        with self._lock:
+            self.progress += files
+            self.bytes_done += nbytes
+            if self._finished:
+                return
+            now = time.monotonic()
+            if self.progress >= self.total or now - self._last_print >= self.min_interval:
+                self._last_print = now
+                self.print()
+
+    def _rate_and_eta(self) -> str:
+        seconds = time.monotonic() - self._start
+        if self.total_bytes == 0 or seconds <= 0:
+            return ""
+        rate = self.bytes_done / seconds
+        text = f" {rate / 1024**2:.1f} MB/s"
+        if self.progress < self.total and rate > 0:
+            eta = int((self.total_bytes - self.bytes_done) / rate)
+            text += f", ETA {eta // 60}:{eta % 60:02d}"
+        return text
 
     def print(self):
         """Print/Update progress line on standard output"""
+        with self._lock:
+            self._print()
+
+    def _print(self):
         if self.total != 0:
             percent = self.progress / self.total
             arrow = "=" * int(round(self.width * percent))
             spaces = " " * (self.width - len(arrow))
-            sys.stdout.write(
-                f"\rProgress: [{arrow + spaces}] {int(percent * 100)}% ({self.progress} / {self.total})"
+            line = (
+                f"\rProgress: [{arrow + spaces}] {int(percent * 100)}% "
+                f"({self.progress} / {self.total}){self._rate_and_eta()}"
             )
-            if self.progress == self.total:
-                sys.stdout.write("\n")
+            # Blank out the end of a longer previous line
+            line, self._last_length = line.ljust(self._last_length), len(line)
+            if self.progress >= self.total:
+                sys.stdout.write(line + "\n")
+                self._last_length = 0
+                self._finished = True
+            else:
+                # Intermediate states of the bar would only clutter the deploy log
+                getattr(sys.stdout, "write_to_console", sys.stdout.write)(line)
             sys.stdout.flush()
@@ -2,11 +2,14 @@
 Running processes infrastructure.
 """
 
+import asyncio
 import os
 import subprocess
-from typing import IO, List, Optional, Union
+from typing import IO, Callable, List, Optional, Sequence, Union
 
+from ibex_install_utils import task_profile
 from ibex_install_utils.exceptions import ErrorInRun
+from ibex_install_utils.process_output import DEFAULT_TAIL_LINES, ProcessOutput
 
 
 class RunProcess:
@@ -30,6 +33,8 @@ class RunProcess:
         capture_last_output: bool = False,
         progress_metric: Optional[List[str]] = None,
         env: dict | None = None,
+        tail_lines: int = DEFAULT_TAIL_LINES,
+        output_path: Optional[str] = None,
     ) -> None:
         """
         Create a process that needs running
@@ -54,6 +59,10 @@ class RunProcess:
                 count, the 100% value, and optionally a label for printing progress
             env: Environment variable mapping to pass to subprocess.POpen.
             Passing None inherits the parent process' environment.
+            tail_lines: Number of lines from the end of the output to show if the command fails,
+            while pipes are captured.
+            output_path: File to keep the whole output of the command in, while pipes are
+            captured.
         """
         self._working_dir = working_dir
         self._bat_file = executable_file
@@ -63,6 +72,10 @@ class RunProcess:
         self._stdin = std_in
         self._capture_last_output = capture_last_output
         self.captured_output = ""
+        self.output_tail: List[str] = []
+        self._tail_lines = tail_lines
+        self._output_path = output_path
+        self._output_bytes = 0
         self._progress_metric = progress_metric if progress_metric is not None else []
         self._env = env
         if isinstance(expected_return_codes, int):
@@ -85,23 +98,27 @@ class RunProcess:
         Returns:
         Raises ErrorInRun: if there is a known problem with the run
         """
-        try:
-            command_line = [self._full_path_to_process_file]
-            if self._prog_args is not None:
-                command_line.extend(self._prog_args)
+        with task_profile.span(*self._span()):
+            self._run()
 
-            if self.log_command_args:
-                print("    Running {} ...".format(" ".join(command_line)))
-            else:
-                print(f"    Running {self._bat_file} ... (command arguments hidden)")
+    def _run(self) -> None:
+        try:
+            command_line = self._command_line()
+            self._print_running(command_line)
 
             if not self._capture_pipes:
-                if self._stdin:
-                    error_code = subprocess.call(
-                        command_line, cwd=self._working_dir, stdin=self._stdin
-                    )
-                else:
-                    error_code = subprocess.call(command_line, cwd=self._working_dir)
+                with subprocess.Popen(
+                    command_line, cwd=self._working_dir, stdin=self._stdin
+                ) as process:
+                    monitor = self._monitor(command_line, process.pid)
+                    try:
+                        error_code = process.wait()
+                    except:  # As subprocess.call, don't leave the process running
+                        process.kill()
+                        raise
+                    finally:
+                        monitor.stop()
+                monitor.finish(error_code)
                 if (
                     self._expected_return_codes is not None
                     and error_code not in self._expected_return_codes
@@ -116,7 +133,12 @@ class RunProcess:
                     stdin=subprocess.PIPE,
                     env=self._env,
                 )
-                output_lines, err = output.communicate(b" ")
+                monitor = self._monitor(command_line, output.pid)
+                try:
+                    output_lines, err = output.communicate(b" ")
+                finally:
+                    monitor.stop()
+                monitor.finish(output.returncode, len(output_lines))
                 for line in output_lines.splitlines():
                     print(f"    > {line}")
                 if (
@@ -130,19 +152,26 @@ class RunProcess:
                     cwd=self._working_dir,
                     stdout=subprocess.PIPE,
                     stderr=subprocess.STDOUT,
-                    universal_newlines=True,
                 )
-                if len(self._progress_metric) < 2:
-                    self.output_no_progress(process)
-                else:
-                    self.output_progress(process)
-                process.stdout.close()
-                return_code = process.wait()
+                monitor = self._monitor(command_line, process.pid)
+                try:
+                    if len(self._progress_metric) < 2:
+                        self.output_no_progress(process)
+                    else:
+                        self.output_progress(process)
+                    process.stdout.close()
+                    return_code = process.wait()
+                finally:
+                    # Stop sampling even if reading the output fails
+                    monitor.stop()
+                monitor.finish(return_code, self._output_bytes)
                 if (
                     self._expected_return_codes is not None
                     and return_code not in self._expected_return_codes
                 ):
-                    raise subprocess.CalledProcessError(return_code, command_line)
+                    raise subprocess.CalledProcessError(
+                        return_code, command_line, output="\n".join(self.output_tail)
+                    )
 
             print("    ... finished")
         except subprocess.CalledProcessError as ex:
@@ -167,31 +196,189 @@ class RunProcess:
                 f" (expected {self._expected_return_codes})"
             )
         except WindowsError as ex:
-            if ex.errno == 2:
-                raise ErrorInRun(f"Command '{self._bat_file}' not found in '{self._working_dir}'")
-            elif ex.errno == 22:
-                raise ErrorInRun(
-                    f"Directory not found to run command '{self._bat_file}',"
-                    f" command is in :  '{self._working_dir}'"
-                )
+            self._raise_if_not_found(ex)
             raise ex
 
-    def output_no_progress(self, process: subprocess.Popen) -> None:
-        if process.stdout is None or process.stdout is None:
+    def _command_line(self) -> List[str]:
+        command_line = [self._full_path_to_process_file]
+        if self._prog_args is not None:
+            command_line.extend(self._prog_args)
+        return command_line
+
+    def _span(self) -> tuple[str, str]:
+        """Name and category of the span recording the time the process took"""
+        if self.log_command_args:
+            name = " ".join([os.path.basename(self._bat_file)] + (self._prog_args or []))
+        else:
+            name = os.path.basename(self._bat_file)
+        return name, task_profile.PROCESS
+
+    def _monitor(self, command_line: List[str], pid: int):
+        """Monitor the resources used by the process, for the process trace"""
+        # process_trace uses tasks.common_paths, and tasks uses RunProcess (through FileUtils),
+        # so it can't be imported at the top
+        from ibex_install_utils.process_trace import ProcessMonitor
+
+        command = " ".join(command_line) if self.log_command_args else self._bat_file
+        return ProcessMonitor(os.path.basename(self._bat_file), command, pid)
+
+    def _print_running(self, command_line: List[str]) -> None:
+        if self.log_command_args:
+            print("    Running {} ...".format(" ".join(command_line)))
+        else:
+            print(f"    Running {self._bat_file} ... (command arguments hidden)")
+
+    def _raise_if_not_found(self, ex: OSError) -> None:
+        if ex.errno == 2:
+            raise ErrorInRun(f"Command '{self._bat_file}' not found in '{self._working_dir}'")
+        elif ex.errno == 22:
+            raise ErrorInRun(
+                f"Directory not found to run command '{self._bat_file}',"
+                f" command is in :  '{self._working_dir}'"
+            )
+
+    async def run_async(self) -> None:
+        """
+        Run the process without blocking, e.g. alongside others with `run_many`.
+
+        Pipes must be captured. The output is printed in one block once the process has
+        finished, so the output of processes running at the same time isn't interleaved.
+
+        Raises ErrorInRun: if there is a known problem with the run
+        """
+        if not self._capture_pipes:
+            raise NotImplementedError("Running asynchronously needs the pipes captured.")
+        # Processes run at the same time by asyncio share a thread, so each has its own lane
+        with task_profile.span(*self._span(), lane=task_profile.new_lane()):
+            await self._run_async()
+
+    async def _run_async(self) -> None:
+        command_line = self._command_line()
+        self._print_running(command_line)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command_line,
+                cwd=self._working_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.PIPE if self._press_any_key else subprocess.DEVNULL,
+                # As for run, which only uses the environment given when pressing a key
+                env=self._env if self._press_any_key else None,
+            )
+        except OSError as ex:
+            self._raise_if_not_found(ex)
+            raise ex
+        monitor = self._monitor(command_line, process.pid)
+        try:
+            output, _ = await process.communicate(b" " if self._press_any_key else None)
+        finally:
+            # Stop sampling even if the run is cancelled
+            monitor.stop()
+        monitor.finish(process.returncode, len(output))
+        output_lines = output.decode(errors="replace").splitlines()
+        if self._output_path is not None:
+            with open(self._output_path, "w") as f:
+                f.writelines(f"{line}\n" for line in output_lines)
+        self.output_tail = output_lines[-self._tail_lines :]
+
+        name = " ".join(command_line) if self.log_command_args else self._bat_file
+        if process.returncode not in self._expected_return_codes:
+            print(
+                f"Process {name} failed with return code {process.returncode}"
+                f" (expected {self._expected_return_codes}). "
+                f"Output was: "
+            )
+            for line in self.output_tail:
+                print(f"    > {line}")
+            print(" --- ")
+            raise ErrorInRun(
+                f"Command failed with return code {process.returncode}"
+                f" (expected {self._expected_return_codes})"
+            )
+
+        print(f"    Output of {name}:")
+        if len(self._progress_metric) < 2:
+            for line in output_lines:
+                print(f"    > {line}")
+        else:
+            label = self._progress_metric[2] if len(self._progress_metric) > 2 else ""
+            count = sum(self._progress_metric[1] in line for line in output_lines)
+            print(f"{label}{count}/{self._progress_metric[0]}")
+        if self._capture_last_output and output_lines:
+            self.captured_output = output_lines[-1]
+        print("    ... finished")
+
+    def _read_output(
+        self,
+        process: subprocess.Popen,
+        echo: bool = True,
+        on_line: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        if process.stdout is None:
             raise Exception(f"No output from process {process}")
-        for stdout_line in iter(process.stdout.readline, ""):
-            print(f"    > {stdout_line}")
+        output = ProcessOutput(self._tail_lines, self._output_path, echo=echo)
+        try:
+            output.read(process.stdout, on_line)
+        finally:
+            self.output_tail = list(output.tail)
+            self._output_bytes = output.output_bytes
             if self._capture_last_output:
-                self.captured_output = stdout_line
+                self.captured_output = output.last_line
+
+    def output_no_progress(self, process: subprocess.Popen) -> None:
+        self._read_output(process)
 
     def output_progress(self, process: subprocess.Popen) -> None:
-        if process.stdout is None or process.stdout is None:
-            raise Exception(f"No output from process {process}")
         count = 0
         label = ""
         if len(self._progress_metric) > 2:
             label = self._progress_metric[2]
-        for stdout_line in iter(process.stdout.readline, ""):
-            if self._progress_metric[1] in stdout_line:
+
+        def _count(line: str) -> None:
+            nonlocal count
+            if self._progress_metric[1] in line:
                 count = count + 1
                 print(f"{label}{count}/{self._progress_metric[0]}")
+
+        self._read_output(process, echo=False, on_line=_count)
+
+
+async def _run_group(
+    group: Sequence[RunProcess], limit: asyncio.Semaphore, failed: list[ErrorInRun]
+) -> None:
+    async with limit:
+        for process in group:
+            if failed:
+                return
+            try:
+                await process.run_async()
+            except ErrorInRun as ex:
+                failed.append(ex)
+
+
+async def _run_many(
+    processes: Sequence[Union[RunProcess, Sequence[RunProcess]]], max_concurrency: int
+) -> None:
+    limit = asyncio.Semaphore(max_concurrency)
+    failed: list[ErrorInRun] = []
+    groups = [[process] if isinstance(process, RunProcess) else process for process in processes]
+    await asyncio.gather(*(_run_group(group, limit, failed) for group in groups))
+    if failed:
+        raise failed[0]
+
+
+def run_many(
+    processes: Sequence[Union[RunProcess, Sequence[RunProcess]]], max_concurrency: int = 4
+) -> None:
+    """
+    Run processes at the same time, see `RunProcess.run_async`.
+
+    Once a process fails no more are started, but those already running are left to finish.
+
+    Args:
+        processes: the processes to run; a list of processes in place of a process is run one
+         after another, e.g. where each process relies on the one before
+        max_concurrency: the most processes, or lists of processes, to run at once
+    Raises ErrorInRun: with the first problem with a run
+    """
+    asyncio.run(_run_many(processes, max_concurrency))
@@ -0,0 +1,246 @@
+"""
+Snapshot backups: a backed up directory as a tree of links to the original files.
+
+Where the backup is on the same volume as the directory being backed up, nothing needs to be
+copied or compressed. Each file is cloned (a copy-on-write reflink, on filesystems which
+support them) or, if hard links are allowed, hard linked, so a backup finishes in seconds
+and only costs disk space once the original files change. Where neither is possible, e.g.
+the backup is on another volume, files are copied.
+
+A hard link is the same file as the original, so it is only safe for directories which are
+removed once they are backed up. Any directory which is kept has files changed or overwritten
+in place, which would change the backup too: Settings as the instrument runs, and even the
+installation being upgraded, as the new version is installed over it.
+
+A manifest of the path, size and mtime of every file is written next to the snapshot once it
+is complete, e.g. `EPICS.snapshot.json.gz` for the snapshot directory `EPICS`.
+"""
+
+import errno
+import fnmatch
+import gzip
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, NamedTuple
+
+SNAPSHOT_MANIFEST_EXTENSION = ".snapshot.json.gz"
+"""Extension of the manifest written next to a snapshot directory"""
+
+_FICLONE = 0x40049409
+"""Linux ioctl to reflink one file to another"""
+
+_MANIFEST_FORMAT_VERSION = 1
+
+_MTIME_TOLERANCE = 2.0
+"""Seconds modification times may differ by, as FAT and some shares only keep even seconds"""
+
+_CANNOT_LINK = (errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY)
+"""Errors meaning a filesystem doesn't support linking the files, rather than a failure"""
+
+
+class SnapshotFile(NamedTuple):
+    """A file recorded in a snapshot manifest"""
+
+    path: str
+    """Path of the file relative to the snapshot directory, with / separators"""
+    size: int
+    """Size of the file in bytes"""
+    mtime: float
+    """Modification time of the file in seconds since the epoch"""
+
+
+def read_snapshot_manifest(manifest_path: str) -> list[SnapshotFile]:
+    """
+    Read a snapshot manifest.
+
+    Args:
+        manifest_path: path to the manifest
+    Returns:
+        The files listed in the manifest
+    """
+    with gzip.open(manifest_path, "rt", encoding="utf-8") as f:
+        manifest = json.load(f)
+    return [SnapshotFile(*entry) for entry in manifest["files"]]
+
+
+def write_snapshot_manifest(manifest_path: str, files: Iterable[SnapshotFile]) -> None:
+    """
+    Write a snapshot manifest, replacing the manifest atomically if it already exists.
+
+    Args:
+        manifest_path: path to the manifest
+        files: the files to list in the manifest
+    """
+    temp_path = manifest_path + ".tmp"
+    with gzip.open(temp_path, "wt", encoding="utf-8") as f:
+        json.dump({"version": _MANIFEST_FORMAT_VERSION, "files": [list(file) for file in files]}, f)
+    os.replace(temp_path, manifest_path)
+
+
+def snapshot_path(manifest_path: str) -> str:
+    """Path of the snapshot directory a manifest is for"""
+    return manifest_path[: -len(SNAPSHOT_MANIFEST_EXTENSION)]
+
+
+def same_volume(path: str, other: str) -> bool:
+    """Whether two existing paths are on the same volume, so can be hard linked"""
+    return os.stat(path).st_dev == os.stat(other).st_dev
+
+
+def _reflink(src: str, dst: str) -> None:
+    if os.name == "nt":
+        # Only ReFS supports block cloning on Windows, NTFS does not
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported", dst)
+    import fcntl
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+
+class _Linker:
+    """
+    Links or copies files into a snapshot, falling back to the next method for the rest of
+    the snapshot once one turns out not to be supported.
+    """
+
+    def __init__(self, hard_links: bool) -> None:
+        self._methods = {"reflink", "hard link"} if hard_links else {"reflink"}
+        self._lock = threading.Lock()
+        self.counts = {"reflink": 0, "hard link": 0, "copy": 0}
+
+    def link(self, src: str, dst: str) -> None:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.lexists(dst):
+            # Left by an earlier attempt at the snapshot
+            os.remove(dst)
+        used = "copy"
+        for method in ("reflink", "hard link"):
+            if method not in self._methods:
+                continue
+            try:
+                if method == "reflink":
+                    _reflink(src, dst)
+                else:
+                    os.link(src, dst)
+                used = method
+                break
+            except OSError as e:
+                if e.errno not in _CANNOT_LINK:
+                    raise
+                if os.path.lexists(dst):
+                    os.remove(dst)
+                self._methods.discard(method)
+        else:
+            shutil.copy2(src, dst)
+        with self._lock:
+            self.counts[used] += 1
+
+
+def snapshot_tree(
+    manifest: Iterable[tuple[str, str, int, float]],
+    dst: str,
+    hard_links: bool = False,
+    workers: int | None = None,
+    on_linked: Callable[[str, int], None] | None = None,
+) -> dict[str, int]:
+    """
+    Snapshot a directory, then write the snapshot's manifest.
+
+    Args:
+        manifest: iterable of (path to file, path within the snapshot, size, mtime),
+         for example `file_utils.ManifestEntry`
+        dst: snapshot directory to create
+        hard_links: whether files may be hard linked, only if the original files won't be
+         changed in place
+        workers: number of threads linking files, None to use the number of CPUs
+        on_linked: optional callback called with the path and size of each file once it is
+         in the snapshot
+    Returns:
+        The number of files reflinked, hard linked and copied
+    """
+    entries = list(manifest)
+    linker = _Linker(hard_links)
+
+    def _link(entry: tuple[str, str, int, float]) -> None:
+        path, relpath, size, _ = entry
+        linker.link(path, os.path.join(dst, relpath))
+        if on_linked is not None:
+            on_linked(path, size)
+
+    os.makedirs(dst, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot") as pool:
+        for _ in pool.map(_link, entries):
+            pass
+
+    write_snapshot_manifest(
+        dst + SNAPSHOT_MANIFEST_EXTENSION,
+        (
+            SnapshotFile(relpath.replace(os.sep, "/"), size, mtime)
+            for _, relpath, size, mtime in entries
+        ),
+    )
+    return linker.counts
+
+
+def verify_snapshot(manifest_path: str) -> list[str]:
+    """
+    Check that every file in a snapshot's manifest is in the snapshot, with the same size and
+    modification time.
+
+    Args:
+        manifest_path: path to the snapshot's manifest
+    Returns:
+        Descriptions of the problems found, empty if the snapshot is OK
+    """
+    root = snapshot_path(manifest_path)
+    problems = []
+    for snapshot_file in read_snapshot_manifest(manifest_path):
+        try:
+            stat = os.stat(os.path.join(root, *snapshot_file.path.split("/")))
+        except FileNotFoundError:
+            problems.append(f"{snapshot_file.path} is missing")
+            continue
+        if (
+            stat.st_size != snapshot_file.size
+            or abs(stat.st_mtime - snapshot_file.mtime) > _MTIME_TOLERANCE
+        ):
+            problems.append(f"{snapshot_file.path} has changed since the snapshot")
+    return problems
+
+
+def restore_snapshot(
+    manifest_path: str, dst: str, patterns: list[str] | None = None, workers: int | None = None
+) -> int:
+    """
+    Copy the files of a snapshot back out, preserving their modification times.
+
+    Args:
+        manifest_path: path to the snapshot's manifest
+        dst: directory to restore the snapshot into
+        patterns: optional glob patterns of paths within the snapshot (e.g. `config/*`),
+         only matching files are restored
+        workers: number of threads restoring files, None to use the number of CPUs
+    Returns:
+        The number of files restored
+    """
+    root = snapshot_path(manifest_path)
+    files = [
+        snapshot_file
+        for snapshot_file in read_snapshot_manifest(manifest_path)
+        if not patterns or any(fnmatch.fnmatchcase(snapshot_file.path, p) for p in patterns)
+    ]
+
+    def _restore(snapshot_file: SnapshotFile) -> None:
+        parts = snapshot_file.path.split("/")
+        path = os.path.join(dst, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copy2(os.path.join(root, *parts), path)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="restore") as pool:
+        for _ in pool.map(_restore, files):
+            pass
+    return len(files)
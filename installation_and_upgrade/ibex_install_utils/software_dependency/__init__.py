@@ -1,8 +1,89 @@
+import json
 import os
 import re
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-from ibex_install_utils.tasks.common_paths import THIRD_PARTY_INSTALLERS_LATEST_DIR
+from ibex_install_utils.tasks.common_paths import THIRD_PARTY_INSTALLERS_LATEST_DIR, VAR_DIR
+
+VERSION_CACHE_PATH = os.path.join(VAR_DIR, "tmp", "installer_versions.json")
+"""Versions read from installers, so they don't have to be read from the share every run"""
+
+VERSION_LOOKUP_WORKERS = 8
+"""Number of installers to read versions from at once"""
+
+
+@lru_cache(maxsize=None)
+def _list_files(directory: str) -> dict[str, tuple[int, int]]:
+    """
+    The size and modification time of the files in a directory, listed once per run.
+
+    On Windows, listing a directory gives the size and modification time of each file at no
+    extra cost, which saves a round-trip per file to the share.
+    """
+    files = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        pass  # no files available
+    return files
+
+
+class _VersionCache:
+    """
+    Versions read from installers, by path, valid while their size and modification time
+    are unchanged. Saved between runs.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._versions: dict[str, list] | None = None
+        self._changed = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, list]:
+        if self._versions is None:
+            try:
+                with open(self._path) as f:
+                    self._versions = json.load(f)
+            except (OSError, ValueError):
+                self._versions = {}
+        return self._versions
+
+    def get(self, path: str, size: int, mtime_ns: int) -> str | None:
+        with self._lock:
+            cached = self._load().get(path)
+        if cached is not None and cached[:2] == [size, mtime_ns]:
+            return cached[2]
+        return None
+
+    def set(self, path: str, size: int, mtime_ns: int, version: str) -> None:
+        with self._lock:
+            self._load()[path] = [size, mtime_ns, version]
+            self._changed = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._changed:
+                return
+            self._changed = False
+            temp_path = self._path + ".tmp"
+            try:
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                with open(temp_path, "w") as f:
+                    json.dump(self._versions, f, indent=1)
+                os.replace(temp_path, self._path)
+            except OSError as e:
+                print(f"Unable to save installer version cache {self._path}: {e}")
+
+
+_version_cache = _VersionCache(VERSION_CACHE_PATH)
 
 
 class SoftwareDependency(ABC):
@@ -51,14 +132,30 @@ class SoftwareDependency(ABC):
         """
         Return a list of paths pointing to the available versions of this software on the system.
         """
-        # Get filenames in directory
-        filenames = next(os.walk(self.get_search_dir()), (None, None, []))[2]  # [] if no file
         # Filter for relevant files matching regex
-        filenames = [f for f in filenames if re.search(self.get_file_pattern(), f)]
+        filenames = [
+            f for f in _list_files(self.get_search_dir()) if re.search(self.get_file_pattern(), f)
+        ]
         file_paths = [os.path.join(self.get_search_dir(), f) for f in filenames]
 
         return file_paths
 
+    def _cached_version_of(self, path: str) -> str:
+        """
+        Return the version of the software dependency described by the path, from the cache if
+        the file is unchanged since it was last read.
+        """
+        directory, filename = os.path.split(path)
+        stats = _list_files(directory).get(filename)
+        if stats is None:
+            return self.get_version_of(path)
+        version = _version_cache.get(path, *stats)
+        if version is None:
+            version = self.get_version_of(path)
+            if version is not None:
+                _version_cache.set(path, *stats, version)
+        return version
+
     def find_latest(self) -> tuple[str, str]:
         """
         Return a tuple of (dependency_file, version)
@@ -66,11 +163,15 @@ class SoftwareDependency(ABC):
         and the version is the version of this dependency.
         """
         installer_paths = self.find_available()
+        # Read the versions of all the installers at once, each is a round-trip to the share
+        with ThreadPoolExecutor(max_workers=VERSION_LOOKUP_WORKERS) as pool:
+            versions = list(pool.map(self._cached_version_of, installer_paths))
+        _version_cache.save()
+
         # Compare versions
         latest_installer = installer_paths[0]
-        latest_version = self.get_version_of(latest_installer)
-        for installer in installer_paths:
-            v = self.get_version_of(installer)
+        latest_version = versions[0]
+        for installer, v in zip(installer_paths, versions):
             # TODO do some logging
 
             if is_higher(latest_version, v):
@@ -2,7 +2,7 @@ import os
 import re
 import subprocess
 
-from ibex_install_utils.file_utils import file_in_zip, get_version
+from ibex_install_utils.file_utils import get_version_in_zip
 from ibex_install_utils.software_dependency import SoftwareDependency
 from ibex_install_utils.tasks.common_paths import APPS_BASE_DIR, INST_SHARE_AREA
 from ibex_install_utils.version_check import VERSION_REGEX, get_major_minor_patch
@@ -26,9 +26,7 @@ class MySQL(SoftwareDependency):
     def get_version_of(self, path: str) -> str:
         filename, _ = os.path.splitext(os.path.basename(path))
 
-        exe_within_zip = f"{filename}/bin/mysql.exe"
-        with file_in_zip(path, exe_within_zip) as mysql_exe:
-            return get_version(mysql_exe.name)
+        return get_version_in_zip(path, f"{filename}/bin/mysql.exe")
 
     def get_search_dir(self) -> str:
         return os.path.join(INST_SHARE_AREA, "kits$", "CompGroup", "ICP", "MySQL")
@@ -0,0 +1,199 @@
+"""
+Writing, verifying and extracting zstandard compressed tar archives.
+
+This is an alternative to zip files for backups. zstd is both faster and compresses better
+than deflate, and the compressor runs on several threads, splitting the stream into jobs
+which are compressed in parallel. A tar stream cannot be read from the middle, so unlike a
+zip file verifying or extracting an archive always reads all of it, though while extracting
+the files are written out by a pool of threads.
+
+A sidecar manifest of the name, size and crc of every member is written alongside the archive
+in the same format as for zip files (see `parallel_zip.write_member_manifest`), so checking
+what an archive holds does not need it to be decompressed.
+"""
+
+import fnmatch
+import os
+import tarfile
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable
+
+import zstandard
+
+from ibex_install_utils.io_throttle import IOThrottle
+from ibex_install_utils.parallel_zip import ZipMemberRecord, read_zip_manifest
+
+TAR_ZST_EXTENSION = ".tar.zst"
+"""Extension of a zstandard compressed tar archive"""
+
+ZSTD_LEVEL = 3
+"""zstd compression level, zstd's default which is a good trade off of speed and size"""
+
+_READ_SIZE = 1024**2
+
+_PARALLEL_WRITE_MAX_SIZE = 8 * 1024**2
+"""Files up to this size are read into memory and written out by the extraction threads"""
+
+
+class _CrcReader:
+    """File wrapper which keeps a crc32 of what has been read, for `tarfile.addfile`"""
+
+    def __init__(self, f, throttle: IOThrottle | None = None) -> None:
+        self._f = f
+        self._throttle = throttle
+        self.crc = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size) if self._throttle is None else self._throttle.read(self._f, size)
+        self.crc = zlib.crc32(data, self.crc)
+        return data
+
+
+def write_tar_zst(
+    dst: str,
+    members: Iterable[tuple[str, str, int, float]],
+    workers: int | None = None,
+    level: int = ZSTD_LEVEL,
+    on_written: Callable[[str, ZipMemberRecord], None] | None = None,
+    throttle: IOThrottle | None = None,
+) -> list[ZipMemberRecord]:
+    """
+    Write files to a zstandard compressed tar archive.
+
+    Args:
+        dst: path of the archive to write
+        members: iterable of (path to file, name of member within the archive, size, mtime),
+         for example `file_utils.ManifestEntry`
+        workers: number of compression threads, None to use the number of CPUs
+        level: zstd compression level
+        on_written: optional callback called with the path and record of each member once
+         it has been added to the archive
+        throttle: optional limit on the rate files are read at
+    Returns:
+        The name, size and crc of each member, as for a sidecar manifest
+    """
+    compressor = zstandard.ZstdCompressor(
+        level=level, threads=workers if workers else -1, write_checksum=True
+    )
+    records = []
+    with (
+        open(dst, "wb") as f,
+        compressor.stream_writer(f, closefd=False) as compressed,
+        tarfile.open(fileobj=compressed, mode="w|", format=tarfile.PAX_FORMAT) as tar,
+    ):
+        for path, arcname, _, mtime in members:
+            with open(path, "rb") as src:
+                tarinfo = tarfile.TarInfo(arcname.replace(os.sep, "/"))
+                # Take the size from the open file, so a file which changed since the
+                # manifest was built can't leave the tar stream short
+                tarinfo.size = os.fstat(src.fileno()).st_size
+                tarinfo.mtime = mtime
+                tarinfo.mode = 0o644
+                reader = _CrcReader(src, throttle)
+                tar.addfile(tarinfo, reader)
+            record = ZipMemberRecord(tarinfo.name, tarinfo.size, reader.crc)
+            records.append(record)
+            if on_written is not None:
+                on_written(path, record)
+    return records
+
+
+def _open_tar_zst(f) -> tarfile.TarFile:
+    return tarfile.open(
+        fileobj=zstandard.ZstdDecompressor().stream_reader(f, read_size=_READ_SIZE), mode="r|"
+    )
+
+
+def verify_tar_zst(tar_path: str, manifest_path: str | None = None) -> list[str]:
+    """
+    Verify a zstandard compressed tar archive by decompressing all of it.
+
+    zstd checks its own checksum of the stream; each member is also checked against the
+    sidecar manifest, if there is one.
+
+    Args:
+        tar_path: path of the archive
+        manifest_path: path to the sidecar manifest, or None to not check against one
+    Returns:
+        Descriptions of the problems found, empty if the archive is OK
+    """
+    expected = {}
+    if manifest_path is not None:
+        expected = {record.name: record for record in read_zip_manifest(manifest_path)}
+
+    problems = []
+    try:
+        with open(tar_path, "rb") as f, _open_tar_zst(f) as tar:
+            for tarinfo in tar:
+                crc, size = 0, 0
+                member = tar.extractfile(tarinfo)
+                if member is not None:
+                    while data := member.read(_READ_SIZE):
+                        crc = zlib.crc32(data, crc)
+                        size += len(data)
+                record = expected.pop(tarinfo.name, None)
+                if manifest_path is not None and record != (tarinfo.name, size, crc):
+                    problems.append(f"{tarinfo.name} does not match the manifest")
+    except (tarfile.TarError, zstandard.ZstdError, EOFError) as e:
+        problems.append(f"{tar_path} is corrupt: {e}")
+    problems.extend(f"{name} is missing" for name in expected)
+    return problems
+
+
+def _write_file(path: str, data: bytes, mtime: float) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    os.utime(path, (mtime, mtime))
+
+
+def extract_tar_zst(
+    tar_path: str, dst: str, patterns: list[str] | None = None, workers: int | None = None
+) -> int:
+    """
+    Extract a zstandard compressed tar archive, preserving modification times.
+
+    The archive is decompressed on the calling thread, which hands small files to a pool of
+    threads to write out: creating and writing many small files is where the time goes.
+
+    Args:
+        tar_path: path of the archive
+        dst: directory to extract the archive into
+        patterns: optional glob patterns of member names (e.g. `config/*`),
+         only matching members are extracted
+        workers: number of threads writing files, None to use the number of CPUs
+    Returns:
+        The number of files extracted
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    max_bytes_in_flight = workers * _PARALLEL_WRITE_MAX_SIZE
+    pending: deque[tuple[Future, int]] = deque()
+    bytes_in_flight = 0
+    extracted = 0
+    with (
+        open(tar_path, "rb") as f,
+        _open_tar_zst(f) as tar,
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tar_extract") as pool,
+    ):
+        for tarinfo in tar:
+            if patterns and not any(fnmatch.fnmatchcase(tarinfo.name, p) for p in patterns):
+                continue
+            if tarinfo.isfile() and tarinfo.size <= _PARALLEL_WRITE_MAX_SIZE:
+                # The same checks as tar.extract(filter="data") makes, e.g. no absolute paths
+                safe = tarfile.data_filter(tarinfo, dst)
+                data = tar.extractfile(tarinfo).read()
+                path = os.path.join(dst, *safe.name.split("/"))
+                pending.append((pool.submit(_write_file, path, data, safe.mtime), len(data)))
+                bytes_in_flight += len(data)
+                while bytes_in_flight > max_bytes_in_flight:
+                    future, size = pending.popleft()
+                    future.result()
+                    bytes_in_flight -= size
+            else:
+                tar.extract(tarinfo, dst, filter="data")
+            extracted += 1
+        for future, _ in pending:
+            future.result()
+    return extracted
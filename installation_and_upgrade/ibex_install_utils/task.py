@@ -4,13 +4,24 @@ Task infrastructure.
 
 import traceback
 
+from ibex_install_utils import task_profile, task_state
 from ibex_install_utils.exceptions import ErrorInTask, UserStop
 from ibex_install_utils.user_prompt import UserPrompt
 
 
-def _run_task_to_completion(task_name, prompt, self_decorated_method, func, args, kwargs):
+def _parameters(args, kwargs):
+    return "({})".format(
+        ", ".join([repr(arg) for arg in args] + [f"{k}={v!r}" for k, v in kwargs.items()])
+    )
+
+
+def _run_task_to_completion(task_name, prompt, self_decorated_method, func, args, kwargs, task_run):
     try:
-        func(self_decorated_method, *args, **kwargs)
+        with task_profile.span(task_name, task_profile.ATTEMPT) as attempt:
+            attempt["outcome"] = "failed"
+            func(self_decorated_method, *args, **kwargs)
+            attempt["outcome"] = "done"
+        task_run.finished()
         print("... Done")
         return True
     except UserStop as ex:
@@ -33,24 +44,49 @@ def _run_task_to_completion(task_name, prompt, self_decorated_method, func, args
             raise ErrorInTask("Task aborted")
 
 
-def task(task_name, attribute_name="prompt"):
+def task(task_name, attribute_name="prompt", inputs=()):
     """
     Decorator for tasks to be performed for installs.
 
     Confirms a step is to be run (if needed). If there is a problem will ask the user what to do.
     Wraps the task in print statements so users can see when a task starts and ends.
+    When resuming a deploy, skips the task if it finished before with the same parameters and
+    the same inputs.
+
+    Args:
+        task_name: name of the task shown to the user
+        attribute_name: name of the attribute holding the prompt of the object the task
+         belongs to
+        inputs: names of the attributes of the object the task belongs to which are its
+         inputs, e.g. the directory it installs from; if one has changed, e.g. a kit rebuilt
+         in place, a task finished in the deploy being resumed is run again
     """
 
     def _task_with_name_decorator(func):
         def _wrapper(self_of_decorated_method, *args, **kwargs):
             prompt = getattr(self_of_decorated_method, attribute_name)
+            task_run = task_state.TaskRun(
+                task_name,
+                _parameters(args, kwargs),
+                [getattr(self_of_decorated_method, name) for name in inputs],
+            )
+            if task_run.already_finished():
+                print(f"{task_name} ... already done, skipping")
+                return
             if prompt.confirm_step(task_name):
                 print(f"{task_name} ...")
-                while True:
-                    if _run_task_to_completion(
-                        task_name, prompt, self_of_decorated_method, func, args, kwargs
-                    ):
-                        break
+                with task_profile.span(task_name, task_profile.TASK):
+                    while True:
+                        if _run_task_to_completion(
+                            task_name,
+                            prompt,
+                            self_of_decorated_method,
+                            func,
+                            args,
+                            kwargs,
+                            task_run,
+                        ):
+                            break
 
         return _wrapper
 
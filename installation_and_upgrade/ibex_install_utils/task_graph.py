@@ -0,0 +1,78 @@
+"""
+Running tasks which don't depend on each other at the same time.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable
+
+TASK_WORKERS = 4
+"""Default number of tasks to run at once"""
+
+
+class TaskGraph:
+    """
+    Tasks, each with the tasks it depends on, run as soon as those tasks have finished.
+
+    Tasks are usually methods decorated with `task`, which ask the user what to do if they
+    fail, so a task only raises if the user aborts. Once a task raises no more tasks are
+    started; those already running are left to finish and then the exception is re-raised.
+
+    With one worker the tasks run one at a time in the order they were added.
+    """
+
+    def __init__(self, workers: int = TASK_WORKERS) -> None:
+        """
+        Args:
+            workers: the most tasks to run at once
+        """
+        self._workers = workers
+        self._tasks: dict[str, tuple[Callable[[], None], list[str]]] = {}
+
+    def add(self, name: str, func: Callable[[], None], after: Iterable[str] = ()) -> None:
+        """
+        Add a task.
+
+        Args:
+            name: name of the task, for other tasks to depend on
+            func: the task
+            after: names of the tasks which must finish before this one starts; they must
+             already have been added, which also means there can be no cycles
+        """
+        if name in self._tasks:
+            raise ValueError(f"Task '{name}' has already been added")
+        after = list(after)
+        for dependency in after:
+            if dependency not in self._tasks:
+                raise ValueError(
+                    f"Task '{name}' depends on '{dependency}' which has not been added"
+                )
+        self._tasks[name] = (func, after)
+
+    def run(self) -> None:
+        """
+        Run all the tasks, returning once they have all finished.
+        """
+        waiting = dict(self._tasks)
+        finished: set[str] = set()
+        running: dict[Future, str] = {}
+        error: BaseException | None = None
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="task") as pool:
+            while waiting or running:
+                if error is None:
+                    for name, (func, after) in list(waiting.items()):
+                        if len(running) < self._workers and finished.issuperset(after):
+                            running[pool.submit(func)] = name
+                            del waiting[name]
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        finished.add(name)
+                    except BaseException as e:
+                        if error is None:
+                            error = e
+        if error is not None:
+            raise error
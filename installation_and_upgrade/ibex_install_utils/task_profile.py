@@ -0,0 +1,159 @@
+"""
+Timings of the tasks in a run, each attempt at them and the commands they run.
+
+Each is recorded as a span, and at the end of the run the spans are written out as a Chrome
+trace (open it in chrome://tracing or https://ui.perfetto.dev) beside the deploy log, and the
+slowest tasks are printed. Tasks run at the same time appear on separate rows of the trace.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Generator, NamedTuple, Optional
+
+# Categories of span
+TASK = "task"
+ATTEMPT = "attempt"
+PROCESS = "process"
+
+SUMMARY_ROWS = 15
+"""Number of tasks shown in the summary"""
+
+
+class Span(NamedTuple):
+    name: str
+    category: str
+    start: float
+    duration: float
+    lane: int
+    args: dict
+
+
+class _Profile:
+    def __init__(self) -> None:
+        self.epoch = time.perf_counter()
+        self.spans: list[Span] = []
+        self.lock = threading.Lock()
+
+
+_profile: Optional[_Profile] = None
+_lanes = itertools.count(1)
+_thread_lanes = threading.local()
+
+
+def set_up() -> None:
+    """
+    Start recording spans.
+    """
+    global _profile
+    _profile = _Profile()
+
+
+def _thread_lane() -> int:
+    if not hasattr(_thread_lanes, "lane"):
+        _thread_lanes.lane = next(_lanes)
+    return _thread_lanes.lane
+
+
+def new_lane() -> int:
+    """
+    A lane of its own, for spans which overlap others on the same thread, e.g. processes run
+    by asyncio.
+    """
+    return next(_lanes)
+
+
+@contextmanager
+def span(
+    name: str, category: str, lane: Optional[int] = None, **args: object
+) -> Generator[dict, None, None]:
+    """
+    Record the time taken by a block of code, if recording has been set up.
+
+    Args:
+        name: name of the span
+        category: e.g. `TASK`
+        lane: row of the trace to show it on, if not the current thread's
+        args: shown with the span in the trace
+    Yields:
+        The span's args, to which more can be added
+    """
+    if _profile is None:
+        yield args
+        return
+    lane = lane if lane is not None else _thread_lane()
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        duration = time.perf_counter() - start
+        with _profile.lock:
+            _profile.spans.append(
+                Span(name, category, start - _profile.epoch, duration, lane, args)
+            )
+
+
+def write_trace(directory: Optional[str] = None) -> Optional[str]:
+    """
+    Write the spans recorded as a Chrome trace.
+
+    Args:
+        directory: directory to write the trace to, by default beside the process trace
+    Returns:
+        The path of the trace, or None if nothing was recorded
+    """
+    if directory is None:
+        # process_trace uses tasks.common_paths, and tasks uses this module (through
+        # RunProcess), so it can't be imported at the top
+        from ibex_install_utils.process_trace import TRACE_DIRECTORY
+
+        directory = TRACE_DIRECTORY
+    if _profile is None or not _profile.spans:
+        return None
+    events = [
+        {
+            "name": s.name,
+            "cat": s.category,
+            "ph": "X",
+            "ts": round(s.start * 1e6),
+            "dur": round(s.duration * 1e6),
+            "pid": 1,
+            "tid": s.lane,
+            "args": {key: str(value) for key, value in s.args.items()},
+        }
+        for s in _profile.spans
+    ]
+    path = os.path.join(directory, f"TASKS-{time.strftime('%Y%m%d-%H%M%S')}.trace.json")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    except OSError as e:
+        print(f"Unable to write task trace {path}: {e}")
+        return None
+    return path
+
+
+def print_summary() -> None:
+    """
+    Print the tasks which took the longest, with how many attempts they took.
+    """
+    if _profile is None:
+        return
+    with _profile.lock:
+        spans = list(_profile.spans)
+    tasks = sorted((s for s in spans if s.category == TASK), key=lambda s: -s.duration)
+    if not tasks:
+        return
+    attempts: dict[str, int] = {}
+    for s in spans:
+        if s.category == ATTEMPT:
+            attempts[s.name] = attempts.get(s.name, 0) + 1
+
+    print("Slowest tasks:")
+    print(f"    {'Task':<60} {'Time (s)':>10} {'Attempts':>9}")
+    for s in tasks[:SUMMARY_ROWS]:
+        print(f"    {s.name:<60} {s.duration:>10.1f} {attempts.get(s.name, 0):>9}")
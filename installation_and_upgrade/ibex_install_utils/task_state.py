@@ -0,0 +1,190 @@
+"""
+The tasks finished in a deploy, so that a deploy which stopped part way through can be rerun
+from where it stopped.
+
+A task is finished once it has run without error; skipping it after an error does not count.
+It is skipped when resuming only if it is run with the same parameters and its inputs (e.g. the
+directories being installed from) are unchanged. The state is kept for one deploy at a time:
+resuming a different deploy, e.g. of another release, starts again from the beginning.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+from ibex_install_utils.tasks.common_paths import VAR_DIR
+
+DEPLOY_STATE_PATH = os.path.join(VAR_DIR, "tmp", "deploy_state.json")
+"""Default location of the state of the current deploy"""
+
+_STATE_FORMAT_VERSION = 1
+
+
+def _fingerprint_input(value: object) -> list:
+    """
+    Fingerprint of an input to a task: for a path its modification time and size, and those
+    of the entries in it, so a kit rebuilt in place is noticed; otherwise the value itself.
+    """
+    if not isinstance(value, str) or not os.path.exists(value):
+        return [repr(value)]
+    stat = os.stat(value)
+    fingerprint = [value, stat.st_mtime_ns, stat.st_size]
+    if os.path.isdir(value):
+        try:
+            with os.scandir(value) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    entry_stat = entry.stat()
+                    fingerprint.append([entry.name, entry_stat.st_mtime_ns, entry_stat.st_size])
+        except OSError:
+            pass
+    return fingerprint
+
+
+def fingerprint(inputs: Iterable[object]) -> str:
+    """
+    Args:
+        inputs: the inputs of a task, paths or other values
+    Returns:
+        A fingerprint which changes if any of the inputs change
+    """
+    text = json.dumps([_fingerprint_input(value) for value in inputs])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _DeployState:
+    def __init__(
+        self, path: str, deployment: dict, finished: dict[str, dict], resuming: bool
+    ) -> None:
+        self.path = path
+        self.deployment = deployment
+        self.finished = finished
+        self.resuming = resuming
+        self.lock = threading.Lock()
+
+    def save(self) -> None:
+        temp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(temp_path, "w") as f:
+                json.dump(
+                    {
+                        "version": _STATE_FORMAT_VERSION,
+                        "deployment": self.deployment,
+                        "finished": self.finished,
+                    },
+                    f,
+                    indent=1,
+                )
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            # Only resuming needs the state, so carry on without it
+            print(f"Unable to save deploy state {self.path}: {e}")
+
+
+_state: Optional[_DeployState] = None
+
+
+def _load_finished(path: str, deployment: dict) -> dict[str, dict]:
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except FileNotFoundError:
+        print("No earlier deploy to resume, starting from the beginning")
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Unable to read deploy state {path}, starting from the beginning: {e}")
+        return {}
+    if saved.get("version") != _STATE_FORMAT_VERSION or saved.get("deployment") != deployment:
+        print("The earlier deploy was of something else, starting from the beginning")
+        return {}
+    finished = saved.get("finished", {})
+    print(f"Resuming deploy, {len(finished)} tasks already finished")
+    return finished
+
+
+def set_up(deployment: dict, resume: bool, path: str = DEPLOY_STATE_PATH) -> None:
+    """
+    Start recording the tasks finished.
+
+    Args:
+        deployment: what is being deployed, e.g. the type of deploy and the directories
+         installed from; only a deploy of the same thing is resumed
+        resume: True to skip tasks finished in the last deploy; False to start again
+        path: file to keep the state in
+    """
+    global _state
+    finished = _load_finished(path, deployment) if resume else {}
+    _state = _DeployState(path, deployment, finished, resume)
+    _state.save()
+
+
+def clear() -> None:
+    """
+    Forget the tasks finished, once the deploy has finished so there is nothing to resume.
+    """
+    if _state is None:
+        return
+    with _state.lock:
+        _state.finished = {}
+        try:
+            os.remove(_state.path)
+        except OSError:
+            pass
+
+
+class TaskRun:
+    """
+    A run of a task, which can be skipped if it finished in the deploy being resumed.
+    Does nothing unless the state has been set up.
+
+    The inputs are only fingerprinted when resuming, to check whether the task can be
+    skipped, and once the task has finished, to record what it was run with.
+    """
+
+    def __init__(self, name: str, parameters: str, inputs: Iterable[object] = ()) -> None:
+        """
+        Args:
+            name: name of the task
+            parameters: the parameters the task was called with
+            inputs: the inputs of the task, paths or other values
+        """
+        self._name = name
+        self._parameters = parameters
+        self._key = f"{name}{parameters}"
+        self._inputs = list(inputs)
+        self._fingerprint: Optional[str] = None
+
+    def _get_fingerprint(self) -> str:
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint(self._inputs)
+        return self._fingerprint
+
+    def already_finished(self) -> bool:
+        """
+        Returns:
+            True if the task finished in the deploy being resumed, with the same inputs
+        """
+        if _state is None or not _state.resuming:
+            return False
+        with _state.lock:
+            finished = _state.finished.get(self._key)
+        return finished is not None and finished["fingerprint"] == self._get_fingerprint()
+
+    def finished(self) -> None:
+        """
+        Record that the task has run without error.
+        """
+        if _state is None:
+            return
+        task_fingerprint = self._get_fingerprint()
+        with _state.lock:
+            _state.finished[self._key] = {
+                "task": self._name,
+                "parameters": self._parameters,
+                "fingerprint": task_fingerprint,
+                "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            _state.save()
@@ -1,16 +1,46 @@
+import argparse
+import errno
 import os
 import shutil
 import zipfile
-from typing import Callable, Tuple
-
-from ibex_install_utils.file_utils import FileUtils
+from typing import Callable
+
+import ibex_install_utils.current_args
+from ibex_install_utils.backup_store import (
+    STORE_DIR_NAME,
+    STORE_MANIFEST_EXTENSION,
+    BackupStore,
+    read_manifest,
+    store_for_manifest,
+)
+from ibex_install_utils.file_transfer import TreeTransfer
+from ibex_install_utils.file_utils import FileUtils, ManifestEntry
+from ibex_install_utils.io_throttle import IOThrottle
+from ibex_install_utils.parallel_zip import (
+    ZIP_MANIFEST_EXTENSION,
+    CompressionPolicy,
+    ParallelZipWriter,
+    ZipJournal,
+    read_zip_manifest,
+    verify_zip,
+    write_member_manifest,
+    write_zip_manifest,
+)
 from ibex_install_utils.progress_bar import ProgressBar
+from ibex_install_utils.snapshot import (
+    SNAPSHOT_MANIFEST_EXTENSION,
+    same_volume,
+    snapshot_tree,
+    verify_snapshot,
+)
+from ibex_install_utils.tar_zst import TAR_ZST_EXTENSION, verify_tar_zst, write_tar_zst
 from ibex_install_utils.task import task
 from ibex_install_utils.tasks import BaseTasks
 from ibex_install_utils.tasks.common_paths import (
     AUTOSAVE,
     BACKUP_DATA_DIR,
     BACKUP_DIR,
+    BACKUP_STORE_DIR,
     EPICS_PATH,
     EPICS_UTILS_PATH,
     GUI_PATH,
@@ -56,6 +86,36 @@ ALL_INSTALL_DIRECTORIES = (
 )
 DIRECTORIES_TO_BACKUP = (*ALL_INSTALL_DIRECTORIES, SETTINGS_DIR, AUTOSAVE)
 
+BACKUP_FORMAT_EXTENSIONS = {
+    "zip": ".zip",
+    "tar.zst": TAR_ZST_EXTENSION,
+    "store": STORE_MANIFEST_EXTENSION,
+    "snapshot": "",
+}
+"""Extension of the backup of a directory in each backup format"""
+
+
+def add_backup_throttle_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the command line arguments which limit how fast backups read from disk.
+
+    Args:
+        parser: the parser to add the arguments to
+    """
+    parser.add_argument(
+        "--backup_max_mb_per_second",
+        type=float,
+        default=ibex_install_utils.current_args.BACKUP_MAX_MB_PER_SECOND,
+        help="Limit the rate backups read files at, in MB/s, so a backup can run on a live "
+        "instrument without affecting the IOCs and archiver (default: no limit).",
+    )
+    parser.add_argument(
+        "--backup_adaptive_throttle",
+        action="store_true",
+        help="With --backup_max_mb_per_second, also slow backups down further while reads "
+        "are slow because the disk is busy.",
+    )
+
 
 class BackupTasks(BaseTasks):
     """
@@ -69,9 +129,21 @@ class BackupTasks(BaseTasks):
     lowercase names of directories we are not worried about if they do
     not exist for example Python which has been Python3 for some time
 
+    """
+    COMPRESSION_POLICY = CompressionPolicy()
+    """
+    Which files to store in zip backups without deflating them, e.g. jars and zips
+    which are already compressed
+
     """
     progress_bar = ProgressBar()
     """To indicate tasks' progress"""
+    old_backups_transfer = TreeTransfer()
+    """
+    Moves old backups to the share in the background, while the current installation
+    is backed up
+
+    """
 
     @task("Backup old directories")
     def backup_old_directories(self) -> None:
@@ -109,7 +181,16 @@ class BackupTasks(BaseTasks):
         Verify backup. This function checks if the backup has been sucessful by checking
         for a VERSION.txt file within the backup folders for EPICS, PYTHON, GUI.
 
+        The directories of all zip backups are checked against their sidecar manifests and,
+        unless the backup verify mode is "quick", some or all of their files are decompressed
+        to check their crcs. Unless the mode is "quick" tar.zst backups are decompressed in
+        full, as that is the only way to read them, and snapshots are checked.
+
+        Also waits for old backups to finish moving to the share.
+
         """
+        self._wait_for_old_backups()
+
         for path in (EPICS_PATH, PYTHON_3_PATH, GUI_PATH):
             path_to_backup = self._path_to_backup(path)
             backup_folder_exists = True
@@ -121,10 +202,21 @@ class BackupTasks(BaseTasks):
                 backup_zip_exists = True
                 # The backup might be in the zip files instead of folders
                 backup_zip_file = os.path.join(path_to_backup + ".zip")
+                backup_tar_file = path_to_backup + TAR_ZST_EXTENSION
+                backup_store_manifest = path_to_backup + STORE_MANIFEST_EXTENSION
                 if os.path.exists(backup_zip_file):
                     with zipfile.ZipFile(backup_zip_file, "r") as backup_ref:
                         if file_to_check not in backup_ref.namelist():
                             backup_zip_exists = False
+                elif os.path.exists(backup_tar_file):
+                    # Listing a tar means decompressing it, so use its sidecar manifest
+                    tar_manifest = backup_tar_file + ZIP_MANIFEST_EXTENSION
+                    if not os.path.exists(tar_manifest) or file_to_check not in (
+                        record.name for record in read_zip_manifest(tar_manifest)
+                    ):
+                        backup_zip_exists = False
+                elif os.path.exists(backup_store_manifest):
+                    backup_zip_exists = self._store_backup_ok(backup_store_manifest, file_to_check)
                 else:
                     backup_zip_exists = False
 
@@ -135,15 +227,111 @@ class BackupTasks(BaseTasks):
                 )
 
         for path in (SETTINGS_DIR, AUTOSAVE, EPICS_UTILS_PATH):
-            # Either the folder or the corresponding .zip file should exist
-            if not os.path.exists(self._path_to_backup(path)) and not os.path.exists(
-                self._path_to_backup(path) + ".zip"
+            # Either the folder or the corresponding .zip file or store manifest should exist
+            path_to_backup = self._path_to_backup(path)
+            store_manifest = path_to_backup + STORE_MANIFEST_EXTENSION
+            if (
+                not os.path.exists(path_to_backup)
+                and not os.path.exists(path_to_backup + ".zip")
+                and not os.path.exists(path_to_backup + TAR_ZST_EXTENSION)
+                and not (os.path.exists(store_manifest) and self._store_backup_ok(store_manifest))
             ):
                 self.prompt.prompt_and_raise_if_not_yes(
                     f"Error found with backup. '{path}' did not back up properly. "
                     "Please backup manually."
                 )
 
+        verify_mode = ibex_install_utils.current_args.BACKUP_VERIFY
+        if verify_mode == "quick":
+            # Only the cheap check of each zip's directory against what was written
+            fraction = 0.0
+        elif verify_mode == "full":
+            fraction = 1.0
+        else:
+            fraction = ibex_install_utils.current_args.BACKUP_VERIFY_FRACTION
+        for path in DIRECTORIES_TO_BACKUP:
+            backup_zip_file = self._path_to_backup(path) + ".zip"
+            backup_tar_file = self._path_to_backup(path) + TAR_ZST_EXTENSION
+            snapshot_manifest = self._path_to_backup(path) + SNAPSHOT_MANIFEST_EXTENSION
+            if os.path.exists(backup_zip_file):
+                self._verify_zip_backup(backup_zip_file, fraction)
+            elif verify_mode == "quick":
+                continue
+            elif os.path.exists(backup_tar_file):
+                self._verify_tar_backup(backup_tar_file)
+            elif os.path.exists(snapshot_manifest):
+                self._verify_snapshot_backup(snapshot_manifest)
+
+    def _verify_zip_backup(self, zip_path: str, fraction: float) -> None:
+        """
+        Checks the members of a zip backup against its sidecar manifest, if it has one,
+        and decompresses the given fraction of them to check their crcs.
+        """
+        manifest_path = zip_path + ZIP_MANIFEST_EXTENSION
+        if not os.path.exists(manifest_path):
+            manifest_path = None
+        if fraction > 0:
+            print(f"Verifying {fraction:.0%} of the files in {zip_path} ...")
+        problems = verify_zip(
+            zip_path,
+            manifest_path,
+            fraction=fraction,
+            workers=ibex_install_utils.current_args.BACKUP_WORKERS,
+        )
+        if problems:
+            for problem in problems[:10]:
+                print(f"    {problem}")
+            self.prompt.prompt_and_raise_if_not_yes(
+                f"Error found with backup. {len(problems)} problems found in '{zip_path}'. "
+                "Please backup manually."
+            )
+
+    def _verify_tar_backup(self, tar_path: str) -> None:
+        """
+        Decompresses a tar.zst backup, checking its files against its sidecar manifest.
+        """
+        manifest_path = tar_path + ZIP_MANIFEST_EXTENSION
+        if not os.path.exists(manifest_path):
+            manifest_path = None
+        print(f"Verifying all of the files in {tar_path} ...")
+        problems = verify_tar_zst(tar_path, manifest_path)
+        if problems:
+            for problem in problems[:10]:
+                print(f"    {problem}")
+            self.prompt.prompt_and_raise_if_not_yes(
+                f"Error found with backup. {len(problems)} problems found in '{tar_path}'. "
+                "Please backup manually."
+            )
+
+    def _verify_snapshot_backup(self, manifest_path: str) -> None:
+        """
+        Checks every file of a snapshot backup is in the snapshot, with the right size.
+        """
+        print(f"Verifying the files in snapshot {manifest_path} ...")
+        problems = verify_snapshot(manifest_path)
+        if problems:
+            for problem in problems[:10]:
+                print(f"    {problem}")
+            self.prompt.prompt_and_raise_if_not_yes(
+                f"Error found with backup. {len(problems)} problems found in snapshot "
+                f"'{manifest_path}'. Please backup manually."
+            )
+
+    @staticmethod
+    def _store_backup_ok(manifest_path: str, file_to_check: str | None = None) -> bool:
+        """
+        Checks a backup in the backup store: the manifest must list file_to_check, if given,
+        and every file in the manifest must be present in the store.
+        """
+        if file_to_check is not None and file_to_check not in (
+            stored_file.path for stored_file in read_manifest(manifest_path)
+        ):
+            return False
+        missing = store_for_manifest(manifest_path).missing(manifest_path)
+        for stored_file in missing[:10]:
+            print(f"    {stored_file.path} is missing from the backup store")
+        return not missing
+
     @task("Removing old version of IBEX")
     def remove_old_ibex(self) -> None:
         """
@@ -151,7 +339,7 @@ class BackupTasks(BaseTasks):
 
         """
         for path in ALL_INSTALL_DIRECTORIES:
-            self._file_utils.remove_tree(path[0], self.prompt, leave_top_if_link=True)
+            self._file_utils.remove_tree(path, self.prompt, leave_top_if_link=True)
 
     def _path_to_backup(self, path: str) -> str:
         """Returns backup path for the given path"""
@@ -159,11 +347,20 @@ class BackupTasks(BaseTasks):
 
     def _check_backup_space(
         self, src: str, ignore: "Callable[[str, list[str]], set[str]] | None" = None
-    ) -> Tuple[int, int]:
-        # Checks if there is enough space to move dir at src into the backup directory
-        # (all in bytes)
+    ) -> int:
+        # Checks if there is enough space to back up the dir at src into the backup directory
+        # (all in bytes). The size is remembered between runs, so this is quick for big trees
+        # which have hardly changed, and includes any ignored files, so errs on the large side
         _, _, free = shutil.disk_usage(BACKUP_DIR)
-        backup_size, number_of_files = FileUtils.get_size_and_number_of_files(src, ignore=ignore)
+        try:
+            backup_size = FileUtils.cached_tree_stats(src).size
+        except OSError:
+            # Parts of the tree can't be read; they won't be backed up, so size the rest
+            backup_size = FileUtils.tree_stats(src, ignore=ignore, onerror=lambda error: None).size
+        if backup_size > free and self.old_backups_transfer.running():
+            print("Waiting for old backups to move to the share to free up space ...")
+            self._wait_for_old_backups()
+            _, _, free = shutil.disk_usage(BACKUP_DIR)
         while backup_size > free:
             needed_space = round((backup_size - free) / (1024**3), 2)
             self.prompt.prompt_and_raise_if_not_yes(
@@ -171,7 +368,7 @@ class BackupTasks(BaseTasks):
             )
             _, _, free = shutil.disk_usage(BACKUP_DIR)
 
-        return backup_size, number_of_files
+        return backup_size
 
     def _backup_dir(
         self,
@@ -184,8 +381,8 @@ class BackupTasks(BaseTasks):
         If the optional copy flag is true, the directory in `src` will be kept;
         if it is false, the directory at `src` will be moved to the backup area.
 
-        The optional ignore argument is a callable. If given, it
-        is passed onto the `shutil.copytree` function for its optional ignore argument.
+        The optional ignore argument is a callable. If given, it is called once per
+        directory while building the manifest of files to back up.
 
         Args:
             src: path of the directory to be backed up
@@ -198,35 +395,43 @@ class BackupTasks(BaseTasks):
             # Optimistic start
             print(f"\nPreparing to back up {src} ...")
 
-            # Files will compress slightly, but close enough as a pessimistic estimate
-            _, number_of_files = self._check_backup_space(src, ignore=ignore)
-            self.progress_bar.reset(total=number_of_files)
-
-            dst = self._path_to_backup(src) + ".zip"
+            backup_format = ibex_install_utils.current_args.BACKUP_FORMAT
+            dst = self._path_to_backup(src) + BACKUP_FORMAT_EXTENSIONS[backup_format]
+            if self._backup_completed(dst):
+                print(f"{src} was already backed up to {dst} by an earlier attempt at this task")
+                return
+
+            if not os.path.isdir(src):
+                raise FileNotFoundError(errno.ENOENT, "No such directory", src)
+            top = os.path.normcase(FileUtils.winapi_path(src))
+
+            def _skip_unreadable(error: OSError) -> None:
+                # Nothing can be backed up if the directory itself can't be read
+                if os.path.normcase(FileUtils.winapi_path(error.filename)) == top:
+                    raise error
+                print(f"Unable to read {error.filename}, not backing it up: {error}")
+
+            # Hard links are the same files as the originals, so are only safe if the originals
+            # are removed after the backup. Directories which are kept, even the installation
+            # about to be upgraded, have files overwritten in place, e.g. by install_to_inst.bat
+            hard_links = backup_format == "snapshot" and not copy and same_volume(src, BACKUP_DIR)
+            if not hard_links:
+                # Files will compress slightly, but close enough as a pessimistic estimate
+                self._check_backup_space(src, ignore)
+
+            manifest = FileUtils.build_manifest(src, ignore=ignore, onerror=_skip_unreadable)
+            self.progress_bar.reset(
+                total=len(manifest), total_bytes=sum(entry.size for entry in manifest)
+            )
 
-            print(f"Attempting to backup {src} to zipfile at {dst}")
-            with zipfile.ZipFile(
-                dst,
-                "w",
-                compression=zipfile.ZIP_DEFLATED,
-                compresslevel=1,
-                strict_timestamps=False,
-            ) as zf:
-                for src_path, dirs, src_filenames in os.walk(src, topdown=True):
-                    if ignore is not None:
-                        excluded_files = ignore(src_path, src_filenames)
-                        excluded_dirs = ignore(src_path, dirs)
-                    else:
-                        excluded_files = []
-                        excluded_dirs = []
-
-                    dirs[:] = [d for d in dirs if d not in excluded_dirs]
-                    for src_filename in src_filenames:
-                        path = os.path.normpath(os.path.join(src_path, src_filename))
-                        if os.path.isfile(path) and src_filename not in excluded_files:
-                            self.progress_bar.progress += 1
-                            self.progress_bar.print()
-                            zf.write(path, os.path.relpath(path, src))
+            if backup_format == "snapshot":
+                self._backup_to_snapshot(src, manifest, dst, hard_links)
+            elif backup_format == "store":
+                self._backup_to_store(src, manifest, dst)
+            elif backup_format == "tar.zst":
+                self._backup_to_tar_zst(src, manifest, dst)
+            else:
+                self._backup_to_zip(src, manifest, dst)
 
             if not copy:
                 print(f"Removing {src} after backup")
@@ -272,23 +477,173 @@ class BackupTasks(BaseTasks):
             # Finished successfully
             print(f"Successfully backed up to {dst}.")
 
+    @staticmethod
+    def _backup_completed(dst: str) -> bool:
+        # Store and snapshot manifests are only written once a backup is complete, as are zip
+        # and tar sidecar manifests, after which the zip's journal is removed
+        if os.path.exists(dst + SNAPSHOT_MANIFEST_EXTENSION):
+            return True
+        if dst.endswith(STORE_MANIFEST_EXTENSION):
+            return os.path.exists(dst)
+        if dst.endswith(TAR_ZST_EXTENSION):
+            return os.path.exists(dst + ZIP_MANIFEST_EXTENSION)
+        return os.path.exists(dst + ZIP_MANIFEST_EXTENSION) and not os.path.exists(
+            ZipJournal(dst).path
+        )
+
+    def _backup_to_zip(self, src: str, manifest: list[ManifestEntry], dst: str) -> None:
+        journal = ZipJournal(dst)
+        print(f"Attempting to backup {src} to zipfile at {dst}")
+        zf, members, remaining = journal.open(
+            manifest, compression=zipfile.ZIP_DEFLATED, compresslevel=1, strict_timestamps=False
+        )
+        if members:
+            print(f"Resuming from {len(members)} files already in {dst}")
+            self.progress_bar.update(len(members), sum(zinfo.file_size for zinfo in members))
+
+        def _on_written(path: str, zinfo: zipfile.ZipInfo) -> None:
+            members.append(zinfo)
+            journal.record(path, zinfo)
+            self.progress_bar.update(nbytes=zinfo.file_size)
+
+        with zf:
+            writer = ParallelZipWriter(
+                zf,
+                workers=ibex_install_utils.current_args.BACKUP_WORKERS,
+                compresslevel=1,
+                policy=self.COMPRESSION_POLICY,
+                throttle=self._io_throttle(),
+            )
+            try:
+                writer.write_all(remaining, on_written=_on_written)
+            finally:
+                journal.close()
+        write_zip_manifest(dst + ZIP_MANIFEST_EXTENSION, members)
+        journal.remove()
+
+        stats = writer.stats
+        if stats.stored_files:
+            print(
+                f"Stored {stats.stored_files} files which do not compress "
+                f"({stats.stored_bytes / 1024**2:.1f} MB) without deflating them, "
+                f"saving about {stats.seconds_saved:.1f} s of compression time"
+            )
+
+    def _backup_to_tar_zst(self, src: str, manifest: list[ManifestEntry], dst: str) -> None:
+        print(f"Attempting to backup {src} to tar.zst file at {dst}")
+        records = write_tar_zst(
+            dst,
+            manifest,
+            workers=ibex_install_utils.current_args.BACKUP_WORKERS,
+            on_written=lambda _, record: self.progress_bar.update(nbytes=record.size),
+            throttle=self._io_throttle(),
+        )
+        write_member_manifest(dst + ZIP_MANIFEST_EXTENSION, records)
+
+    def _backup_to_store(self, src: str, manifest: list[ManifestEntry], dst: str) -> None:
+        print(f"Attempting to backup {src} to backup store at {BACKUP_STORE_DIR}, manifest {dst}")
+        BackupStore(BACKUP_STORE_DIR, throttle=self._io_throttle()).backup(
+            os.path.basename(src),
+            manifest,
+            dst,
+            workers=ibex_install_utils.current_args.BACKUP_WORKERS,
+            on_stored=lambda stored_file: self.progress_bar.update(nbytes=stored_file.size),
+        )
+
+    def _backup_to_snapshot(
+        self, src: str, manifest: list[ManifestEntry], dst: str, hard_links: bool
+    ) -> None:
+        print(f"Attempting to snapshot {src} to {dst}")
+        counts = snapshot_tree(
+            manifest,
+            FileUtils.winapi_path(dst),
+            hard_links=hard_links,
+            workers=ibex_install_utils.current_args.BACKUP_WORKERS,
+            on_linked=lambda _, size: self.progress_bar.update(nbytes=size),
+        )
+        print(
+            f"Snapshot of {src} has {counts['reflink']} reflinked, {counts['hard link']} "
+            f"hard linked and {counts['copy']} copied files"
+        )
+
+    @staticmethod
+    def _io_throttle() -> IOThrottle | None:
+        # Limit the rate the backup reads files at, if asked to, so that a backup can run
+        # alongside IOCs and the archiver using the same disk
+        max_mb_per_second = ibex_install_utils.current_args.BACKUP_MAX_MB_PER_SECOND
+        if max_mb_per_second is None:
+            return None
+        adaptive = ibex_install_utils.current_args.BACKUP_ADAPTIVE_THROTTLE
+        print(
+            f"Limiting backup reads to {max_mb_per_second} MB/s"
+            + (", less if the disk is busy" if adaptive else "")
+        )
+        return IOThrottle(max_mb_per_second * 1024**2, adaptive=adaptive)
+
     # ? Moving other backups to stage deleted could be a task on its own
     def _move_old_backups_to_share(self) -> None:
         """
         Move all backups to the shares. This should be
         run before the current installation is backed up
 
+        The backups are moved in the background, so a slow share does not hold up the
+        backup of the current installation; see `_wait_for_old_backups`.
+
         """
+        # A backup started by an earlier attempt at this task is not old, it is resumed
         current_backups = [
             os.path.join(BACKUP_DIR, d)
             for d in os.listdir(BACKUP_DIR)
-            if os.path.isdir(os.path.join(BACKUP_DIR, d)) and d.startswith("ibex_backup")
+            if os.path.isdir(os.path.join(BACKUP_DIR, d))
+            and d.startswith("ibex_backup")
+            and os.path.join(BACKUP_DIR, d) != BaseTasks._backup_dir
         ]
 
+        local_store = BackupStore(BACKUP_STORE_DIR)
+        moved_store_backups = False
+        moves = []
         for d in current_backups:
             backup = STAGE_DELETED + "\\" + self._get_machine_name() + "\\" + os.path.basename(d)
-            print(f"Moving backup {d} to {backup}")
-            self._file_utils.move_dir(d, backup, self.prompt)
+            store_manifests = [
+                os.path.join(d, f) for f in os.listdir(d) if f.endswith(STORE_MANIFEST_EXTENSION)
+            ]
+            if store_manifests:
+                # Files in the store are shared between backups, so copy the ones this backup
+                # needs to the store on the share before moving the backup's manifests
+                share_store = BackupStore(os.path.join(os.path.dirname(backup), STORE_DIR_NAME))
+                print(f"Copying files of backup {d} to backup store {share_store.root}")
+                for manifest in store_manifests:
+                    local_store.copy_to(
+                        share_store, (stored_file.digest for stored_file in read_manifest(manifest))
+                    )
+                moved_store_backups = True
+            moves.append((d, backup))
+
+        # Only prune once older backups have moved, so that a resumed backup keeps the
+        # files it had already stored
+        if moved_store_backups and os.path.isdir(BACKUP_STORE_DIR):
+            removed = local_store.prune()
+            print(f"Removed {removed} files only needed by older backups from {BACKUP_STORE_DIR}")
+
+        if moves:
+            for d, backup in moves:
+                print(f"Moving backup {d} to {backup} in the background")
+            self.old_backups_transfer.start(moves)
+
+    def _wait_for_old_backups(self) -> None:
+        """
+        Wait for old backups to finish moving to the share, raising if any files could not be
+        moved. Files which did not move are left where they were, so the move can be retried.
+
+        """
+        errors = self.old_backups_transfer.wait()
+        for backup, problems in errors.items():
+            for problem in problems[:10]:
+                print(problem)
+            self.prompt.prompt_and_raise_if_not_yes(
+                f"{len(problems)} files of old backup '{backup}' could not be moved to the share "
+                f"and have been left in {BACKUP_DIR}. Please move them manually."
+            )
 
 
 if __name__ == "__main__":
@@ -300,6 +655,12 @@ if __name__ == "__main__":
             `set PYTHONPATH=. && python ibex_install_utils/tasks/backup_tasks.py`
     from the installation_and_upgrade directory in terminal.
     """
+    parser = argparse.ArgumentParser(description="Back up the current IBEX installation")
+    add_backup_throttle_arguments(parser)
+    args = parser.parse_args()
+    ibex_install_utils.current_args.BACKUP_MAX_MB_PER_SECOND = args.backup_max_mb_per_second
+    ibex_install_utils.current_args.BACKUP_ADAPTIVE_THROTTLE = args.backup_adaptive_throttle
+
     print("Running backup task standalone.")
 
     #! Copying older backups to share will likely fail on developer machines
@@ -8,7 +8,7 @@ from ibex_install_utils.tasks.common_paths import APPS_BASE_DIR, GUI_PATH
 
 
 class ClientTasks(BaseTasks):
-    @task("Installing IBEX Client with builtin python")
+    @task("Installing IBEX Client with builtin python", inputs=["_client_source_dir"])
     def install_ibex_client(self):
         """
         Install the ibex client with builtin python.
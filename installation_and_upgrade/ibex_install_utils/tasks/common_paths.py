@@ -20,6 +20,7 @@ EPICS_UTILS_PATH = os.path.join(APPS_BASE_DIR, "EPICS_UTILS")
 
 BACKUP_DATA_DIR = os.path.join("C:\\", "data")
 BACKUP_DIR = os.path.join(BACKUP_DATA_DIR, "old")
+BACKUP_STORE_DIR = os.path.join(BACKUP_DIR, "backup_store")
 STAGE_DELETED = os.path.join(INST_SHARE_AREA, "backups$", "stage-deleted")
 
 PYTHON_PATH = os.path.join(APPS_BASE_DIR, "Python")
@@ -11,7 +11,7 @@ class PythonTasks(BaseTasks):
     Tasks relating to installing or maintaining an installation of genie_python.
     """
 
-    @task("Installing Genie Python 3")
+    @task("Installing Genie Python 3", inputs=["_genie_python_3_source_dir"])
     def install_genie_python3(self):
         """
         Install ibex server.
@@ -118,7 +118,7 @@ class ServerTasks(BaseTasks):
             os.path.join(SETTINGS_CONFIG_PATH, "common"),
         )
 
-    @task("Installing IBEX Server")
+    @task("Installing IBEX Server", inputs=["_server_source_dir"])
     def install_ibex_server(self, use_old_galil: bool | None = None) -> None:
         """Install ibex server.
 
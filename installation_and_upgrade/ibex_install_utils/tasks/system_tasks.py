@@ -11,11 +11,12 @@ import requests
 from ibex_install_utils.admin_runner import AdminCommandBuilder
 from ibex_install_utils.exceptions import ErrorInTask, UserStop
 from ibex_install_utils.kafka_utils import add_required_topics
-from ibex_install_utils.run_process import RunProcess
+from ibex_install_utils.run_process import RunProcess, run_many
 from ibex_install_utils.software_dependency.git import Git
 from ibex_install_utils.task import task
 from ibex_install_utils.tasks import BaseTasks
 from ibex_install_utils.tasks.common_paths import APPS_BASE_DIR, EPICS_PATH, UV, VAR_DIR
+from ibex_install_utils.tree_walk import walk_parallel
 from ibex_install_utils.version_check import version_check
 from win32com.client import Dispatch
 
@@ -24,6 +25,7 @@ GIGABYTE = 1024**3
 RAM_MIN = 7.5 * GIGABYTE  # 8 GB minus a small tolerance.
 RAM_NORMAL_INSTRUMENT = 13 * GIGABYTE  # Should be 14GB ideally, but allow anything over 13GB.
 FREE_DISK_MIN = 30 * GIGABYTE
+VENV_SYNC_CONCURRENCY = 4
 
 CURRENT_USER = os.getlogin()
 USER_STARTUP = os.path.join(
@@ -112,12 +114,16 @@ class SystemTasks(BaseTasks):
 
     @task("Create virtual environments for python processes")
     def create_virtual_envs(self) -> None:
-        dirs_with_venvs = []
-        for root, _, files in os.walk(EPICS_PATH):
-            for file in files:
-                if file == "requirements-frozen.txt":
-                    dirs_with_venvs.append(root)
+        dirs_with_venvs = sorted(
+            directory
+            for directory, files in walk_parallel(
+                EPICS_PATH, prune=lambda entry: entry.name in (".git", ".venv")
+            )
+            if any(entry.name == "requirements-frozen.txt" for entry in files)
+        )
 
+        # Each venv is independent, so several are synced at once; uv's cache is safe to share
+        syncs = []
         for directory in dirs_with_venvs:
             print(f"Syncing venv using uv in {directory}")
             venv_name = ".venv"
@@ -125,23 +131,29 @@ class SystemTasks(BaseTasks):
             if os.path.exists(venv):
                 shutil.rmtree(venv)
 
-            RunProcess(
-                working_dir=os.path.join(directory),
-                executable_file=UV,
-                prog_args=["venv", venv_name],
-                env={},
-                expected_return_codes=0,
-            ).run()
-
             activate_script = os.path.join(venv, "Scripts", "activate")
-
-            RunProcess(
-                working_dir=os.path.join(directory),
-                executable_file=os.environ["COMSPEC"],
-                prog_args=["/c", f"{activate_script} && {UV} pip sync requirements-frozen.txt"],
-                env={},
-                expected_return_codes=0,
-            ).run()
+            syncs.append(
+                [
+                    RunProcess(
+                        working_dir=os.path.join(directory),
+                        executable_file=UV,
+                        prog_args=["venv", venv_name],
+                        env={},
+                        expected_return_codes=0,
+                    ),
+                    RunProcess(
+                        working_dir=os.path.join(directory),
+                        executable_file=os.environ["COMSPEC"],
+                        prog_args=[
+                            "/c",
+                            f"{activate_script} && {UV} pip sync requirements-frozen.txt",
+                        ],
+                        env={},
+                        expected_return_codes=0,
+                    ),
+                ]
+            )
+        run_many(syncs, max_concurrency=VENV_SYNC_CONCURRENCY)
 
     @task("Add Nagios checks")
     def add_nagios_checks(self) -> None:
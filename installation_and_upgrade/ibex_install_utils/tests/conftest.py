@@ -0,0 +1,20 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def members_of():
+    """
+    Returns a function listing the files below a directory as (path, name, size, mtime), as
+    given to the archive writers.
+    """
+
+    def _members_of(directory):
+        return [
+            (str(path), os.path.relpath(path, directory), path.stat().st_size, path.stat().st_mtime)
+            for path in sorted(directory.rglob("*"))
+            if path.is_file()
+        ]
+
+    return _members_of
@@ -0,0 +1,45 @@
+import os
+from unittest.mock import patch
+
+from ibex_install_utils.backup_store import BackupStore
+
+
+class TestBackupStore:
+    def test_GIVEN_unchanged_files_WHEN_backing_up_again_THEN_only_changed_files_stored(
+        self, tmp_path, members_of
+    ):
+        src = tmp_path / "Settings"
+        (src / "config").mkdir(parents=True)
+        (src / "config" / "blocks.xml").write_text("<blocks/>")
+        (src / "VERSION.txt").write_text("1.0.0")
+        store = BackupStore(str(tmp_path / "backup_store"))
+        store.backup("Settings", members_of(src), str(tmp_path / "first.store.json.gz"))
+
+        (src / "VERSION.txt").write_text("2.0.0")
+        os.utime(src / "VERSION.txt", (0, 0))
+        with patch.object(store, "add_file", wraps=store.add_file) as add_file:
+            store.backup("Settings", members_of(src), str(tmp_path / "second.store.json.gz"))
+
+        add_file.assert_called_once_with(str(src / "VERSION.txt"))
+        assert store.missing(str(tmp_path / "first.store.json.gz")) == []
+        assert store.prune() == 1
+        assert store.missing(str(tmp_path / "second.store.json.gz")) == []
+
+    def test_WHEN_restoring_with_pattern_THEN_only_matching_files_restored(
+        self, tmp_path, members_of
+    ):
+        src = tmp_path / "Settings"
+        (src / "config").mkdir(parents=True)
+        (src / "config" / "blocks.xml").write_text("<blocks/>")
+        (src / "VERSION.txt").write_text("1.0.0")
+        os.utime(src / "config" / "blocks.xml", (1000000000, 1000000000))
+        store = BackupStore(str(tmp_path / "backup_store"))
+        manifest = str(tmp_path / "Settings.store.json.gz")
+        store.backup("Settings", members_of(src), manifest)
+
+        restored = store.restore(manifest, str(tmp_path / "restored"), ["config/*"])
+
+        assert restored == 1
+        assert (tmp_path / "restored" / "config" / "blocks.xml").read_text() == "<blocks/>"
+        assert (tmp_path / "restored" / "config" / "blocks.xml").stat().st_mtime == 1000000000
+        assert not (tmp_path / "restored" / "VERSION.txt").exists()
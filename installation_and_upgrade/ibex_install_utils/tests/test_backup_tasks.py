@@ -1,10 +1,17 @@
 import io
 import os
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, call, patch
 
+import pytest
+from ibex_install_utils.file_utils import FileUtils
 from ibex_install_utils.progress_bar import ProgressBar
 from ibex_install_utils.tasks import BaseTasks
-from ibex_install_utils.tasks.backup_tasks import BackupTasks
+from ibex_install_utils.tasks.backup_tasks import (
+    ALL_INSTALL_DIRECTORIES,
+    DIRECTORIES_TO_BACKUP,
+    BackupTasks,
+)
+from ibex_install_utils.tree_walk import TreeStats
 from ibex_install_utils.user_prompt import UserPrompt
 
 
@@ -24,20 +31,122 @@ class TestBackupTasks:
         def mock_get_backup_dir():
             return backup_path
 
-        BaseTasks._get_backup_dir = Mock(side_effect=mock_get_backup_dir)
-        os.path.exists = Mock()
         prompter = UserPrompt(True, False)
 
-        # For the purpose of testing, we don't need to properly set up the BackupTasks() constructor
-        # method, so '' is an empty argument to placehold
-        BackupTasks(prompter, "", "", "", "").backup_checker()
+        # Patch rather than assign, so other tests still see the real os.path.exists
+        with (
+            patch.object(BaseTasks, "_get_backup_dir", Mock(side_effect=mock_get_backup_dir)),
+            patch("os.path.exists") as exists,
+            patch.object(BackupTasks, "_verify_zip_backup") as verify_zip_backup,
+        ):
+            # For the purpose of testing, we don't need to properly set up the BackupTasks()
+            # constructor method, so '' is an empty argument to placehold
+            BackupTasks(prompter, "", "", "", "").backup_checker()
 
+        # Every backup looks like a zip, as everything exists, so each zip is checked
+        assert verify_zip_backup.call_count == len(DIRECTORIES_TO_BACKUP)
+
+        # Joined rather than written out, so the test also runs where the separator is "/"
         for dir in [
-            f"{backup_path}EPICS\\VERSION.txt",
-            f"{backup_path}Python3\\VERSION.txt",
-            f"{backup_path}Client_E4\\VERSION.txt",
-            f"{backup_path}Settings",
-            f"{backup_path}Autosave",
-            f"{backup_path}EPICS_UTILS",
+            os.path.join(backup_path, "EPICS", "VERSION.txt"),
+            os.path.join(backup_path, "Python3", "VERSION.txt"),
+            os.path.join(backup_path, "Client_E4", "VERSION.txt"),
+            os.path.join(backup_path, "Settings"),
+            os.path.join(backup_path, "Autosave"),
+            os.path.join(backup_path, "EPICS_UTILS"),
         ]:
-            os.path.exists.assert_any_call(dir)
+            exists.assert_any_call(dir)
+
+    @pytest.mark.parametrize("verify_mode,fraction", [("quick", 0.0), ("sample", 0.05)])
+    def test_GIVEN_zip_backups_WHEN_verifying_backup_THEN_each_zip_checked_once(
+        self, verify_mode, fraction
+    ):
+        tasks = BackupTasks(UserPrompt(True, False), "", "", "", "")
+
+        with (
+            patch.object(BaseTasks, "_get_backup_dir", Mock(return_value="backup")),
+            patch("os.path.exists", return_value=True),
+            patch("ibex_install_utils.current_args.BACKUP_VERIFY", verify_mode),
+            patch.object(BackupTasks, "_verify_zip_backup") as verify_zip_backup,
+        ):
+            tasks.backup_checker()
+
+        assert verify_zip_backup.call_args_list == [
+            call(os.path.join("backup", os.path.basename(path)) + ".zip", fraction)
+            for path in DIRECTORIES_TO_BACKUP
+        ]
+
+    def test_GIVEN_source_missing_WHEN_backing_up_THEN_user_told_and_nothing_written(
+        self, tmp_path
+    ):
+        prompt = Mock()
+        tasks = BackupTasks(prompt, "", "", "", "")
+
+        with patch.object(BaseTasks, "_get_backup_dir", Mock(return_value=str(tmp_path))):
+            tasks._backup_dir(str(tmp_path / "EPICS"), copy=True)
+
+        (message,), _ = prompt.prompt_and_raise_if_not_yes.call_args
+        assert "doesn't exist on this machine" in message
+        assert os.listdir(tmp_path) == []
+
+    def test_GIVEN_source_unreadable_WHEN_backing_up_THEN_user_told_and_nothing_written(
+        self, tmp_path
+    ):
+        src = tmp_path / "EPICS"
+        src.mkdir()
+        backup_dir = tmp_path / "backup"
+        backup_dir.mkdir()
+        prompt = Mock()
+        tasks = BackupTasks(prompt, "", "", "", "")
+
+        with (
+            patch.object(BaseTasks, "_get_backup_dir", Mock(return_value=str(backup_dir))),
+            patch("ibex_install_utils.tasks.backup_tasks.BACKUP_DIR", str(backup_dir)),
+            patch("os.scandir", side_effect=PermissionError(13, "Access is denied", str(src))),
+        ):
+            tasks._backup_dir(str(src), copy=True)
+
+        (message,), _ = prompt.prompt_and_raise_if_not_yes.call_args
+        assert "no permission" in message
+        assert os.listdir(backup_dir) == []
+
+    def test_GIVEN_cached_size_larger_than_free_space_WHEN_checking_backup_space_THEN_user_asked(
+        self, tmp_path
+    ):
+        prompt = Mock()
+        tasks = BackupTasks(prompt, "", "", "", "")
+
+        with (
+            patch.object(FileUtils, "cached_tree_stats", return_value=TreeStats(3 * 1024**3, 10)),
+            patch("shutil.disk_usage", side_effect=[(0, 0, 1024**3), (0, 0, 4 * 1024**3)]),
+            patch("ibex_install_utils.tasks.backup_tasks.BACKUP_DIR", str(tmp_path)),
+        ):
+            assert tasks._check_backup_space(str(tmp_path / "EPICS")) == 3 * 1024**3
+
+        (message,), _ = prompt.prompt_and_raise_if_not_yes.call_args
+        assert "Free up 2.0 GB" in message
+
+    def test_GIVEN_tree_partly_unreadable_WHEN_checking_backup_space_THEN_rest_of_tree_sized(
+        self, tmp_path
+    ):
+        src = tmp_path / "EPICS"
+        src.mkdir()
+        (src / "VERSION.txt").write_text("1.0.0")
+        tasks = BackupTasks(Mock(), "", "", "", "")
+
+        with (
+            patch.object(FileUtils, "cached_tree_stats", side_effect=PermissionError(13, "")),
+            patch("ibex_install_utils.tasks.backup_tasks.BACKUP_DIR", str(tmp_path)),
+        ):
+            assert tasks._check_backup_space(str(src)) == 5
+
+    def test_WHEN_removing_old_ibex_THEN_each_install_directory_removed(self):
+        file_utils = Mock()
+        prompter = UserPrompt(True, False)
+        tasks = BackupTasks(prompter, "", "", "", "", file_utils)
+
+        tasks.remove_old_ibex()
+
+        assert file_utils.remove_tree.call_args_list == [
+            call(path, prompter, leave_top_if_link=True) for path in ALL_INSTALL_DIRECTORIES
+        ]
@@ -0,0 +1,52 @@
+import gzip
+import json
+import os
+import shutil
+from unittest.mock import patch
+
+from ibex_install_utils.dir_size_index import DirSizeIndex
+from ibex_install_utils.tree_walk import TreeStats
+
+
+def _make_tree(tmp_path):
+    root = tmp_path / "EPICS"
+    for i in range(5):
+        directory = root / f"ioc_{i}" / "db"
+        directory.mkdir(parents=True)
+        (directory / "ioc.db").write_bytes(b"x" * 100)
+    return root
+
+
+class TestDirSizeIndex:
+    def test_GIVEN_unchanged_tree_WHEN_sized_again_THEN_no_directory_listed(self, tmp_path):
+        root = _make_tree(tmp_path)
+        index_path = str(tmp_path / "index.json.gz")
+        assert DirSizeIndex(index_path).tree_stats(str(root)) == TreeStats(500, 5)
+
+        with patch("os.scandir", side_effect=AssertionError("listed")):
+            assert DirSizeIndex(index_path).tree_stats(str(root)) == TreeStats(500, 5)
+
+    def test_GIVEN_files_added_and_removed_WHEN_sized_again_THEN_changes_counted(self, tmp_path):
+        root = _make_tree(tmp_path)
+        index = DirSizeIndex(str(tmp_path / "index.json.gz"))
+        index.tree_stats(str(root))
+
+        (root / "ioc_0" / "db" / "new.db").write_bytes(b"x" * 50)
+        shutil.rmtree(root / "ioc_1")
+        (root / "ioc_2" / "extra").mkdir()
+        (root / "ioc_2" / "extra" / "extra.db").write_bytes(b"x" * 10)
+
+        assert index.tree_stats(str(root)) == TreeStats(460, 6)
+        assert not any(d.startswith(os.path.join(str(root), "ioc_1")) for d in index._load())
+
+    def test_GIVEN_index_of_another_format_version_WHEN_sized_THEN_index_discarded(self, tmp_path):
+        root = _make_tree(tmp_path)
+        index_path = str(tmp_path / "index.json.gz")
+        DirSizeIndex(index_path).tree_stats(str(root))
+        with gzip.open(index_path, "rt", encoding="utf-8") as f:
+            index = json.load(f)
+        index["version"] += 1
+        with gzip.open(index_path, "wt", encoding="utf-8") as f:
+            json.dump(index, f)
+
+        assert DirSizeIndex(index_path)._load() == {}
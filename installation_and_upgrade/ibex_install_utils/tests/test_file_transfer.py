@@ -0,0 +1,144 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from ibex_install_utils.exceptions import ErrorWithFile
+from ibex_install_utils.file_transfer import (
+    PARTIAL_EXTENSION,
+    VERIFY_SIZE,
+    TreeTransfer,
+    move_file,
+)
+
+
+class TestTreeTransfer:
+    def test_GIVEN_partial_copy_WHEN_moving_THEN_copy_resumed_and_source_removed(self, tmp_path):
+        src = tmp_path / "ibex_backup_1"
+        (src / "EPICS").mkdir(parents=True)
+        (src / "EPICS" / "VERSION.txt").write_text("1.0.0")
+        (src / "Settings.zip").write_bytes(b"settings" * 1000)
+        dst = tmp_path / "share" / "ibex_backup_1"
+        dst.mkdir(parents=True)
+        # An earlier move was interrupted part way through copying the zip
+        (dst / ("Settings.zip" + PARTIAL_EXTENSION)).write_bytes(b"settings" * 100)
+
+        with patch("ibex_install_utils.file_transfer._same_volume", return_value=False):
+            errors = TreeTransfer(workers=2).move_trees([(str(src), str(dst))])
+
+        assert errors == {}
+        assert (dst / "Settings.zip").read_bytes() == b"settings" * 1000
+        assert (dst / "EPICS" / "VERSION.txt").read_text() == "1.0.0"
+        assert not (dst / ("Settings.zip" + PARTIAL_EXTENSION)).exists()
+        assert not src.exists()
+
+    def test_WHEN_copy_does_not_match_THEN_error_returned_and_source_kept(self, tmp_path):
+        src = tmp_path / "ibex_backup_1"
+        src.mkdir()
+        (src / "Settings.zip").write_bytes(b"settings" * 1000)
+        dst = tmp_path / "share" / "ibex_backup_1"
+
+        transfer = TreeTransfer(retries=2, retry_delay=0)
+        with (
+            patch("ibex_install_utils.file_transfer._same_volume", return_value=False),
+            patch("ibex_install_utils.file_transfer._sha256", return_value="corrupt"),
+        ):
+            transfer.start([(str(src), str(dst))])
+            errors = transfer.wait()
+
+        assert list(errors) == [str(src)]
+        assert "does not match" in errors[str(src)][0]
+        assert (src / "Settings.zip").exists()
+        assert not (dst / "Settings.zip").exists()
+        assert transfer.wait() == {}
+
+    def test_GIVEN_different_file_of_same_size_at_destination_WHEN_moving_THEN_overwritten(
+        self, tmp_path
+    ):
+        src = tmp_path / "Settings.zip"
+        src.write_bytes(b"new settings")
+        dst = tmp_path / "share" / "Settings.zip"
+        dst.parent.mkdir()
+        dst.write_bytes(b"old settings")
+        mtime = src.stat().st_mtime
+
+        move_file(str(src), str(dst), len(b"new settings"), mtime, verify=VERIFY_SIZE)
+
+        assert dst.read_bytes() == b"new settings"
+        assert not src.exists()
+
+    def test_GIVEN_partial_copy_of_older_source_WHEN_moving_THEN_copied_again(self, tmp_path):
+        src = tmp_path / "Settings.zip"
+        src.write_bytes(b"new settings" * 1000)
+        dst = tmp_path / "share" / "Settings.zip"
+        dst.parent.mkdir()
+        # An interrupted move of the file as it was before it was rewritten
+        (tmp_path / "share" / ("Settings.zip" + PARTIAL_EXTENSION)).write_bytes(b"old" * 1000)
+
+        move_file(str(src), str(dst), len(b"new settings" * 1000), src.stat().st_mtime, VERIFY_SIZE)
+
+        assert dst.read_bytes() == b"new settings" * 1000
+        assert not src.exists()
+
+    def test_GIVEN_source_changed_since_listed_WHEN_moving_THEN_error_and_source_kept(
+        self, tmp_path
+    ):
+        src = tmp_path / "Settings.zip"
+        src.write_bytes(b"settings")
+        dst = tmp_path / "share" / "Settings.zip"
+        # Written to again a minute after it was listed
+        listed_mtime = src.stat().st_mtime - 60
+
+        with pytest.raises(ErrorWithFile):
+            move_file(str(src), str(dst), len(b"settings"), listed_mtime, verify=VERIFY_SIZE)
+
+        assert src.exists()
+        assert not dst.exists()
+
+    def test_GIVEN_same_volume_WHEN_moving_into_existing_dir_THEN_files_renamed(self, tmp_path):
+        src = tmp_path / "EPICS"
+        (src / "support").mkdir(parents=True)
+        (src / "support" / "module.db").write_text("record")
+        dst = tmp_path / "old" / "EPICS"
+        (dst / "support").mkdir(parents=True)
+        (dst / "support" / "module.db").write_text("older")
+        inode = (src / "support" / "module.db").stat().st_ino
+
+        with patch("ibex_install_utils.file_transfer.move_file") as move_file:
+            errors = TreeTransfer(verify=VERIFY_SIZE).move_trees([(str(src), str(dst))])
+
+        assert errors == {}
+        move_file.assert_not_called()
+        assert (dst / "support" / "module.db").read_text() == "record"
+        assert (dst / "support" / "module.db").stat().st_ino == inode
+        assert not src.exists()
+
+    def test_GIVEN_move_running_WHEN_starting_another_THEN_waits_for_it_and_keeps_its_errors(self):
+        transfer = TreeTransfer()
+        running = []
+
+        def _move_trees(moves):
+            running.append(moves)
+            time.sleep(0.1)
+            assert running == [moves]
+            running.remove(moves)
+            return {src: [f"could not move {src}"] for src, _ in moves}
+
+        with patch.object(transfer, "move_trees", side_effect=_move_trees):
+            transfer.start([("ibex_backup_1", "share")])
+            transfer.start([("ibex_backup_2", "share")])
+            errors = transfer.wait()
+
+        assert errors == {
+            "ibex_backup_1": ["could not move ibex_backup_1"],
+            "ibex_backup_2": ["could not move ibex_backup_2"],
+        }
+
+    def test_GIVEN_unexpected_error_WHEN_moving_in_background_THEN_raised_by_wait(self):
+        transfer = TreeTransfer()
+
+        with patch.object(transfer, "move_trees", side_effect=ValueError("bad manifest")):
+            transfer.start([("ibex_backup_1", "share")])
+            with pytest.raises(ValueError, match="bad manifest"):
+                transfer.wait()
+
+        assert transfer.wait() == {}
@@ -0,0 +1,27 @@
+import os
+import shutil
+
+from ibex_install_utils.file_utils import FileUtils
+
+
+class TestFileUtils:
+    def test_GIVEN_ignore_patterns_WHEN_building_manifest_THEN_ignored_files_and_dirs_skipped(
+        self, tmp_path
+    ):
+        (tmp_path / "ioc" / ".git").mkdir(parents=True)
+        (tmp_path / "ioc" / ".git" / "config").write_text("ignored")
+        (tmp_path / "ioc" / "st.cmd").write_text("dbLoadRecords")
+        (tmp_path / "crash.dmp").write_text("ignored")
+        (tmp_path / "VERSION.txt").write_text("1.0.0")
+
+        manifest = FileUtils.build_manifest(
+            str(tmp_path), ignore=shutil.ignore_patterns("*.*dmp", ".git")
+        )
+
+        assert sorted((entry.relpath, entry.size) for entry in manifest) == [
+            ("VERSION.txt", 5),
+            (os.path.join("ioc", "st.cmd"), 13),
+        ]
+        assert FileUtils.get_size_and_number_of_files(
+            str(tmp_path), ignore=shutil.ignore_patterns("*.*dmp", ".git")
+        ) == (18, 2)
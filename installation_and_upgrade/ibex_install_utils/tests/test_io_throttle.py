@@ -0,0 +1,51 @@
+import io
+from unittest.mock import patch
+
+from ibex_install_utils.io_throttle import THROTTLED_READ_SIZE, IOThrottle
+
+
+class TestIOThrottle:
+    def test_WHEN_reading_faster_than_limit_THEN_sleeps_to_keep_to_limit(self):
+        throttle = IOThrottle(max_bytes_per_second=THROTTLED_READ_SIZE)
+        data = bytes(3 * THROTTLED_READ_SIZE)
+
+        with patch("time.sleep") as sleep:
+            assert throttle.read(io.BytesIO(data)) == data
+
+        # The first second's worth is allowed straight away, the rest must wait
+        assert 1.9 < sum(call.args[0] for call in sleep.call_args_list) <= 2.0
+
+    def test_GIVEN_adaptive_WHEN_reads_are_slow_THEN_backs_off_then_recovers(self):
+        throttle = IOThrottle(
+            max_bytes_per_second=8 * THROTTLED_READ_SIZE,
+            adaptive=True,
+            target_latency=0.05,
+            min_bytes_per_second=THROTTLED_READ_SIZE,
+        )
+
+        with patch("time.sleep"):
+            for _ in range(10):
+                throttle.throttle(THROTTLED_READ_SIZE, latency=1.0)
+            assert throttle.bytes_per_second == THROTTLED_READ_SIZE
+
+            for _ in range(10):
+                throttle.throttle(THROTTLED_READ_SIZE, latency=0.001)
+            assert throttle.bytes_per_second == 8 * THROTTLED_READ_SIZE
+
+    def test_GIVEN_adaptive_WHEN_small_reads_are_quick_THEN_does_not_back_off(self):
+        throttle = IOThrottle(
+            max_bytes_per_second=8 * THROTTLED_READ_SIZE,
+            adaptive=True,
+            target_latency=0.05,
+            min_bytes_per_second=THROTTLED_READ_SIZE,
+        )
+
+        with patch("time.sleep"):
+            # e.g. the files of autosave, read from an otherwise idle disk
+            for _ in range(1000):
+                throttle.throttle(4096, latency=0.001)
+            assert throttle.bytes_per_second == 8 * THROTTLED_READ_SIZE
+
+            for _ in range(10):
+                throttle.throttle(4096, latency=0.2)
+            assert throttle.bytes_per_second == THROTTLED_READ_SIZE
@@ -0,0 +1,171 @@
+import os
+import zipfile
+import zlib
+
+import pytest
+from ibex_install_utils.parallel_zip import (
+    CompressionPolicy,
+    ParallelZipWriter,
+    ZipJournal,
+    crc32_combine,
+    extract_zip,
+    verify_zip,
+    write_zip_manifest,
+)
+
+
+class TestParallelZip:
+    def test_WHEN_combining_crcs_THEN_same_as_crc_of_concatenated_data(self):
+        first, second = b"IBEX backup " * 100, bytes(range(256)) * 7
+        assert crc32_combine(zlib.crc32(first), zlib.crc32(second), len(second)) == zlib.crc32(
+            first + second
+        )
+        assert crc32_combine(zlib.crc32(first), zlib.crc32(b""), 0) == zlib.crc32(first)
+
+    def test_WHEN_writing_in_parallel_THEN_standard_zip_with_all_members_in_order(self, tmp_path):
+        contents = {
+            "empty.txt": b"",
+            "VERSION.txt": b"1.2.3",
+            os.path.join("sub", "large.db"): os.urandom(1000) + b"record\n" * 50000,
+        }
+        members = []
+        for name, data in contents.items():
+            path = tmp_path / "src" / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            members.append((str(path), name, len(data), path.stat().st_mtime))
+
+        archive = tmp_path / "backup.zip"
+        with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            ParallelZipWriter(zf, workers=3, chunk_size=4096).write_all(members)
+
+        with zipfile.ZipFile(archive) as zf:
+            assert zf.testzip() is None
+            assert zf.namelist() == ["empty.txt", "VERSION.txt", "sub/large.db"]
+            for name, data in contents.items():
+                assert zf.read(name.replace(os.sep, "/")) == data
+
+    def test_GIVEN_compressed_files_WHEN_writing_THEN_stored_without_deflating(self, tmp_path):
+        contents = {
+            "app.jar": b"manifest " * 1000,
+            "random.bin": os.urandom(2000),
+            "large_random.bin": os.urandom(100000),
+            "blocks.xml": b"<block/>" * 1000,
+        }
+        members = []
+        for name, data in contents.items():
+            (tmp_path / name).write_bytes(data)
+            members.append((str(tmp_path / name), name, len(data), 0))
+
+        archive = tmp_path / "backup.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            writer = ParallelZipWriter(
+                zf, chunk_size=4096, policy=CompressionPolicy([".jar"], probe_size=1024)
+            )
+            writer.write_all(members)
+
+        with zipfile.ZipFile(archive) as zf:
+            assert zf.testzip() is None
+            assert {zinfo.filename: zinfo.compress_type for zinfo in zf.infolist()} == {
+                "app.jar": zipfile.ZIP_STORED,
+                "random.bin": zipfile.ZIP_STORED,
+                "large_random.bin": zipfile.ZIP_STORED,
+                "blocks.xml": zipfile.ZIP_DEFLATED,
+            }
+            for name, data in contents.items():
+                assert zf.read(name) == data
+        assert writer.stats.stored_files == 3
+        assert writer.stats.stored_bytes == 111000
+
+    def test_GIVEN_corrupted_member_WHEN_verifying_THEN_problems_reported(self, tmp_path):
+        source = tmp_path / "VERSION.txt"
+        source.write_bytes(b"1.2.3 " * 1000)
+        archive = tmp_path / "backup.zip"
+        manifest = tmp_path / "backup.zip.members.json.gz"
+        written = []
+        with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            ParallelZipWriter(zf, workers=2).write_all(
+                [(str(source), "VERSION.txt", source.stat().st_size, source.stat().st_mtime)],
+                on_written=lambda path, zinfo: written.append(zinfo),
+            )
+        write_zip_manifest(str(manifest), written)
+        assert verify_zip(str(archive), str(manifest), fraction=1) == []
+
+        with zipfile.ZipFile(archive) as zf:
+            data_offset = zf.getinfo("VERSION.txt").header_offset + 30 + len("VERSION.txt")
+        with open(archive, "r+b") as f:
+            f.seek(data_offset + 5)
+            byte = f.read(1)
+            f.seek(data_offset + 5)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+        assert verify_zip(str(archive), str(manifest), fraction=0) == []
+        assert len(verify_zip(str(archive), str(manifest), fraction=1)) == 1
+
+    def test_GIVEN_member_not_in_manifest_WHEN_verifying_THEN_problem_reported(self, tmp_path):
+        archive = tmp_path / "backup.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("VERSION.txt", "1.2.3")
+            zf.writestr("extra.txt", "not written by the backup")
+        manifest = tmp_path / "backup.zip.members.json.gz"
+        with zipfile.ZipFile(archive) as zf:
+            write_zip_manifest(str(manifest), [zf.getinfo("VERSION.txt")])
+
+        assert verify_zip(str(archive), str(manifest), fraction=0) == [
+            "extra.txt is not in the manifest"
+        ]
+
+    def test_GIVEN_zip_opened_to_append_WHEN_creating_writer_THEN_error(self, tmp_path):
+        with zipfile.ZipFile(tmp_path / "backup.zip", "w"):
+            pass
+        with zipfile.ZipFile(tmp_path / "backup.zip", "a") as zf:
+            with pytest.raises(ValueError):
+                ParallelZipWriter(zf)
+
+    def test_GIVEN_interrupted_zip_WHEN_resuming_from_journal_THEN_only_remaining_files_written(
+        self, tmp_path
+    ):
+        members = []
+        for name in ["a.txt", "b.txt", "c.txt"]:
+            (tmp_path / name).write_text(name * 1000)
+            members.append((str(tmp_path / name), name, 5000, (tmp_path / name).stat().st_mtime))
+        archive = str(tmp_path / "backup.zip")
+
+        journal = ZipJournal(archive)
+        zf, written, remaining = journal.open(members)
+        ParallelZipWriter(zf).write_all(remaining[:2], on_written=journal.record)
+        journal.close()
+        zf.fp.write(b"partly written member")
+        zf.close()
+
+        journal = ZipJournal(archive)
+        zf, written, remaining = journal.open(members)
+        assert [zinfo.filename for zinfo in written] == ["a.txt", "b.txt"]
+        assert remaining == members[2:]
+        with zf:
+            ParallelZipWriter(zf).write_all(remaining, on_written=journal.record)
+        journal.remove()
+
+        with zipfile.ZipFile(archive) as zf:
+            assert zf.testzip() is None
+            assert zf.namelist() == ["a.txt", "b.txt", "c.txt"]
+        assert not (tmp_path / "backup.zip.journal").exists()
+
+    def test_WHEN_extracting_in_parallel_THEN_matching_files_restored_with_mtimes(self, tmp_path):
+        members = []
+        for name in ["VERSION.txt", "config/a/blocks.xml", "config/b/blocks.xml"]:
+            path = tmp_path / "src" / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(name * 100)
+            os.utime(path, (1000000000, 1000000000))
+            members.append((str(path), name, path.stat().st_size, path.stat().st_mtime))
+        archive = tmp_path / "Settings.zip"
+        with zipfile.ZipFile(archive, "w") as zf:
+            ParallelZipWriter(zf).write_all(members)
+
+        assert extract_zip(str(archive), str(tmp_path / "restored"), ["config/*"], workers=4) == 2
+
+        restored = tmp_path / "restored"
+        assert (restored / "config" / "b" / "blocks.xml").read_text() == "config/b/blocks.xml" * 100
+        assert (restored / "config" / "a" / "blocks.xml").stat().st_mtime == 1000000000
+        assert not (restored / "VERSION.txt").exists()
@@ -0,0 +1,84 @@
+import io
+import struct
+import zipfile
+from unittest.mock import patch
+
+import pytest
+from ibex_install_utils.file_utils import get_version, get_version_in_zip
+from ibex_install_utils.pe_version import PEFormatError, read_file_version
+from ibex_install_utils.software_dependency import _VersionCache
+from ibex_install_utils.software_dependency.git import Git
+from ibex_install_utils.software_dependency.mysql import MySQL
+
+_SECTION_RVA = 0x1000
+_SECTION_OFFSET = 0x200
+
+
+def _make_exe(version: tuple[int, int, int, int]) -> bytes:
+    """A minimal 64 bit PE file with just a version resource"""
+    major, minor, patch_, build = version
+    fixed_info = struct.pack(
+        "<4I9I", 0xFEEF04BD, 0x10000, major << 16 | minor, patch_ << 16 | build, *[0] * 9
+    )
+    key = "VS_VERSION_INFO".encode("utf-16-le") + b"\0\0"
+    version_info = struct.pack("<HHH", 6 + len(key) + 2 + len(fixed_info), len(fixed_info), 0)
+    version_info += key + b"\0\0" + fixed_info
+
+    def directory(entry_id, offset):
+        return struct.pack("<IIHHHH", 0, 0, 0, 0, 0, 1) + struct.pack("<II", entry_id, offset)
+
+    resources = directory(16, 0x80000000 | 24) + directory(1, 0x80000000 | 48)
+    resources += directory(1033, 72) + struct.pack(
+        "<IIII", _SECTION_RVA + 88, len(version_info), 0, 0
+    )
+    resources += version_info
+
+    optional_header = bytearray(240)
+    struct.pack_into("<H", optional_header, 0, 0x20B)
+    struct.pack_into("<I", optional_header, 108, 16)
+    struct.pack_into("<II", optional_header, 112 + 16, _SECTION_RVA, len(resources))
+    section = b".rsrc\0\0\0" + struct.pack(
+        "<IIII16x", len(resources), _SECTION_RVA, len(resources), _SECTION_OFFSET
+    )
+    headers = b"MZ" + bytes(0x3A) + struct.pack("<I", 64)
+    headers += b"PE\0\0" + struct.pack("<HHIIIHH", 0x8664, 1, 0, 0, 0, len(optional_header), 0)
+    headers += bytes(optional_header) + section
+    return headers.ljust(_SECTION_OFFSET, b"\0") + resources
+
+
+class TestPEVersion:
+    def test_WHEN_reading_exe_THEN_file_version_returned(self, tmp_path):
+        exe = tmp_path / "mysql.exe"
+        exe.write_bytes(_make_exe((8, 0, 32, 0)))
+
+        assert get_version(str(exe)) == "8.0.32.0"
+
+    def test_WHEN_reading_exe_in_zip_THEN_version_read_without_extracting(self, tmp_path):
+        zip_path = tmp_path / "mysql-8.0.32-winx64.zip"
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("mysql-8.0.32-winx64/bin/mysql.exe", _make_exe((8, 0, 32, 0)))
+
+        with patch("tempfile.NamedTemporaryFile", side_effect=AssertionError("extracted")):
+            assert MySQL().get_version_of(str(zip_path)) == "8.0.32.0"
+        assert get_version_in_zip(str(zip_path), "missing.exe") is None
+
+    def test_GIVEN_not_an_exe_WHEN_reading_THEN_error_raised(self):
+        with pytest.raises(PEFormatError):
+            read_file_version(io.BytesIO(b"MZ" + bytes(100)))
+
+    def test_GIVEN_git_installers_WHEN_finding_latest_THEN_highest_version_returned(self, tmp_path):
+        for version in [(2, 3, 0, 1), (2, 45, 1, 1), (2, 9, 0, 1)]:
+            name = "Git-{}.{}.{}-64-bit.exe".format(*version[:3])
+            (tmp_path / name).write_bytes(_make_exe(version))
+
+        with (
+            patch.object(Git, "get_search_dir", return_value=str(tmp_path)),
+            patch(
+                "ibex_install_utils.software_dependency._version_cache",
+                _VersionCache(str(tmp_path / "versions.json")),
+            ),
+        ):
+            latest, version = Git().find_latest()
+
+        assert latest == str(tmp_path / "Git-2.45.1-64-bit.exe")
+        assert version == "2.45.1.1"
@@ -0,0 +1,52 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from ibex_install_utils.logger import Logger
+from ibex_install_utils.progress_bar import ProgressBar
+
+
+class TestProgressBar:
+    @patch("sys.stdout", new_callable=io.StringIO)
+    def test_WHEN_updating_quickly_THEN_only_first_and_final_states_drawn(self, mockstdout):
+        progress_bar = ProgressBar(min_interval=60)
+        progress_bar.reset(total=1000, total_bytes=1000 * 1024)
+
+        for _ in range(1000):
+            progress_bar.update(nbytes=1024)
+
+        output = mockstdout.getvalue()
+        assert output.count("\r") == 2
+        assert output.startswith("\rProgress: [                    ] 0% (1 / 1000)")
+        assert "100% (1000 / 1000)" in output and "MB/s" in output
+        assert output.endswith("\n")
+
+    def test_GIVEN_logging_to_file_WHEN_updating_THEN_only_final_state_logged(self):
+        logger = Logger.__new__(Logger)
+        logger.console = io.StringIO()
+        logger.log = io.StringIO()
+        progress_bar = ProgressBar(min_interval=0)
+        progress_bar.reset(total=3)
+
+        with patch("sys.stdout", logger):
+            for _ in range(3):
+                progress_bar.update()
+
+        assert logger.console.getvalue().count("\r") == 3
+        assert logger.log.getvalue() == "\rProgress: [====================] 100% (3 / 3)\n"
+
+    @patch("sys.stdout", new_callable=io.StringIO)
+    def test_WHEN_updating_from_several_threads_THEN_all_counted_and_final_state_drawn_once(
+        self, mockstdout
+    ):
+        progress_bar = ProgressBar(min_interval=0)
+        progress_bar.reset(total=4000, total_bytes=4000)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for _ in pool.map(lambda _: progress_bar.update(nbytes=1), range(4000)):
+                pass
+        progress_bar.update(files=0)
+
+        assert (progress_bar.progress, progress_bar.bytes_done) == (4000, 4000)
+        assert mockstdout.getvalue().count("\n") == 1
+        assert "100% (4000 / 4000)" in mockstdout.getvalue().splitlines()[-1]
@@ -0,0 +1,145 @@
+import json
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+from ibex_install_utils import process_trace
+from ibex_install_utils.exceptions import ErrorInRun
+from ibex_install_utils.run_process import RunProcess, run_many
+
+
+def _python(working_dir, code, **kwargs):
+    return RunProcess(
+        working_dir=str(working_dir),
+        executable_file=os.path.basename(sys.executable),
+        executable_directory=os.path.dirname(sys.executable),
+        prog_args=["-c", code],
+        log_command_args=False,
+        **kwargs,
+    )
+
+
+class TestRunMany:
+    def test_WHEN_running_many_THEN_output_of_each_shown_together(self, tmp_path, capsys):
+        code = "import time\nfor i in range(3):\n print('p{}', i, flush=True); time.sleep(0.05)"
+        processes = [_python(tmp_path, code.format(n)) for n in range(3)]
+
+        run_many(processes, max_concurrency=3)
+
+        output = [
+            line for line in capsys.readouterr().out.splitlines() if line.startswith("    > ")
+        ]
+        assert len(output) == 9
+        for block in range(3):
+            assert len({line.split()[1] for line in output[3 * block : 3 * block + 3]}) == 1
+
+    def test_GIVEN_group_WHEN_first_fails_THEN_rest_of_group_not_run_and_error_raised(
+        self, tmp_path
+    ):
+        group = [
+            _python(tmp_path, "raise SystemExit(3)"),
+            _python(tmp_path, "open('ran', 'w')"),
+        ]
+        other = _python(tmp_path, "open('other', 'w')")
+
+        with pytest.raises(ErrorInRun, match="return code 3"):
+            run_many([group, other], max_concurrency=2)
+
+        assert not (tmp_path / "ran").exists()
+        assert (tmp_path / "other").exists()
+
+    def test_WHEN_return_code_expected_THEN_no_error_and_last_output_captured(self, tmp_path):
+        process = _python(
+            tmp_path,
+            "print('done'); raise SystemExit(1)",
+            expected_return_codes=[0, 1],
+            capture_last_output=True,
+        )
+
+        run_many([process])
+
+        assert process.captured_output == "done"
+
+
+class TestRunProcessOutput:
+    def test_GIVEN_long_output_WHEN_command_fails_THEN_tail_shown_and_all_kept_on_disk(
+        self, tmp_path, capsys
+    ):
+        output_path = tmp_path / "output.log"
+        process = _python(
+            tmp_path,
+            "for i in range(5000): print('line', i)\nraise SystemExit(2)",
+            tail_lines=10,
+            output_path=str(output_path),
+        )
+
+        with pytest.raises(ErrorInRun):
+            process.run()
+
+        assert process.output_tail == [f"line {i}" for i in range(4990, 5000)]
+        assert output_path.read_text().splitlines() == [f"line {i}" for i in range(5000)]
+        assert "    > line 4999\n --- " in capsys.readouterr().out
+
+    def test_WHEN_output_read_THEN_written_to_console_in_batches(self, tmp_path):
+        process = _python(tmp_path, "for i in range(5000): print('line', i)")
+
+        with patch("sys.stdout") as stdout:
+            process.run()
+
+        echoed = "".join(call.args[0] for call in stdout.write.call_args_list)
+        assert echoed.count("    > line ") == 5000
+        assert stdout.write.call_count < 100
+
+
+class TestProcessTrace:
+    def test_GIVEN_trace_set_up_WHEN_command_run_THEN_resources_recorded_and_summarised(
+        self, tmp_path, capsys
+    ):
+        process = _python(
+            tmp_path,
+            "import time\nx = bytearray(50 * 1024**2)\nfor i in range(1000): print('line', i)\n"
+            "time.sleep(0.3)",
+        )
+
+        with (
+            patch("ibex_install_utils.process_trace._trace", None),
+            patch("ibex_install_utils.process_trace.SAMPLE_INTERVAL", 0.02),
+        ):
+            trace_path = process_trace.set_up(str(tmp_path))
+            process.run()
+            process_trace.print_summary()
+
+        with open(trace_path) as f:
+            (record,) = [json.loads(line) for line in f]
+        assert record["program"] == os.path.basename(sys.executable)
+        assert record["exit_code"] == 0
+        assert record["output_bytes"] == len("".join(f"line {i}\n" for i in range(1000)))
+        assert record["wall_time"] > 0
+        assert record["peak_rss"] > 50 * 1024**2
+        assert os.path.basename(sys.executable) in capsys.readouterr().out
+
+    def test_GIVEN_reading_output_fails_WHEN_command_run_THEN_sampling_stopped(self, tmp_path):
+        process = _python(tmp_path, "print('line')")
+        monitors = []
+        real_monitor = process._monitor
+
+        def _monitor(*args):
+            monitors.append(real_monitor(*args))
+            return monitors[-1]
+
+        with (
+            patch("ibex_install_utils.process_trace._trace", None),
+            patch.object(process, "_monitor", _monitor),
+            patch.object(
+                process,
+                "output_no_progress",
+                side_effect=subprocess.CalledProcessError(1, "python"),
+            ),
+        ):
+            process_trace.set_up(str(tmp_path))
+            with pytest.raises(ErrorInRun):
+                process.run()
+
+        assert not monitors[0]._thread.is_alive()
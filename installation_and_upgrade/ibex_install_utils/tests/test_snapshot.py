@@ -0,0 +1,98 @@
+import os
+from unittest.mock import Mock, patch
+
+import ibex_install_utils.current_args
+from ibex_install_utils.file_utils import FileUtils
+from ibex_install_utils.snapshot import (
+    SNAPSHOT_MANIFEST_EXTENSION,
+    restore_snapshot,
+    snapshot_tree,
+    verify_snapshot,
+)
+from ibex_install_utils.tasks import BaseTasks
+from ibex_install_utils.tasks.backup_tasks import BackupTasks
+from ibex_install_utils.user_prompt import UserPrompt
+
+
+def _make_tree(tmp_path):
+    src = tmp_path / "EPICS"
+    (src / "config").mkdir(parents=True)
+    (src / "VERSION.txt").write_text("1.0.0")
+    (src / "config" / "blocks.xml").write_text("<blocks/>")
+    os.utime(src / "VERSION.txt", (1000000000, 1000000000))
+    return src
+
+
+class TestSnapshot:
+    def test_GIVEN_hard_links_allowed_WHEN_snapshotting_THEN_files_linked_and_restorable(
+        self, tmp_path
+    ):
+        src = _make_tree(tmp_path)
+        dst = tmp_path / "backup" / "EPICS"
+
+        counts = snapshot_tree(FileUtils.build_manifest(str(src)), str(dst), hard_links=True)
+
+        assert counts["reflink"] + counts["hard link"] == 2
+        if counts["hard link"]:
+            assert os.path.samefile(src / "VERSION.txt", dst / "VERSION.txt")
+        manifest = str(dst) + SNAPSHOT_MANIFEST_EXTENSION
+        assert verify_snapshot(manifest) == []
+
+        assert restore_snapshot(manifest, str(tmp_path / "restored"), ["config/*"]) == 1
+        assert (tmp_path / "restored" / "config" / "blocks.xml").read_text() == "<blocks/>"
+        assert not (tmp_path / "restored" / "VERSION.txt").exists()
+
+    def test_GIVEN_no_hard_links_WHEN_snapshotting_THEN_files_are_separate(self, tmp_path):
+        src = _make_tree(tmp_path)
+        dst = tmp_path / "backup" / "EPICS"
+
+        snapshot_tree(FileUtils.build_manifest(str(src)), str(dst))
+        (src / "VERSION.txt").write_text("2.0.0")
+
+        assert (dst / "VERSION.txt").read_text() == "1.0.0"
+        assert (dst / "VERSION.txt").stat().st_mtime == 1000000000
+
+    def test_WHEN_snapshot_file_removed_THEN_verify_reports_it(self, tmp_path):
+        src = _make_tree(tmp_path)
+        dst = tmp_path / "backup" / "EPICS"
+        snapshot_tree(FileUtils.build_manifest(str(src)), str(dst))
+
+        (dst / "config" / "blocks.xml").unlink()
+
+        assert verify_snapshot(str(dst) + SNAPSHOT_MANIFEST_EXTENSION) == [
+            "config/blocks.xml is missing"
+        ]
+
+    def test_GIVEN_installation_kept_WHEN_backed_up_and_overwritten_THEN_backup_unchanged(
+        self, tmp_path
+    ):
+        src = _make_tree(tmp_path)
+        backup_dir = tmp_path / "backup"
+        backup_dir.mkdir()
+        tasks = BackupTasks(UserPrompt(True, False), "", "", "", "")
+
+        with (
+            patch.object(ibex_install_utils.current_args, "BACKUP_FORMAT", "snapshot"),
+            patch.object(BaseTasks, "_get_backup_dir", Mock(return_value=str(backup_dir))),
+            patch("ibex_install_utils.tasks.backup_tasks.BACKUP_DIR", str(backup_dir)),
+            patch("ibex_install_utils.tasks.backup_tasks.ALL_INSTALL_DIRECTORIES", (str(src),)),
+            patch.object(BackupTasks, "_check_backup_space"),
+        ):
+            tasks._backup_dir(str(src), copy=True)
+        # The new version is installed over the old one
+        with open(src / "VERSION.txt", "r+") as f:
+            f.write("2.0.0")
+
+        assert (backup_dir / "EPICS" / "VERSION.txt").read_text() == "1.0.0"
+        assert verify_snapshot(str(backup_dir / "EPICS") + SNAPSHOT_MANIFEST_EXTENSION) == []
+
+    def test_WHEN_snapshot_file_changed_THEN_verify_reports_it(self, tmp_path):
+        src = _make_tree(tmp_path)
+        dst = tmp_path / "backup" / "EPICS"
+        snapshot_tree(FileUtils.build_manifest(str(src)), str(dst))
+
+        (dst / "VERSION.txt").write_text("2.0.0")
+
+        assert verify_snapshot(str(dst) + SNAPSHOT_MANIFEST_EXTENSION) == [
+            "VERSION.txt has changed since the snapshot"
+        ]
@@ -0,0 +1,40 @@
+import os
+
+from ibex_install_utils.parallel_zip import write_member_manifest
+from ibex_install_utils.tar_zst import extract_tar_zst, verify_tar_zst, write_tar_zst
+
+
+class TestTarZst:
+    def test_WHEN_writing_and_extracting_THEN_files_and_mtimes_round_trip(
+        self, tmp_path, members_of
+    ):
+        src = tmp_path / "Settings"
+        (src / "config").mkdir(parents=True)
+        (src / "config" / "blocks.xml").write_text("<blocks/>" * 1000)
+        (src / "VERSION.txt").write_text("1.0.0")
+        os.utime(src / "VERSION.txt", (1000000000, 1000000000))
+        archive = str(tmp_path / "Settings.tar.zst")
+
+        records = write_tar_zst(archive, members_of(src), workers=2)
+        write_member_manifest(archive + ".members.json.gz", records)
+
+        assert verify_tar_zst(archive, archive + ".members.json.gz") == []
+        assert extract_tar_zst(archive, str(tmp_path / "restored"), ["config/*"]) == 1
+        assert (tmp_path / "restored" / "config" / "blocks.xml").read_text() == "<blocks/>" * 1000
+        assert not (tmp_path / "restored" / "VERSION.txt").exists()
+        assert extract_tar_zst(archive, str(tmp_path / "restored")) == 2
+        assert (tmp_path / "restored" / "VERSION.txt").stat().st_mtime == 1000000000
+
+    def test_GIVEN_manifest_lists_other_files_WHEN_verifying_THEN_problems_reported(self, tmp_path):
+        (tmp_path / "VERSION.txt").write_text("1.0.0")
+        archive = str(tmp_path / "EPICS.tar.zst")
+        records = write_tar_zst(archive, [(str(tmp_path / "VERSION.txt"), "VERSION.txt", 5, 0)])
+        write_member_manifest(
+            archive + ".members.json.gz",
+            [records[0]._replace(crc=records[0].crc ^ 1), ("st.cmd", 1, 0)],
+        )
+
+        assert verify_tar_zst(archive, archive + ".members.json.gz") == [
+            "VERSION.txt does not match the manifest",
+            "st.cmd is missing",
+        ]
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+from ibex_install_utils.exceptions import ErrorInTask
+from ibex_install_utils.task_graph import TaskGraph
+
+
+class TestTaskGraph:
+    def test_WHEN_tasks_independent_THEN_run_at_same_time_before_dependent_task(self):
+        both_running = threading.Barrier(2, timeout=5)
+        ran = []
+        graph = TaskGraph(workers=4)
+        graph.add("server", lambda: (both_running.wait(), ran.append("server")))
+        graph.add("client", lambda: (both_running.wait(), ran.append("client")))
+        graph.add("hotfixes", lambda: ran.append("hotfixes"), after=["server", "client"])
+
+        graph.run()
+
+        assert sorted(ran[:2]) == ["client", "server"]
+        assert ran[2] == "hotfixes"
+
+    def test_GIVEN_one_worker_WHEN_run_THEN_tasks_run_in_order_added(self):
+        ran = []
+        graph = TaskGraph(workers=1)
+        graph.add("git", lambda: ran.append("git"))
+        for name in ["server", "client", "mysql"]:
+            graph.add(name, lambda name=name: ran.append(name), after=["git"])
+
+        graph.run()
+
+        assert ran == ["git", "server", "client", "mysql"]
+
+    def test_WHEN_task_aborted_THEN_running_tasks_finish_and_no_more_start(self):
+        ran = []
+
+        def _abort():
+            raise ErrorInTask("Task aborted")
+
+        graph = TaskGraph(workers=2)
+        graph.add("server", lambda: (time.sleep(0.2), ran.append("server")))
+        graph.add("client", _abort)
+        graph.add("mysql", lambda: ran.append("mysql"), after=["server"])
+
+        with pytest.raises(ErrorInTask):
+            graph.run()
+
+        assert ran == ["server"]
+
+    def test_WHEN_dependency_not_added_THEN_error(self):
+        with pytest.raises(ValueError):
+            TaskGraph().add("server", lambda: None, after=["backup"])
@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+from unittest.mock import Mock, patch
+
+from ibex_install_utils import task_profile
+from ibex_install_utils.run_process import RunProcess
+from ibex_install_utils.task import task
+
+
+class _Tasks:
+    def __init__(self, tmp_path):
+        self.prompt = Mock()
+        self.prompt.confirm_step.return_value = True
+        self.prompt.prompt.return_value = "R"
+        self.failures = 1
+        self.tmp_path = tmp_path
+
+    @task("Install server")
+    def install_server(self):
+        RunProcess(
+            str(self.tmp_path),
+            os.path.basename(sys.executable),
+            executable_directory=os.path.dirname(sys.executable),
+            prog_args=["-c", "pass"],
+        ).run()
+        if self.failures:
+            self.failures -= 1
+            raise IOError("file in use")
+
+
+class TestTaskProfile:
+    def test_GIVEN_task_retried_WHEN_trace_written_THEN_task_attempts_and_processes_spanned(
+        self, tmp_path, capsys
+    ):
+        with patch("ibex_install_utils.task_profile._profile", None):
+            task_profile.set_up()
+            _Tasks(tmp_path).install_server()
+            trace_path = task_profile.write_trace(str(tmp_path))
+            task_profile.print_summary()
+
+        with open(trace_path) as f:
+            events = json.load(f)["traceEvents"]
+        by_category = {}
+        for event in events:
+            by_category.setdefault(event["cat"], []).append(event)
+        (task_span,) = by_category["task"]
+        assert task_span["name"] == "Install server"
+        assert [e["args"]["outcome"] for e in by_category["attempt"]] == ["failed", "done"]
+        assert len(by_category["process"]) == 2
+        for event in by_category["attempt"] + by_category["process"]:
+            assert task_span["ts"] <= event["ts"]
+            assert event["ts"] + event["dur"] <= task_span["ts"] + task_span["dur"]
+        assert "Install server" in capsys.readouterr().out
@@ -0,0 +1,104 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from ibex_install_utils import task_state
+from ibex_install_utils.exceptions import ErrorInTask
+from ibex_install_utils.task import task
+
+
+class _Tasks:
+    def __init__(self, source_dir):
+        self.prompt = Mock()
+        self.prompt.confirm_step.return_value = True
+        self.prompt.prompt.return_value = "A"
+        self.source_dir = str(source_dir)
+        self.ran = []
+        self.fail_install = False
+
+    @task("Backup")
+    def backup(self):
+        self.ran.append("backup")
+
+    @task("Install", inputs=["source_dir"])
+    def install(self, component):
+        self.ran.append(f"install {component}")
+        if self.fail_install:
+            raise IOError("file in use")
+
+
+@pytest.fixture
+def source_dir(tmp_path):
+    (tmp_path / "kit").mkdir()
+    return tmp_path / "kit"
+
+
+@pytest.fixture
+def state_path(tmp_path):
+    with patch("ibex_install_utils.task_state._state", None):
+        yield str(tmp_path / "state" / "deploy_state.json")
+
+
+def _deploy(tasks):
+    tasks.backup()
+    tasks.install("server")
+    tasks.install("client")
+
+
+class TestTaskState:
+    def test_GIVEN_deploy_aborted_WHEN_resumed_THEN_only_unfinished_tasks_run(
+        self, source_dir, state_path
+    ):
+        tasks = _Tasks(source_dir)
+        tasks.fail_install = True
+        task_state.set_up({"version": "1"}, resume=False, path=state_path)
+        with pytest.raises(ErrorInTask):
+            _deploy(tasks)
+
+        tasks = _Tasks(source_dir)
+        task_state.set_up({"version": "1"}, resume=True, path=state_path)
+        _deploy(tasks)
+
+        assert tasks.ran == ["install server", "install client"]
+
+    def test_GIVEN_deploy_finished_tasks_WHEN_inputs_or_deployment_change_THEN_tasks_run_again(
+        self, source_dir, state_path
+    ):
+        task_state.set_up({"version": "1"}, resume=False, path=state_path)
+        _deploy(_Tasks(source_dir))
+
+        # Only the tasks with the kit as an input are run again
+        (source_dir / "new_file").write_text("rebuilt")
+        tasks = _Tasks(source_dir)
+        task_state.set_up({"version": "1"}, resume=True, path=state_path)
+        _deploy(tasks)
+        assert tasks.ran == ["install server", "install client"]
+
+        tasks = _Tasks(source_dir)
+        task_state.set_up({"version": "2"}, resume=True, path=state_path)
+        _deploy(tasks)
+        assert len(tasks.ran) == 3
+
+    def test_WHEN_deploy_not_resumed_or_cleared_THEN_finished_tasks_run_again(
+        self, source_dir, state_path
+    ):
+        task_state.set_up({"version": "1"}, resume=False, path=state_path)
+        _deploy(_Tasks(source_dir))
+        task_state.clear()
+
+        tasks = _Tasks(source_dir)
+        task_state.set_up({"version": "1"}, resume=True, path=state_path)
+        _deploy(tasks)
+
+        assert len(tasks.ran) == 3
+
+    def test_GIVEN_not_resuming_WHEN_task_run_THEN_inputs_only_fingerprinted_once_finished(
+        self, source_dir, state_path
+    ):
+        task_state.set_up({"version": "1"}, resume=False, path=state_path)
+        task_run = task_state.TaskRun("Install", "('server')", [str(source_dir)])
+
+        with patch("ibex_install_utils.task_state.fingerprint", return_value="abc") as fingerprint:
+            assert not task_run.already_finished()
+            fingerprint.assert_not_called()
+            task_run.finished()
+            fingerprint.assert_called_once()
@@ -0,0 +1,55 @@
+import os
+import stat
+from unittest.mock import patch
+
+from ibex_install_utils.tree_delete import delete_tree
+
+
+def _make_tree(tmp_path):
+    root = tmp_path / "EPICS"
+    for i in range(10):
+        directory = root / f"ioc_{i}" / "db"
+        directory.mkdir(parents=True)
+        (directory / "ioc.db").write_text("record")
+    (root / "read_only.txt").write_text("x")
+    os.chmod(root / "read_only.txt", stat.S_IREAD)
+    return root
+
+
+class TestTreeDelete:
+    def test_GIVEN_link_in_tree_WHEN_deleting_THEN_tree_deleted_but_not_link_target(self, tmp_path):
+        root = _make_tree(tmp_path)
+        target = tmp_path / "elsewhere"
+        target.mkdir()
+        (target / "keep.txt").write_text("keep")
+        os.symlink(target, root / "link", target_is_directory=True)
+
+        assert delete_tree(str(root)) == []
+
+        assert not root.exists()
+        assert (target / "keep.txt").exists()
+
+    def test_GIVEN_leave_top_WHEN_deleting_THEN_only_contents_deleted(self, tmp_path):
+        root = _make_tree(tmp_path)
+
+        assert delete_tree(str(root), leave_top=True) == []
+
+        assert root.exists() and os.listdir(root) == []
+
+    def test_GIVEN_file_locked_briefly_WHEN_deleting_THEN_only_that_file_retried(self, tmp_path):
+        root = _make_tree(tmp_path)
+        locked = str(root / "ioc_3" / "db" / "ioc.db")
+        attempts = []
+        real_remove = os.remove
+
+        def _remove(path):
+            attempts.append(path)
+            if path == locked and attempts.count(path) < 3:
+                raise PermissionError(13, "in use", path)
+            real_remove(path)
+
+        with patch("os.remove", _remove):
+            assert delete_tree(str(root), initial_delay=0) == []
+
+        assert not root.exists()
+        assert attempts.count(locked) == 3
@@ -0,0 +1,74 @@
+import os
+import shutil
+from unittest.mock import patch
+
+from ibex_install_utils.tree_walk import TreeStats, tree_stats, walk_parallel
+
+
+def _make_tree(tmp_path):
+    for i in range(20):
+        directory = tmp_path / "EPICS" / f"ioc_{i}" / "db"
+        directory.mkdir(parents=True)
+        (directory / "ioc.db").write_bytes(b"x" * i)
+    (tmp_path / "EPICS" / ".git").mkdir()
+    (tmp_path / "EPICS" / ".git" / "config").write_bytes(b"x" * 100)
+    (tmp_path / "EPICS" / "core.dmp").write_bytes(b"x" * 1000)
+    return tmp_path / "EPICS"
+
+
+class TestTreeWalk:
+    def test_WHEN_walking_THEN_every_directory_and_file_found(self, tmp_path):
+        root = _make_tree(tmp_path)
+
+        walked = {
+            directory: [entry.name for entry in files]
+            for directory, files in walk_parallel(str(root))
+        }
+
+        assert len(walked) == 1 + 20 * 2 + 1
+        assert sorted(walked[str(root)]) == ["core.dmp"]
+        assert walked[str(root / "ioc_3" / "db")] == ["ioc.db"]
+
+    def test_GIVEN_ignore_and_prune_WHEN_getting_stats_THEN_skipped_files_not_counted(
+        self, tmp_path
+    ):
+        root = _make_tree(tmp_path)
+
+        stats = tree_stats(
+            str(root),
+            ignore=shutil.ignore_patterns("*.dmp"),
+            prune=lambda entry: entry.name == ".git",
+        )
+
+        assert stats == TreeStats(size=sum(range(20)), files=20)
+
+    def test_GIVEN_unreadable_directory_WHEN_walking_THEN_it_is_reported_and_the_rest_walked(
+        self, tmp_path
+    ):
+        root = _make_tree(tmp_path)
+        unreadable = str(root / "ioc_3")
+        scandir = os.scandir
+
+        def _scandir(path):
+            if path == unreadable:
+                raise PermissionError(13, "Access is denied", path)
+            return scandir(path)
+
+        errors = []
+        with patch("os.scandir", _scandir):
+            stats = tree_stats(str(root), onerror=errors.append)
+
+        assert [e.filename for e in errors] == [unreadable]
+        assert stats == TreeStats(size=sum(range(20)) - 3 + 100 + 1000, files=20 + 1)
+
+    def test_GIVEN_links_WHEN_walking_THEN_linked_files_found_but_linked_directories_not_walked(
+        self, tmp_path
+    ):
+        root = _make_tree(tmp_path)
+        os.symlink(root / "ioc_1", root / "linked_ioc", target_is_directory=True)
+        os.symlink(root / "core.dmp", root / "linked.dmp")
+
+        walked = dict(walk_parallel(str(root)))
+
+        assert str(root / "linked_ioc") not in walked
+        assert sorted(entry.name for entry in walked[str(root)]) == ["core.dmp", "linked.dmp"]
@@ -1,9 +1,9 @@
 import os
 import re
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import pytest
-from ibex_install_utils.software_dependency import is_higher
+from ibex_install_utils.software_dependency import _list_files, _VersionCache, is_higher
 from ibex_install_utils.software_dependency.git import Git
 from ibex_install_utils.version_check import get_major_minor_patch, version_check
 
@@ -78,3 +78,31 @@ class TestVersionCheck:
 
         function(self)
         func_mock.assert_called_once()
+
+    def test_GIVEN_versions_read_in_earlier_run_WHEN_finding_latest_THEN_installers_not_read(
+        self, tmp_path
+    ):
+        installers = tmp_path / "installers"
+        installers.mkdir()
+        for name in MOCK_GIT_INSTALLERS:
+            (installers / name).write_text(name)
+        git = Git()
+        git.get_search_dir = Mock(return_value=str(installers))
+        git.get_version_of = Mock(side_effect=get_version_from_name)
+        cache_path = str(tmp_path / "versions.json")
+
+        with patch(
+            "ibex_install_utils.software_dependency._version_cache", _VersionCache(cache_path)
+        ):
+            first = git.find_latest()
+        assert git.get_version_of.call_count == len(git.find_available())
+
+        # A new run, with nothing remembered but the cache file
+        _list_files.cache_clear()
+        git.get_version_of.reset_mock()
+        with patch(
+            "ibex_install_utils.software_dependency._version_cache", _VersionCache(cache_path)
+        ):
+            assert git.find_latest() == first
+        git.get_version_of.assert_not_called()
+        assert first == (str(installers / "Git-2.3.2-1-bit.exe"), "2.3.2")
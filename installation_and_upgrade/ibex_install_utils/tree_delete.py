@@ -0,0 +1,146 @@
+"""
+Deleting directory trees with a pool of threads.
+
+The tree is walked with `tree_walk.walk_parallel`, files being deleted by the pool as each
+directory is listed, then the directories are removed deepest first. A file which can't be
+deleted, e.g. because antivirus or an indexer briefly has it open, is retried on its own with
+an exponentially increasing delay rather than starting the whole tree again. Read only files
+are made writable and deleted straight away. Links, including junctions, are removed without
+deleting what they point to.
+"""
+
+import functools
+import os
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from ibex_install_utils.tree_walk import WALK_WORKERS, is_link, walk_parallel
+
+DELETE_WORKERS = 8
+"""Default number of files to delete at once"""
+
+_BATCH_SIZE = 64
+"""Number of files in a directory deleted by one task, so small files don't each need a task"""
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except PermissionError:
+        # Read only files can't be deleted on Windows
+        os.chmod(path, stat.S_IWRITE)
+        os.remove(path)
+
+
+def _remove_entry(entry: os.DirEntry) -> None:
+    if not is_link(entry):
+        _remove_file(entry.path)
+    elif os.name == "nt" and entry.is_dir():
+        # A directory symbolic link or junction is removed like a directory on Windows
+        os.rmdir(entry.path)
+    else:
+        os.remove(entry.path)
+
+
+def _with_retries(
+    func: Callable[[], None], description: str, retries: int, initial_delay: float
+) -> str | None:
+    """Call func, retrying with exponential back off, returning what went wrong if it fails"""
+    delay = initial_delay
+    for attempt in range(retries):
+        try:
+            func()
+            return None
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            if attempt == retries - 1:
+                return f"Could not delete {description}: {e}"
+            time.sleep(delay)
+            delay *= 2
+
+
+def _remove_entries(
+    entries: list[os.DirEntry], retries: int, initial_delay: float
+) -> list[tuple[str, str]]:
+    failed = []
+    for entry in entries:
+        problem = _with_retries(
+            functools.partial(_remove_entry, entry), entry.path, retries, initial_delay
+        )
+        if problem:
+            failed.append((entry.path, problem))
+    return failed
+
+
+def delete_tree(
+    path: str,
+    leave_top: bool = False,
+    workers: int = DELETE_WORKERS,
+    retries: int = 8,
+    initial_delay: float = 0.1,
+) -> list[str]:
+    """
+    Delete a directory tree, or a file.
+
+    Args:
+        path: path to delete
+        leave_top: delete everything below the directory at `path` but leave the directory,
+         e.g. if it is a link to somewhere else
+        workers: number of files to delete at once
+        retries: attempts to delete each file or directory
+        initial_delay: seconds to wait before the first retry of a file or directory, doubled
+         for each retry after that
+    Returns:
+        Descriptions of what could not be deleted, empty if everything was
+    """
+    if not os.path.isdir(path):
+        problem = _with_retries(lambda: _remove_file(path), path, retries, initial_delay)
+        return [problem] if problem else []
+
+    problems = []
+    directories = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="delete") as pool:
+        futures = []
+        for directory, entries in walk_parallel(
+            path,
+            workers=WALK_WORKERS,
+            links=True,
+            onerror=lambda e: problems.append(f"Could not list {e.filename}: {e}"),
+        ):
+            directories.append(directory)
+            futures.extend(
+                pool.submit(_remove_entries, entries[i : i + _BATCH_SIZE], retries, initial_delay)
+                for i in range(0, len(entries), _BATCH_SIZE)
+            )
+
+        # Directories holding files which couldn't be deleted can't be removed either, so
+        # don't spend time retrying them
+        not_empty = set()
+        for future in futures:
+            for file_path, problem in future.result():
+                problems.append(problem)
+                parent = os.path.dirname(file_path)
+                while parent not in not_empty and len(parent) >= len(path):
+                    not_empty.add(parent)
+                    parent = os.path.dirname(parent)
+
+        # Deepest first, with the directories at each depth removed in parallel
+        if leave_top:
+            not_empty.add(path)
+        by_depth: dict[int, list[str]] = {}
+        for directory in directories:
+            if directory not in not_empty:
+                by_depth.setdefault(directory.count(os.sep), []).append(directory)
+        for depth in sorted(by_depth, reverse=True):
+            problems.extend(
+                problem
+                for problem in pool.map(
+                    lambda d: _with_retries(lambda: os.rmdir(d), d, retries, initial_delay),
+                    by_depth[depth],
+                )
+                if problem
+            )
+    return problems
@@ -0,0 +1,158 @@
+"""
+Walking directory trees with several threads listing directories at once.
+
+Listing a directory is mostly waiting on the disk or, for a share, the network, so listing
+many directories concurrently is much quicker for big trees. Each directory's files are
+yielded as soon as it has been listed, as `os.DirEntry`s whose stat results are already
+cached, so callers get sizes and mtimes without stat'ing each file again.
+
+Like `os.walk`, directories which can't be listed are skipped, and reported to an optional
+`onerror` callback, rather than stopping the walk.
+"""
+
+import os
+import stat
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, NamedTuple
+
+WALK_WORKERS = 8
+"""Default number of directories to list at once"""
+
+
+class TreeStats(NamedTuple):
+    """Totals for the files in a directory tree"""
+
+    size: int
+    """Total size of the files in bytes"""
+    files: int
+    """Number of files"""
+
+
+def is_link(entry: os.DirEntry) -> bool:
+    """
+    Whether an entry is a symbolic link or, on Windows, another reparse point such as a
+    directory junction or mount point
+    """
+    if entry.is_symlink():
+        return True
+    if os.name != "nt":
+        return False
+    # The attributes come from the directory listing, so this costs no extra system call
+    attributes = entry.stat(follow_symlinks=False).st_file_attributes
+    return bool(attributes & stat.FILE_ATTRIBUTE_REPARSE_POINT)
+
+
+class _ScannedDir(NamedTuple):
+    path: str
+    files: list[os.DirEntry]
+    subdirectories: list[str]
+    errors: list[OSError]
+    listed: bool
+
+
+def _scan_dir(
+    directory: str,
+    ignore: Callable[[str, list[str]], set[str]] | None,
+    prune: Callable[[os.DirEntry], bool] | None,
+    links: bool,
+) -> _ScannedDir:
+    try:
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except OSError as e:
+        return _ScannedDir(directory, [], [], [e], listed=False)
+    if ignore is not None:
+        ignored = ignore(directory, [entry.name for entry in entries])
+        entries = [entry for entry in entries if entry.name not in ignored]
+    files, subdirectories, errors = [], [], []
+    for entry in entries:
+        try:
+            if links and is_link(entry):
+                files.append(entry)
+            elif entry.is_dir():
+                # Links to directories and junctions are not descended into
+                if not is_link(entry) and (prune is None or not prune(entry)):
+                    subdirectories.append(entry.path)
+            elif entry.is_file():
+                # Cache the stat here, so that on Linux it is also done by the pool
+                entry.stat()
+                files.append(entry)
+        except OSError as e:
+            # e.g. removed since the directory was listed
+            errors.append(e)
+    return _ScannedDir(directory, files, subdirectories, errors, listed=True)
+
+
+def walk_parallel(
+    path: str,
+    ignore: Callable[[str, list[str]], set[str]] | None = None,
+    prune: Callable[[os.DirEntry], bool] | None = None,
+    workers: int = WALK_WORKERS,
+    links: bool = False,
+    onerror: Callable[[OSError], None] | None = None,
+) -> Iterator[tuple[str, list[os.DirEntry]]]:
+    """
+    Walk a directory tree, listing several directories at once.
+
+    Directories are yielded in no particular order. Links, including junctions, are never
+    followed.
+
+    Args:
+        path: directory at the top of the tree
+        ignore: optional callable like `shutil.ignore_patterns`; called once per directory
+         with the directory path and the names in it, returns the names to skip
+        prune: optional callable called with the entry of each subdirectory, returns whether
+         to skip it, e.g. to not descend into `.git` directories
+        workers: number of directories to list at once
+        links: whether to yield links (including links to directories and junctions) along
+         with the files, rather than skipping them
+        onerror: optional callable called, from the calling thread, with the error for each
+         directory which can't be listed or entry which can't be read; they are skipped
+    Returns:
+        An iterator of the path of each directory and the entries of the files in it
+    """
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="walk")
+    try:
+        pending: set[Future] = {pool.submit(_scan_dir, path, ignore, prune, links)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                scanned = future.result()
+                pending.update(
+                    pool.submit(_scan_dir, subdirectory, ignore, prune, links)
+                    for subdirectory in scanned.subdirectories
+                )
+                if onerror is not None:
+                    for error in scanned.errors:
+                        onerror(error)
+                if scanned.listed:
+                    yield scanned.path, scanned.files
+    finally:
+        # Stop promptly if the caller stops iterating early or onerror raises
+        pool.shutdown(cancel_futures=True)
+
+
+def tree_stats(
+    path: str,
+    ignore: Callable[[str, list[str]], set[str]] | None = None,
+    prune: Callable[[os.DirEntry], bool] | None = None,
+    workers: int = WALK_WORKERS,
+    onerror: Callable[[OSError], None] | None = None,
+) -> TreeStats:
+    """
+    Total size and number of files in a directory tree.
+
+    Args:
+        path: directory at the top of the tree
+        ignore: optional callable like `shutil.ignore_patterns`, see `walk_parallel`
+        prune: optional callable returning whether to skip a subdirectory, see `walk_parallel`
+        workers: number of directories to list at once
+        onerror: optional callable called with each error, see `walk_parallel`
+    Returns:
+        The total size and number of the files
+    """
+    size, number_of_files = 0, 0
+    for _, files in walk_parallel(path, ignore, prune, workers, onerror=onerror):
+        size += sum(entry.stat().st_size for entry in files)
+        number_of_files += len(files)
+    return TreeStats(size, number_of_files)
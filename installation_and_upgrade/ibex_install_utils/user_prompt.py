@@ -2,6 +2,8 @@
 Classes to interact with the user
 """
 
+import threading
+
 import six.moves
 
 from .exceptions import UserStop
@@ -15,6 +17,9 @@ class UserPrompt:
     # Sentinel value for allowing any answer to a prompt
     ANY = object()
 
+    # Held while asking a question, so tasks running at the same time ask one at a time
+    _lock = threading.RLock()
+
     def __init__(self, automatic, confirm_steps):
         """
         Initializer.
@@ -40,6 +45,12 @@ class UserPrompt:
         Returns: answer from possibles
 
         """
+        with UserPrompt._lock:
+            return self._prompt(
+                prompt_text, possibles, default, case_sensitive, show_automatic_answer
+            )
+
+    def _prompt(self, prompt_text, possibles, default, case_sensitive, show_automatic_answer):
         if self._automatic and default is not None:
             _answer = default if show_automatic_answer else "(hidden)"
             print(f"{prompt_text} : {_answer}")
@@ -70,7 +81,8 @@ class UserPrompt:
         """
         if not self._confirm_steps or self._automatic:
             return True
-        return self._get_user_answer(f"Do step '{step_text}'? : ", ("Y", "N")) == "Y"
+        with UserPrompt._lock:
+            return self._get_user_answer(f"Do step '{step_text}'? : ", ("Y", "N")) == "Y"
 
     def prompt_and_raise_if_not_yes(self, message, default="N"):
         """
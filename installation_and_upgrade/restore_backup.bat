@@ -0,0 +1,9 @@
+@ECHO OFF
+setlocal
+call "%~dp0install_or_update_uv.bat"
+call "%~dp0set_up_venv.bat"
+IF %errorlevel% neq 0 EXIT /b %errorlevel%
+call python -u "%~dp0restore_backup.py" %*
+set errcode=%errorlevel%
+call rmdir /s /q %UV_TEMP_VENV%
+endlocal & EXIT /b %errcode%
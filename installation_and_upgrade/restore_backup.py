@@ -0,0 +1,155 @@
+"""
+Script to restore an IBEX backup made by the backup tasks, from a zip file, a tar.zst file,
+a manifest of files in a backup store or a snapshot. Files are extracted by several threads at once
+and keep their modification times.
+
+Example, restoring just the configurations of a backup of the Settings directory:
+
+    python restore_backup.py C:\\data\\old\\ibex_backup_2024_01_01\\Settings.store.json.gz
+        C:\\Instrument\\Settings --include "config/*"
+
+A whole `ibex_backup_*` directory can be restored too, each backed up directory going into a
+directory of the same name in the destination. Patterns then start with that name, e.g.
+
+    python restore_backup.py C:\\data\\old\\ibex_backup_2024_01_01 C:\\restored
+        --include "Settings/config/**"
+"""
+
+import argparse
+import fnmatch
+import os
+import sys
+import time
+
+from ibex_install_utils.backup_store import (
+    STORE_MANIFEST_EXTENSION,
+    BackupStore,
+    store_for_manifest,
+)
+from ibex_install_utils.parallel_zip import ZIP_JOURNAL_EXTENSION, extract_zip
+from ibex_install_utils.snapshot import SNAPSHOT_MANIFEST_EXTENSION, restore_snapshot
+from ibex_install_utils.tar_zst import TAR_ZST_EXTENSION, extract_tar_zst
+
+BACKUP_EXTENSIONS = (
+    ".zip",
+    TAR_ZST_EXTENSION,
+    STORE_MANIFEST_EXTENSION,
+    SNAPSHOT_MANIFEST_EXTENSION,
+)
+
+
+def restore(
+    backup: str,
+    dst: str,
+    patterns: list[str] | None = None,
+    workers: int | None = None,
+    store: str | None = None,
+) -> int:
+    """
+    Restore a single backed up directory.
+
+    Args:
+        backup: path of the backup, a .zip or .tar.zst file, or a store or snapshot manifest
+        dst: directory to restore the backup into
+        patterns: optional glob patterns of paths within the backup, e.g. `config/*`,
+         only matching files are restored
+        workers: number of threads restoring files, None to use the number of CPUs
+        store: backup store holding the files of a store backup, None for the store
+         next to the backup's directory
+    Returns:
+        The number of files restored
+    """
+    print(f"Restoring {backup} to {dst} ...")
+    os.makedirs(dst, exist_ok=True)
+    if backup.endswith(".zip"):
+        if os.path.exists(backup + ZIP_JOURNAL_EXTENSION):
+            print(f"Warning: {backup} was not finished, restoring the files it has")
+        return extract_zip(backup, dst, patterns, workers)
+    if backup.endswith(TAR_ZST_EXTENSION):
+        return extract_tar_zst(backup, dst, patterns, workers)
+    if backup.endswith(SNAPSHOT_MANIFEST_EXTENSION):
+        return restore_snapshot(backup, dst, patterns, workers)
+
+    backup_store = BackupStore(store) if store else store_for_manifest(backup)
+    missing = backup_store.missing(backup)
+    if missing:
+        print(f"Error: {len(missing)} files of the backup are missing from '{backup_store.root}'")
+        sys.exit(1)
+    return backup_store.restore(backup, dst, patterns, workers)
+
+
+def _patterns_within(name: str, patterns: list[str] | None) -> list[str] | None:
+    """
+    Patterns of paths within the backup of directory `name`, from patterns of paths within
+    the whole ibex_backup directory.
+
+    Returns:
+        None to restore every file of the backup, an empty list to restore none of them
+    """
+    if not patterns:
+        return None
+    within = []
+    for pattern in patterns:
+        top, _, rest = pattern.partition("/")
+        if fnmatch.fnmatchcase(name, top):
+            if not rest or rest in ("*", "**"):
+                return None
+            within.append(rest)
+    return within
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Restore an IBEX backup")
+    parser.add_argument(
+        "backup",
+        help=f"Backup to restore, a .zip or {TAR_ZST_EXTENSION} file, a manifest ending "
+        f"{STORE_MANIFEST_EXTENSION} or {SNAPSHOT_MANIFEST_EXTENSION}, "
+        "or an ibex_backup_* directory",
+    )
+    parser.add_argument("destination", help="Directory to restore the backup into")
+    parser.add_argument(
+        "--include",
+        action="append",
+        default=None,
+        help="Only restore files whose path within the backup matches this glob pattern, "
+        "e.g. 'config/*', or 'Settings/config/*' for an ibex_backup_* directory. "
+        "May be given more than once.",
+    )
+    parser.add_argument(
+        "--store",
+        default=None,
+        help="Backup store holding the files of a backup made to a store "
+        "(default: the backup_store directory next to the backup's directory)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Number of files to restore at once"
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if os.path.isdir(args.backup):
+        restored = 0
+        for filename in sorted(os.listdir(args.backup)):
+            extension = next((e for e in BACKUP_EXTENSIONS if filename.endswith(e)), None)
+            if extension is None:
+                continue
+            name = filename[: -len(extension)]
+            patterns = _patterns_within(name, args.include)
+            if patterns != []:
+                restored += restore(
+                    os.path.join(args.backup, filename),
+                    os.path.join(args.destination, name),
+                    patterns,
+                    args.workers,
+                    args.store,
+                )
+    elif args.backup.endswith(BACKUP_EXTENSIONS):
+        restored = restore(args.backup, args.destination, args.include, args.workers, args.store)
+    else:
+        print(f"Error: Don't know how to restore '{args.backup}'")
+        sys.exit(2)
+    print(f"Restored {restored} files in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()